@@ -0,0 +1,8 @@
+# gunicorn.conf.py
+# Loaded by start.sh. With PROMETHEUS_MULTIPROC_DIR set, the prometheus_client files of a worker that exits have to be
+# marked dead so its live gauges stop counting towards /metrics.
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,27 +1,27 @@
-import asyncio
 import logging
-from typing import Dict, List
 
-import httpx
 from fastapi import FastAPI
 
-from modules.rest_modules.endpoints import chat, health, image, review
+from modules.rest_modules.endpoints import chat, health, image, images, metrics, review
+from modules.rest_modules.rest_utils.image_utils.image_executor import image_executor
+from modules.rest_modules.rest_utils.image_utils.image_http import ImageHttpClient
 from modules.vector_index.vector_implementations.VectorStoreImpl import VectorStoreImpl
+from modules.vector_index.vector_utils.product_index import ProductIndex
 
 logging.basicConfig(level=logging.INFO)
 app = FastAPI()
+app.middleware("http")(metrics.record_request_duration)
 
-session_store: Dict[str, List[Dict[str, str]]] = {}
-current_tasks: Dict[str, asyncio.Task] = {}
 tag = "fast_api_main"
 
 class MainResourceManager:
     def __init__(self):
         try:
             logging.info(f"{tag} / Initializing MainResourceManager...")
-            self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.llm = (
+            self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.models = (
                 VectorStoreImpl.initialize_embeddings_and_faiss()
             )
+            self.product_index = ProductIndex.from_dataframe(self.df)
             self.driver = None
             self.http_client = None
             self.initialize_http_client()
@@ -32,16 +32,18 @@ class MainResourceManager:
 
     def initialize_http_client(self):
         try:
-            self.http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+            # Shared by every image download of this worker; the connection pool opens on first use in the event loop
+            self.http_client = ImageHttpClient()
             logging.info(f"{tag} / HTTP client initialized successfully.")
         except Exception as e:
             logging.error(f"{tag} / Failed to initialize HTTP client: {e}")
 
     async def refresh_bedrock_embeddings(self):
         try:
-            self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.llm = (
+            self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.models = (
                 VectorStoreImpl.initialize_embeddings_and_faiss()
             )
+            self.product_index = ProductIndex.from_dataframe(self.df)
             logging.info(f"{tag} / Bedrock embeddings refreshed successfully.")
         except Exception as e:
             logging.error(f"{tag} / Failed to refresh Bedrock embeddings: {e}")
@@ -53,9 +55,6 @@ resource_manager = MainResourceManager()
 @app.on_event("startup")
 async def startup_event():
     try:
-        global session_store, current_tasks
-        session_store = {}
-        current_tasks = {}
         resource_manager.initialize_http_client()
         logging.info(f"{tag} / Startup complete.")
     except Exception as e:
@@ -68,6 +67,7 @@ async def shutdown_event():
         if resource_manager.driver:
             resource_manager.driver.quit()
         await resource_manager.http_client.aclose()
+        image_executor.shutdown()
         logging.info(f"{tag} / Shutdown complete.")
     except Exception as e:
         logging.error(f"{tag} / Error during shutdown: {e}")
@@ -75,8 +75,10 @@ async def shutdown_event():
 
 app.include_router(chat.router)
 app.include_router(image.router)
+app.include_router(images.router)
 app.include_router(review.router)
 app.include_router(health.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,4 +1,11 @@
 # globals.py
+import os
 
-session_store = {}
-current_tasks = {}
+from modules.session_store import create_session_store
+from modules.task_registry import create_task_registry
+
+# "memory" keeps sessions in each worker process, "redis" shares them through REDIS_URL across workers and replicas
+session_store = create_session_store(os.getenv("SESSION_STORE_BACKEND", "memory"))
+# Sessions shared across workers need their chat tasks serialized across workers too
+task_registry = create_task_registry(os.getenv("TASK_REGISTRY_BACKEND", os.getenv("SESSION_STORE_BACKEND", "memory")))
+current_tasks = task_registry.tasks
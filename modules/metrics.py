@@ -0,0 +1,84 @@
+# metrics.py
+# Metrics work in prometheus_client multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py),
+# so every gauge declares how values from the gunicorn workers are combined.
+from prometheus_client import Counter, Gauge, Histogram
+
+# From in-memory lookups (milliseconds) up to slow LLM generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce the response of each endpoint, labelled with the route template",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_STAGE_DURATION = Histogram(
+    "chat_stage_duration_seconds",
+    "Time spent in each traced stage of the chat pipeline",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+CHAT_TASKS_IN_FLIGHT = Gauge("chat_tasks_in_flight", "Chat pipeline tasks currently running", multiprocess_mode="livesum")
+CHAT_TASK_CANCELLATIONS = Counter(
+    "chat_task_cancellations_total",
+    "Chat tasks cancelled by a newer question for the same session, by where the cancelled task ran (local or remote worker)",
+    ["scope"],
+)
+CHAT_SESSIONS = Gauge("chat_sessions", "Chat sessions held in memory by the in-process session store", multiprocess_mode="livesum")
+SESSION_EVICTIONS = Counter(
+    "session_evictions_total", "Chat sessions dropped by the in-process session store, by reason (ttl or capacity)", ["reason"]
+)
+VECTOR_INDEX_DOCUMENTS = Gauge("vector_index_documents", "Documents in the FAISS product index", multiprocess_mode="max")
+RETRIEVAL_DEPTH = Histogram(
+    "retrieval_depth", "Catalog documents kept for the prompt per question by score-adaptive retrieval", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 12)
+)
+CATALOG_CONTEXT_TOKENS = Histogram(
+    "catalog_context_tokens",
+    "Estimated tokens of the <catalog> section of the answer prompt",
+    buckets=(50, 100, 200, 300, 400, 600, 800, 1200, 1600, 2400),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups by cache and result: hit, miss, error (Redis unavailable), corrupt (entry could not be decoded), "
+    "or modified / not_modified for image revalidations",
+    ["cache", "result"],
+)
+IMAGE_FETCHES = Counter("image_fetches_total", "CDN image requests by outcome (HTTP status, retry or error)", ["outcome"])
+SELENIUM_SESSIONS = Counter("selenium_sessions_total", "Selenium browser sessions started for reviews, by outcome", ["outcome"])
+SELENIUM_SESSIONS_ACTIVE = Gauge("selenium_sessions_active", "Selenium browser sessions currently open", multiprocess_mode="livesum")
+
+COALESCED_CHAT_REQUESTS = Counter(
+    "chat_coalesced_requests_total",
+    "Chat requests answered by joining an identical in-flight pipeline execution instead of running their own",
+)
+CHAT_FAST_PATH_REQUESTS = Counter(
+    "chat_fast_path_requests_total",
+    "Chat requests for product codes answered from the catalog without calling Bedrock",
+)
+CANCELLED_PIPELINE_STAGES = Counter(
+    "chat_cancelled_pipeline_stages_total",
+    "Superseded chat pipelines stopped before running the labelled stage; bedrock_* stages are model calls avoided",
+    ["stage"],
+)
+
+BEDROCK_CALLS = Counter("bedrock_calls_total", "Bedrock model invocations by model and outcome", ["model", "outcome"])
+BEDROCK_CALL_DURATION = Histogram(
+    "bedrock_call_duration_seconds", "Latency of Bedrock model invocations", ["model"], buckets=LATENCY_BUCKETS
+)
+BEDROCK_TOKENS = Counter("bedrock_tokens_total", "Tokens reported by Bedrock, by model and direction (input or output)", ["model", "direction"])
+MODEL_ROUTE_DURATION = Histogram(
+    "model_route_duration_seconds", "Latency of LLM calls per pipeline route and model", ["route", "model"], buckets=LATENCY_BUCKETS
+)
+MODEL_ROUTE_TOKENS = Counter(
+    "model_route_tokens_total", "Tokens used per pipeline route and model, by direction (input or output)", ["route", "model", "direction"]
+)
+BEDROCK_CONCURRENCY_LIMIT = Gauge(
+    "bedrock_concurrency_limit", "Current AIMD concurrency window for Bedrock calls", multiprocess_mode="liveall"
+)
+BEDROCK_IN_FLIGHT = Gauge("bedrock_in_flight_requests", "Bedrock calls currently holding a concurrency slot", multiprocess_mode="livesum")
+BEDROCK_THROTTLES = Counter("bedrock_throttles_total", "Bedrock calls rejected by the service with a throttling error")
+BEDROCK_ADMISSION_REJECTIONS = Counter(
+    "bedrock_admission_rejections_total",
+    "Bedrock calls failed fast by the client-side admission controller",
+    ["reason"],
+)
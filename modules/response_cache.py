@@ -0,0 +1,120 @@
+# response_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+import redis
+
+from modules.metrics import CACHE_LOOKUPS
+
+tag = "response_cache"
+
+# Seconds each kind of entry is kept; answers go stale sooner than retrieval results since prompts and models change
+DEFAULT_TTLS = {
+    "answer": int(os.getenv("RESPONSE_CACHE_ANSWER_TTL", "3600")),
+    "retrieval": int(os.getenv("RESPONSE_CACHE_RETRIEVAL_TTL", "86400")),
+}
+
+
+def encode(value):
+    """Compact JSON, zlib compressed; plain data only, so nothing read back from the shared Redis can run code."""
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 6)
+
+
+def decode(data):
+    return json.loads(zlib.decompress(data))
+
+
+def index_version(vectorstore_faiss_doc):
+    """Fingerprint of the FAISS index; every process loading the same index file gets the same one."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(vectorstore_faiss_doc.index.ntotal).encode())
+    for position in sorted(vectorstore_faiss_doc.index_to_docstore_id):
+        digest.update(str(vectorstore_faiss_doc.index_to_docstore_id[position]).encode())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Chat answers and retrieval results in Redis, shared by every gunicorn worker and replica.
+
+    Keys are namespaced by the index version, so entries computed against an older catalog are never served after a
+    reindex and simply expire. Redis errors never fail a request: lookups count as errors and the cache stays off for
+    retry_after seconds so an unreachable Redis does not add a timeout to every call.
+    """
+
+    def __init__(self, client=None, prefix="grainger", ttls=None, enabled=True, retry_after=30.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.enabled = enabled
+        self.retry_after = retry_after
+        self.version = None
+        self._disabled_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        client = redis.Redis.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            socket_timeout=float(os.getenv("RESPONSE_CACHE_TIMEOUT_SECONDS", "0.1")),
+            socket_connect_timeout=float(os.getenv("RESPONSE_CACHE_TIMEOUT_SECONDS", "0.1")),
+        )
+        return cls(
+            client,
+            prefix=os.getenv("RESPONSE_CACHE_PREFIX", "grainger"),
+            enabled=os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true",
+        )
+
+    def set_index_version(self, version):
+        self.version = version
+        logging.info(f"{tag}/ Caching under index version {version}")
+
+    def key(self, kind, parts):
+        digest = hashlib.blake2b(json.dumps(parts, separators=(",", ":")).encode(), digest_size=16).hexdigest()
+        return f"{self.prefix}:{self.version}:{kind}:{digest}"
+
+    def _available(self):
+        # Without an index version there is no safe namespace, e.g. for an index built outside the resource managers
+        return self.enabled and self.client is not None and self.version is not None and time.time() >= self._disabled_until
+
+    def _backoff(self, e):
+        with self._lock:
+            self._disabled_until = time.time() + self.retry_after
+        logging.warning(f"{tag}/ Redis unavailable, bypassing the cache for {self.retry_after}s: {e}")
+
+    def get(self, kind, parts):
+        if not self._available():
+            return None
+        try:
+            data = self.client.get(self.key(kind, parts))
+        except redis.RedisError as e:
+            CACHE_LOOKUPS.labels(cache=kind, result="error").inc()
+            self._backoff(e)
+            return None
+        if data is None:
+            CACHE_LOOKUPS.labels(cache=kind, result="miss").inc()
+            return None
+        try:
+            value = decode(data)
+        except (zlib.error, ValueError) as e:
+            # A corrupt or old-format entry is a miss; the answer computed next overwrites it
+            CACHE_LOOKUPS.labels(cache=kind, result="corrupt").inc()
+            logging.warning(f"{tag}/ Ignoring undecodable {kind} cache entry: {e}")
+            return None
+        CACHE_LOOKUPS.labels(cache=kind, result="hit").inc()
+        return value
+
+    def set(self, kind, parts, value):
+        if not self._available():
+            return
+        try:
+            self.client.set(self.key(kind, parts), encode(value), ex=self.ttls[kind])
+        except redis.RedisError as e:
+            self._backoff(e)
+
+
+response_cache = ResponseCache.from_env()
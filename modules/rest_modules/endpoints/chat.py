@@ -2,15 +2,26 @@ import asyncio
 import logging
 import traceback
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 
-from modules.globals import current_tasks, session_store
+from modules.globals import session_store, task_registry
+from modules.metrics import CHAT_FAST_PATH_REQUESTS, COALESCED_CHAT_REQUESTS
+from modules.response_cache import response_cache
 from modules.rest_modules.models import ChatRequest
 from modules.rest_modules.rest_utils.resource_manager import ResourceManager
-from modules.vector_index.vector_utils.chat_processor import process_chat_question_with_customer_attribute_identifier
+from modules.rest_modules.rest_utils.single_flight import SingleFlight, normalize_question
+from modules.task_registry import TaskSuperseded
+from modules.tracing import finish_trace, span, start_trace
+from modules.vector_index.vector_utils.bedrock_limiter import BedrockCapacityError
+from modules.vector_index.vector_utils.cancellation import CancellationToken, current_cancellation
+from modules.vector_index.vector_utils.chat_history import ChatHistoryManager
+from modules.vector_index.vector_utils.chat_processor import OUTPUT_MODE, process_chat_question_with_customer_attribute_identifier
+from modules.vector_index.vector_utils.code_lookup import answer_code_lookup
 
 router = APIRouter()
 tag = "chat"
+chat_history_manager = ChatHistoryManager(session_store)
+chat_pipeline_flights = SingleFlight(on_coalesced=COALESCED_CHAT_REQUESTS.inc)
 
 async def get_resource_manager():
     from modules.fast_api_main import resource_manager
@@ -19,43 +30,52 @@ async def get_resource_manager():
 resource_manager_dependency = Depends(get_resource_manager)
 
 @router.post("/ask_question")
-async def ask_question(chat_request: ChatRequest, request: Request, resource_manager_param: ResourceManager = resource_manager_dependency):
+async def ask_question(
+    chat_request: ChatRequest,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    resource_manager_param: ResourceManager = resource_manager_dependency,
+):
+    session_id = request.headers.get("session-id")
+    # Started before the pipeline task is created so the task, and the worker threads it uses, record into this trace
+    trace = start_trace("ask_question", request_id=request.headers.get("x-request-id"), session_id=session_id)
     try:
-        session_id = request.headers.get("session-id")
         if not session_id:
             raise HTTPException(status_code=400, detail="Session ID is required")
 
-        if session_id not in session_store:
-            session_store[session_id] = []
+        if await asyncio.to_thread(session_store.ensure, session_id):
             logging.info(f"{tag}/ Adding new session ID {session_id} to session_store")
 
         logging.info(f"{tag}/ Received question: {chat_request.question} with session_id: {session_id}")
 
-        if session_id in current_tasks and not current_tasks[session_id].done():
-            logging.info(f"{tag}/ Cancelling task for session ID: {session_id} due to new question.")
-            current_tasks[session_id].cancel()
-            await current_tasks[session_id]
-
-        task = asyncio.create_task(process_question_task(chat_request, session_id, resource_manager_param))
-        current_tasks[session_id] = task
-
-        response = await task
-
+        # Cancels a task still running for this session on any worker and starts once it has stopped
+        try:
+            response = await task_registry.run(
+                session_id, process_question_task, chat_request, session_id, resource_manager_param, background_tasks
+            )
+        except TaskSuperseded:
+            logging.info(f"{tag}/ Question for session_id {session_id} superseded by a newer one before it started.")
+            response = {"message": "Task cancelled due to new question", "products": []}
+
+        if chat_request.include_timings:
+            response = {**response, "timings": trace.timings(), "stats": dict(trace.attributes)}
         return response
 
     except Exception as e:
         logging.error(f"Error in {tag}/ask_question: {str(e)}")
         logging.error(traceback.format_exc())
         if isinstance(e, HTTPException):
-            raise HTTPException(status_code=e.status_code, detail=f"{e.detail}") from e
+            raise HTTPException(status_code=e.status_code, detail=f"{e.detail}", headers=e.headers) from e
         else:
             raise e
+    finally:
+        finish_trace(trace)
 
 
-async def process_question_task(chat_request, session_id, resource_manager_param):
+async def process_question_task(chat_request, session_id, resource_manager_param, background_tasks=None):
     try:
         message, response_json, customer_attributes_retrieved, time_to_get_attributes = await process_chat_question(
-            chat_request.question, chat_request.clear_history, session_id, resource_manager_param
+            chat_request.question, chat_request.clear_history, session_id, resource_manager_param, background_tasks
         )
 
         if response_json is None:
@@ -65,8 +85,6 @@ async def process_question_task(chat_request, session_id, resource_manager_param
         products = response_json.get("products", [])
         logging.info(f"{tag}/ Products retrieved: {products}")
 
-        session_store[session_id].append({"user": chat_request.question, "assistant": response_json})
-
         return {
             "message": message,
             "customer_attributes_retrieved": customer_attributes_retrieved,
@@ -76,32 +94,70 @@ async def process_question_task(chat_request, session_id, resource_manager_param
     except asyncio.CancelledError:
         logging.info(f"{tag}/ Task for session_id {session_id} was cancelled due to new question.")
         return {"message": "Task cancelled due to new question", "products": []}
+    except BedrockCapacityError as e:
+        logging.warning(f"{tag}/ Shedding request for session_id {session_id}: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"}) from e
     except Exception as e:
         logging.error(f"Error in {tag}/process_question_task: {str(e)}")
         logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
 
-async def process_chat_question(question, clear_history, session_id, resource_manager_param):
+async def process_chat_question(question, clear_history, session_id, resource_manager_param, background_tasks=None):
     try:
-        if clear_history:
-            logging.info(f"{tag}/ Clearing chat history for session_id: {session_id}")
-            session_store[session_id] = []
+        with span("session_lookup"):
+            if clear_history:
+                logging.info(f"{tag}/ Clearing chat history for session_id: {session_id}")
+                await chat_history_manager.clear(session_id)
 
-        chat_history = session_store.get(session_id, [])
+            chat_history, history_summary = await chat_history_manager.get_history(session_id)
         # logging.info(f"{tag}/ Current chat history for session_id {session_id}: {chat_history}")
 
         logging.info(f"{tag}/ Processing question: {question}")
-        message, response_json, customer_attributes_retrieved, time_to_get_attributes = process_chat_question_with_customer_attribute_identifier(
-            question, resource_manager_param.vectorstore_faiss_doc, resource_manager_param.exact_match_map, resource_manager_param.llm, chat_history
+        # Pure product-code lookups are answered from the catalog, skipping attribute extraction and generation
+        with span("catalog_lookup"):
+            result = answer_code_lookup(question, resource_manager_param.product_index)
+        if result is not None:
+            CHAT_FAST_PATH_REQUESTS.inc()
+            message, response_json, customer_attributes_retrieved, time_to_get_attributes = result
+            await record_turn(
+                session_id, question, message, customer_attributes_retrieved, response_json, resource_manager_param, background_tasks
+            )
+            return message, response_json, customer_attributes_retrieved, time_to_get_attributes
+
+        pipeline_args = (
+            question,
+            resource_manager_param.vectorstore_faiss_doc,
+            resource_manager_param.exact_match_map,
+            resource_manager_param.models,
+            chat_history,
+            history_summary,
+            resource_manager_param.product_index,
         )
+        if not chat_history and not history_summary:
+            # Without history the answer depends only on the question, so it is cached across workers and replicas and
+            # identical concurrent questions share one execution
+            cache_key = answer_cache_key(question, resource_manager_param.models)
+            with span("answer_cache"):
+                cached = await asyncio.to_thread(response_cache.get, "answer", cache_key)
+            if cached is not None:
+                message, response_json, customer_attributes_retrieved, _ = cached
+                result = (message, response_json, customer_attributes_retrieved, 0.0)
+            else:
+                result = await chat_pipeline_flights.do(normalize_question(question), run_chat_pipeline, *pipeline_args)
+                if result[1] is not None:
+                    await asyncio.to_thread(response_cache.set, "answer", cache_key, list(result))
+        else:
+            result = await run_chat_pipeline(*pipeline_args)
+        message, response_json, customer_attributes_retrieved, time_to_get_attributes = result
 
         if response_json is None:
             logging.error(f"{tag}/ No response JSON returned")
             raise HTTPException(status_code=500, detail=f"{tag}/ No response JSON returned")
 
-        chat_history.append({"user": question, "assistant": message, "customer_attributes": customer_attributes_retrieved})
-        session_store[session_id] = chat_history
+        await record_turn(
+            session_id, question, message, customer_attributes_retrieved, response_json, resource_manager_param, background_tasks
+        )
 
         return message, response_json, customer_attributes_retrieved, time_to_get_attributes
     except Exception as e:
@@ -109,3 +165,30 @@ async def process_chat_question(question, clear_history, session_id, resource_ma
         logging.error(traceback.format_exc())
         raise
 
+
+async def record_turn(session_id, question, message, customer_attributes_retrieved, response_json, resource_manager_param, background_tasks):
+    with span("history_write"):
+        turn_count = await chat_history_manager.record_turn(
+            session_id, question, message, customer_attributes_retrieved, response_json.get("products", [])
+        )
+    # Fold older turns into the rolling summary after the response has been sent
+    if background_tasks is not None and chat_history_manager.needs_summary(turn_count):
+        background_tasks.add_task(chat_history_manager.summarize, session_id, resource_manager_param.models.llm("summary"))
+
+
+def answer_cache_key(question, models):
+    """Everything besides the catalog (which namespaces the cache) that a history-free answer depends on."""
+    routes = getattr(models, "routes", {})
+    return [normalize_question(question), OUTPUT_MODE, *sorted(f"{name}={route.model_id}" for name, route in routes.items())]
+
+
+async def run_chat_pipeline(*pipeline_args):
+    # Cancelling this coroutine cannot stop the worker thread, so the thread is told through a token it checks
+    # between stages and before every Bedrock call
+    cancellation = CancellationToken()
+    current_cancellation.set(cancellation)
+    try:
+        return await asyncio.to_thread(process_chat_question_with_customer_attribute_identifier, *pipeline_args)
+    except asyncio.CancelledError:
+        cancellation.cancel()
+        raise
@@ -1,12 +1,11 @@
-import base64
-import io
 import logging
 import traceback
 
 from fastapi import APIRouter, Depends, HTTPException, Request
-from PIL import Image
 
 from modules.rest_modules.rest_utils.image_utils.grainger_image_util import get_images
+from modules.rest_modules.rest_utils.image_utils.image_executor import image_executor
+from modules.rest_modules.rest_utils.image_utils.image_processing import to_png_base64
 from modules.rest_modules.rest_utils.resource_manager import ResourceManager
 
 router = APIRouter()
@@ -28,19 +27,20 @@ async def fetch_images(request: Request, resource_manager_param: ResourceManager
         products = await request.json()
         recommendations_list = [f"{product['product']}, {product['code']}" for product in products]
         logging.info(f"{tag}/ Fetching images for products: {recommendations_list}")
-        image_data, total_image_time = await get_images(recommendations_list, resource_manager_param.df)
-
+        image_data, total_image_time = await get_images(
+            recommendations_list, resource_manager_param.product_index, resource_manager_param.http_client
+        )
+
+        images_found = [image_info for image_info in image_data if isinstance(image_info, dict)]
+        encoded_images = await image_executor.map(
+            to_png_base64, [(image_info["Image Data"],) for image_info in images_found], return_exceptions=True
+        )
         image_responses = []
-        for image_info in image_data:
-            try:
-                img = Image.open(io.BytesIO(image_info["Image Data"]))
-                img_byte_arr = io.BytesIO()
-                img.save(img_byte_arr, format="PNG")
-                img_byte_arr = img_byte_arr.getvalue()
-                encoded_image = base64.b64encode(img_byte_arr).decode("utf-8")
-                image_responses.append({"code": image_info["Code"], "image_data": encoded_image})
-            except Exception as e:
-                logging.error(f"Error processing image: {e}")
+        for image_info, encoded_image in zip(images_found, encoded_images, strict=True):
+            if isinstance(encoded_image, Exception):
+                logging.error(f"Error processing image: {encoded_image}")
+                continue
+            image_responses.append({"code": image_info["Code"], "image_data": encoded_image})
         return image_responses
     except Exception as e:
         logging.error(f"Error fetching images: {e}")
@@ -0,0 +1,161 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import traceback
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from modules.rest_modules.models import ProductRequest
+from modules.rest_modules.rest_utils.image_utils.grainger_image_util import generate_grainger_sprite, load_image, stream_images
+from modules.rest_modules.rest_utils.image_utils.image_cache import THUMBNAIL_SIZES, image_cache
+
+# Image bytes over plain HTTP caching, so clients neither receive base64 inside JSON nor download an image twice
+router = APIRouter()
+tag = "images.py"
+
+# Upper bound for the whole /images/stream response; clients may ask for less with ?deadline=
+STREAM_DEADLINE_SECONDS = float(os.getenv("IMAGE_STREAM_DEADLINE_SECONDS", "10"))
+
+
+async def get_resource_manager():
+    from modules.fast_api_main import resource_manager
+
+    return resource_manager
+
+
+resource_manager_dependency = Depends(get_resource_manager)
+
+
+def negotiate_format(accept):
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def validate_size(size):
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+
+
+@router.get("/images/{code}")
+async def get_image(code: str, request: Request, size: int | None = None, resource_manager_param=resource_manager_dependency):
+    """Image bytes of one product: the CDN original, or a thumbnail of `size` px as WebP when the client accepts it and
+    JPEG otherwise. Responses carry an ETag and Cache-Control, so browsers and proxies revalidate with a 304."""
+    try:
+        validate_size(size)
+        product = resource_manager_param.product_index.get(code)
+        if product is None or not product["image_url"]:
+            raise HTTPException(status_code=404, detail=f"No image for product {code}")
+
+        image_format = negotiate_format(request.headers.get("accept")) if size is not None else "jpeg"
+        entry = await load_image(
+            resource_manager_param.http_client, product["code"], product["image_url"], size, image_format, image_cache
+        )
+        if entry is None:
+            raise HTTPException(status_code=502, detail=f"Failed to fetch image for product {code}")
+
+        etag = f'"{entry["digest"]}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={image_cache.max_age}", "Vary": "Accept"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["data"], media_type=entry.get("content_type") or "image/jpeg", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"{tag}/ Error fetching image for {code}: {e}")
+        logging.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Error fetching image") from e
+
+
+@router.post("/images/manifest")
+async def image_manifest(
+    products: list[ProductRequest], request: Request, size: int | None = None, resource_manager_param=resource_manager_dependency
+):
+    """URLs of the /images/{code} endpoint for a list of products, in place of the image data itself."""
+    validate_size(size)
+    images, missing = [], []
+    for product in products:
+        details = resource_manager_param.product_index.get(product.code)
+        if details is None or not details["image_url"]:
+            missing.append(product.code)
+            continue
+        if any(image["code"] == details["code"] for image in images):
+            continue
+        url = request.url_for("get_image", code=details["code"])
+        images.append(
+            {"code": details["code"], "name": details["name"], "url": str(url.include_query_params(size=size) if size else url)}
+        )
+    return {"images": images, "missing": missing}
+
+
+def encode_stream_item(item, server_sent_events):
+    if server_sent_events:
+        return f"event: {item['type']}\ndata: {json.dumps(item)}\n\n"
+    return json.dumps(item) + "\n"
+
+
+@router.post("/images/stream")
+async def image_stream(
+    products: list[ProductRequest],
+    request: Request,
+    size: int | None = None,
+    deadline: float | None = None,
+    resource_manager_param=resource_manager_dependency,
+):
+    """The images of a list of products, each streamed as soon as it is loaded: NDJSON, or server-sent events when the
+    client accepts text/event-stream. Items are typed "image" or "error", and a final "done" item closes the stream."""
+    validate_size(size)
+    deadline = STREAM_DEADLINE_SECONDS if deadline is None or deadline <= 0 else min(deadline, STREAM_DEADLINE_SECONDS)
+    codes = [product.code for product in products]
+    logging.info(f"{tag}/ Streaming images for codes: {codes}")
+    image_format = negotiate_format(request.headers.get("accept")) if size is not None else "jpeg"
+    server_sent_events = "text/event-stream" in request.headers.get("accept", "")
+
+    async def body():
+        async for item in stream_images(
+            codes, resource_manager_param.product_index, resource_manager_param.http_client, deadline, size, image_format, image_cache
+        ):
+            yield encode_stream_item(item, server_sent_events)
+
+    media_type = "text/event-stream" if server_sent_events else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.post("/images/sprite")
+async def image_sprite(products: list[ProductRequest], size: int = 200, resource_manager_param=resource_manager_dependency):
+    """The labeled thumbnails of a list of products composited into one JPEG strip, with the box of each product in
+    it, so a client decodes a single image: {"image_data" (base64), "content_type", "width", "height", "tiles",
+    "missing"}."""
+    validate_size(size)
+    found, missing = [], []
+    for product in products:
+        details = resource_manager_param.product_index.get(product.code)
+        if details is None or not details["image_url"]:
+            missing.append(product.code)
+        elif all(other["code"] != details["code"] for other in found):
+            found.append(details)
+
+    entries = await asyncio.gather(
+        *(load_image(resource_manager_param.http_client, details["code"], details["image_url"], cache=image_cache) for details in found)
+    )
+    images = []
+    for details, entry in zip(found, entries, strict=True):
+        if entry is None:
+            missing.append(details["code"])
+        else:
+            images.append({"Code": details["code"], "Image Data": entry["data"]})
+
+    sprite = await generate_grainger_sprite(images, resource_manager_param.product_index, size)
+    return {
+        "image_data": base64.b64encode(sprite.pop("sprite")).decode("utf-8"),
+        **sprite,
+        "missing": missing,
+    }
@@ -0,0 +1,38 @@
+import os
+import time
+
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+
+from modules.metrics import HTTP_REQUEST_DURATION
+
+router = APIRouter()
+tag = "metrics"
+
+
+@router.get("/metrics")
+async def metrics():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Under gunicorn each worker writes its samples to the shared directory; aggregate all of them, not only ours
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+async def record_request_duration(request: Request, call_next):
+    """HTTP middleware observing the latency of every request, labelled with the route template rather than the raw
+    path so path parameters do not create a time series each."""
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUEST_DURATION.labels(method=request.method, endpoint=endpoint, status=str(status)).observe(
+            time.perf_counter() - start_time
+        )
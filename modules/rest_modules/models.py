@@ -4,3 +4,11 @@ from pydantic import BaseModel
 class ChatRequest(BaseModel):
     question: str
     clear_history: bool = False
+    include_timings: bool = False
+
+
+class ProductRequest(BaseModel):
+    """One product of the lists the image endpoints take, as the UI sends them."""
+
+    code: str
+    product: str = ""
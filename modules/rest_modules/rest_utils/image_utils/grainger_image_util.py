@@ -1,103 +1,217 @@
 import asyncio
 import base64
-import io
 import logging
 import time
+from concurrent.futures.process import BrokenProcessPool
 
 import aiohttp
-from PIL import Image, ImageDraw, ImageFont
+
+from modules.metrics import CACHE_LOOKUPS
+from modules.rest_modules.rest_utils.image_utils.image_cache import (
+    THUMBNAIL_SIZES,
+    content_digest,
+    image_cache,
+    thumbnail_variant,
+)
+from modules.rest_modules.rest_utils.image_utils.image_executor import image_executor
+from modules.rest_modules.rest_utils.image_utils.image_processing import (
+    IMAGE_FORMATS,
+    composite_sprite,
+    make_thumbnail,
+    render_labeled_thumbnail,
+    render_thumbnails,
+)
 
 tag = "grainger_image_util"
 
 
-async def get_images(recommendations_list, df):
+async def get_images(recommendations_list, product_index, http_client):
     image_tasks = []
     total_image_time = 0.0
 
-    async with aiohttp.ClientSession() as session:
-        checked = []
-        for item in recommendations_list:
-            parts = item.split(", ")
-            code = parts[-1]
-            logging.info(f"{tag} item.part[-1]: {parts[-1]} item.part[0]: {parts[0]}")
-            if code in df["Code"].values:
-                if code not in checked:
-                    start_time = time.time()
-                    image_url = df.loc[df["Code"] == code, "PictureUrl600"].iloc[0]
-                    end_time = time.time()
-                    total_image_time += end_time - start_time
-                    print(f"Fetched image URL {image_url} for {code} in {end_time - start_time:.2f} seconds")
-
-                    # Add image fetching task
-                    image_tasks.append(fetch_image(session, code, image_url))
-                    checked.append(code)
-            else:
-                print(f"Code {code} not found in the dataframe.")
-
-        # Gather all image tasks concurrently
-        image_results = await asyncio.gather(*image_tasks)
+    checked = set()
+    for item in recommendations_list:
+        code = item.split(", ")[-1]
+        start_time = time.time()
+        product = product_index.get(code)
+        total_image_time += time.time() - start_time
+        if product is None or not product["image_url"]:
+            logging.info(f"{tag}/ No image URL for code {code} in the catalog.")
+            continue
+        if product["code"] not in checked:
+            # Add image fetching task
+            image_tasks.append(fetch_image(http_client, product["code"], product["image_url"]))
+            checked.add(product["code"])
+
+    # Gather all image tasks concurrently
+    image_results = await asyncio.gather(*image_tasks)
     return image_results, total_image_time
 
 
-async def fetch_image(session, code, image_url):
-    async with session.get(image_url) as response:
-        if response.status == 200:
-            img_data = await response.read()  # Read the image data
+async def fetch_image(http_client, code, image_url, cache=image_cache):
+    """The image from the cache while fresh, otherwise from the CDN, revalidating a stale copy with its validators."""
+    cached = await asyncio.to_thread(cache.get, image_url)
+    if cached is not None and cache.is_fresh(cached):
+        return {"Code": code, "Image Data": cached["data"]}
+
+    try:
+        status, headers, img_data = await http_client.fetch(image_url, headers=cache.validators(cached))
+        if status == 304 and cached is not None:
+            CACHE_LOOKUPS.labels(cache="image_revalidation", result="not_modified").inc()
+            await asyncio.to_thread(cache.touch, image_url, cached)
+            return {"Code": code, "Image Data": cached["data"]}
+        if status == 200:
+            if cached is not None:
+                CACHE_LOOKUPS.labels(cache="image_revalidation", result="modified").inc()
+            thumbnails = await make_thumbnails(image_url, img_data)
+            await asyncio.to_thread(store_image, cache, image_url, img_data, headers, thumbnails)
             return {"Code": code, "Image Data": img_data}
-        else:
-            return f"Failed to fetch image for {code}: {image_url}"
-
-
-async def generate_single_grainger_thumbnail(image_data):
-    img = Image.open(io.BytesIO(image_data))
-    img.thumbnail((200, 200))
-
-    draw = ImageDraw.Draw(img)
-    text = f"{image_data['Code']}: {image_data['Code']} Name Placeholder"  # Adjust based on actual data structure
-    font = ImageFont.load_default()
-
-    max_text_width = img.width - 10
-    lines = []
-    words = text.split()
-    current_line = ""
-    while words:
-        word = words.pop(0)
-        if draw.textlength(current_line + word, font=font) > max_text_width:
-            lines.append(current_line.strip())
-            current_line = word + " "
-        else:
-            current_line += word + " "
-
-    if current_line.strip():
-        lines.append(current_line.strip())
-
-    wrapped_text = "\n".join(lines)
-
-    bbox = draw.textbbox((0, 0), wrapped_text, font=font)
-    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-
-    box_height = text_height + 10
-
-    draw.rectangle([(0, img.height - box_height), (img.width, img.height)], fill="black")
-
-    text_x = (img.width - text_width) / 2
-    text_y = img.height - box_height + (box_height - text_height) / 2
-
-    draw.text((text_x, text_y), wrapped_text, fill="white", font=font)
-
-    buffered = io.BytesIO()
-    img.save(buffered, format="JPEG")
-    base_64_thumbnail_str = base64.b64encode(buffered.getvalue()).decode()
+    except (TimeoutError, aiohttp.ClientError) as e:
+        logging.warning(f"{tag}/ Failed to fetch image for {code}: {e}")
+    if cached is not None:
+        # A stale image is better than none while the CDN is failing
+        return {"Code": code, "Image Data": cached["data"]}
+    return f"Failed to fetch image for {code}: {image_url}"
+
+
+def image_error(code, error, message):
+    """A failed item of an image stream: error is "not_found", "fetch_failed", "processing_failed" or "deadline_exceeded"."""
+    return {"type": "error", "code": code, "error": error, "message": message}
+
+
+async def load_stream_item(http_client, product, size, image_format, cache):
+    try:
+        entry = await load_image(http_client, product["code"], product["image_url"], size, image_format, cache)
+    except Exception as e:
+        logging.error(f"{tag}/ Error loading image for {product['code']}: {e}")
+        return image_error(product["code"], "processing_failed", str(e))
+    if entry is None:
+        return image_error(product["code"], "fetch_failed", f"Failed to fetch image for {product['code']}: {product['image_url']}")
+    return {
+        "type": "image",
+        "code": product["code"],
+        "name": product["name"],
+        "content_type": entry.get("content_type") or "image/jpeg",
+        "image_data": base64.b64encode(entry["data"]).decode("utf-8"),
+    }
+
+
+async def stream_images(codes, product_index, http_client, deadline, size=None, image_format="jpeg", cache=image_cache):
+    """Yield each product's image as soon as it is loaded, in completion order, then a "done" summary.
+
+    Images are base64 in {"type": "image", ...} items; unknown products, failed downloads and every image still loading
+    when `deadline` seconds have passed come back as image_error items, so each requested code gets exactly one item.
+    """
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    task_codes, counts = {}, {"image": 0, "error": 0}
+    for code in dict.fromkeys(codes):
+        product = product_index.get(code)
+        if product is None or not product["image_url"]:
+            counts["error"] += 1
+            yield image_error(code, "not_found", f"No image URL for code {code} in the catalog.")
+            continue
+        if product["code"] in task_codes.values():
+            continue
+        task_codes[asyncio.create_task(load_stream_item(http_client, product, size, image_format, cache))] = product["code"]
+
+    pending = set(task_codes)
+    try:
+        while pending:
+            remaining = deadline - (loop.time() - start_time)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = task.result()
+                counts[item["type"]] += 1
+                yield item
+        for task in pending:
+            task.cancel()
+            counts["error"] += 1
+            code = task_codes[task]
+            yield image_error(code, "deadline_exceeded", f"Image for {code} not loaded within {deadline}s")
+    finally:
+        # The client may disconnect mid-stream; do not leave downloads running for nobody
+        for task in pending:
+            task.cancel()
+
+    elapsed = loop.time() - start_time
+    logging.info(f"{tag}/ Streamed {counts['image']} images and {counts['error']} errors in {elapsed:.2f}s")
+    yield {"type": "done", "images": counts["image"], "errors": counts["error"], "elapsed_seconds": round(elapsed, 3)}
+
+
+async def make_thumbnails(image_url, image_data, sizes=THUMBNAIL_SIZES):
+    """Thumbnails of every configured size and format, rendered in the image process pool; {} if the image is unreadable
+    or a pool process died, as the original is still worth caching and returning."""
+    try:
+        return await image_executor.run(render_thumbnails, image_data, sizes)
+    except (OSError, BrokenProcessPool) as e:
+        logging.warning(f"{tag}/ Failed to make thumbnails of {image_url}: {e!r}")
+        return {}
+
+
+async def load_image(http_client, code, image_url, size=None, image_format="jpeg", cache=image_cache):
+    """One image as a cache entry ("data", "digest", "content_type"): the CDN original without size, otherwise a
+    thumbnail, re-rendered from the original once it is stale or evicted; None if it cannot be fetched."""
+    variant = thumbnail_variant(size, image_format) if size is not None else None
+    if variant is not None:
+        entry = await asyncio.to_thread(cache.get, image_url, variant)
+        if entry is not None and cache.is_fresh(entry):
+            return entry
+
+    result = await fetch_image(http_client, code, image_url, cache)
+    if not isinstance(result, dict):
+        return None
+    if variant is None:
+        entry = await asyncio.to_thread(cache.get, image_url)
+        return entry or {"data": result["Image Data"], "digest": content_digest(result["Image Data"]), "content_type": "image/jpeg"}
+
+    # A download renders and stores every THUMBNAIL_SIZES variant; render here only what it did not
+    entry = await asyncio.to_thread(cache.get, image_url, variant)
+    if entry is not None and cache.is_fresh(entry):
+        return entry
+    try:
+        thumbnail = await image_executor.run(make_thumbnail, result["Image Data"], size, image_format)
+    except (OSError, BrokenProcessPool) as e:
+        logging.warning(f"{tag}/ Failed to make a {size}px {image_format} thumbnail of {image_url}: {e}")
+        return None
+    return await asyncio.to_thread(
+        cache.put, image_url, thumbnail, variant=variant, content_type=IMAGE_FORMATS[image_format][1]
+    )
+
+
+def store_image(cache, image_url, image_data, headers, thumbnails):
+    """Cache a downloaded image with its CDN validators, and its thumbnails from make_thumbnails."""
+    cache.put(
+        image_url,
+        image_data,
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        content_type=headers.get("Content-Type"),
+    )
+    store_thumbnails(cache, image_url, thumbnails)
+
+
+def store_thumbnails(cache, image_url, thumbnails):
+    for (size, image_format), thumbnail in thumbnails.items():
+        cache.put(image_url, thumbnail, variant=thumbnail_variant(size, image_format), content_type=IMAGE_FORMATS[image_format][1])
+
+
+async def generate_single_grainger_thumbnail(image_data, code, name):
+    thumbnail = await image_executor.run(render_labeled_thumbnail, image_data, f"{code}: {name}")
+    base_64_thumbnail_str = base64.b64encode(thumbnail).decode()
 
     return f"<td><img src='data:image/jpeg;base64,{base_64_thumbnail_str}'></td>"
 
 
 # Example usage
 # recommendations_list = [...]  # Your list of recommendations
-# df = pd.DataFrame(...)  # Your DataFrame with product information
-# image_data, total_time = await get_images(recommendations_list, df)
+# product_index = ProductIndex.from_dataframe(df)  # The catalog, indexed by product code
+# image_data, total_time = await get_images(recommendations_list, product_index, http_client)
+# html_content, total_time = await generate_grainger_thumbnails(image_data, product_index)
 # for data in image_data:
-#     result = await generate_single_grainger_thumbnail(data["Image Data"])
+#     result = await generate_single_grainger_thumbnail(data["Image Data"], data["Code"], name)
 #     print(result)
 
 
@@ -246,27 +360,60 @@ async def generate_single_grainger_thumbnail(image_data):
 #     return f"<td><img src='data:image/jpeg;base64,{base_64_thumbnail_str}'></td>"
 
 
-async def generate_grainger_thumbnails(image_urls, df):
+async def render_grainger_thumbnails(images, product_index, size=200):
+    """Labeled thumbnails of get_images results, all rendered at once in the image process pool, so the batch takes
+    about as long as its slowest image. Returns {"code", "name", "thumbnail"} in input order, skipping failures."""
+    products = []
+    for image in images:
+        if not isinstance(image, dict):
+            continue
+        product = product_index.get(image["Code"])
+        products.append({"code": image["Code"], "name": product["name"] if product else "", "image_data": image["Image Data"]})
+
+    thumbnails = await image_executor.map(
+        render_labeled_thumbnail,
+        [(product["image_data"], f"{product['code']}: {product['name']}", size) for product in products],
+        return_exceptions=True,
+    )
+    tiles = []
+    for product, thumbnail in zip(products, thumbnails, strict=True):
+        if isinstance(thumbnail, Exception):
+            logging.warning(f"{tag}/ Failed to make a thumbnail for {product['code']}: {thumbnail}")
+            continue
+        tiles.append({"code": product["code"], "name": product["name"], "thumbnail": thumbnail})
+    return tiles
+
+
+async def generate_grainger_thumbnails(images, product_index):
     start_time = time.time()
-    logging.info("Generating thumbnails for Grainger products...")
-    logging.info(f"Image URL Maps: {image_urls}")
-
-    image_strips = [
-        await generate_single_grainger_thumbnail(item["Image URL"], item["Code"], df.loc[df["Code"] == item["Code"], "Name"].iloc[0])
-        for item in image_urls
-        if item
-    ]
+    logging.info(f"{tag}/ Generating thumbnails for {len(images)} Grainger products...")
 
+    tiles = await render_grainger_thumbnails(images, product_index)
+    image_strips = [f"<td><img src='data:image/jpeg;base64,{base64.b64encode(tile['thumbnail']).decode()}'></td>" for tile in tiles]
     html_content = "<table><tr>" + "".join(image_strips) + "</tr></table>"
 
     total_time = time.time() - start_time
-    print("Total Image Time:", total_time)
+    logging.info(f"{tag}/ Total Image Time: {total_time}")
 
     return html_content, total_time
 
 
-async def main(image_urls, df):
-    return await generate_grainger_thumbnails(image_urls, df)
+async def generate_grainger_sprite(images, product_index, size=200):
+    """The labeled thumbnails of get_images results composited into one JPEG strip, so a client decodes one image.
+    Returns {"sprite", "content_type", "width", "height", "tiles"}; each tile has its code, name and x/y/width/height."""
+    tiles = await render_grainger_thumbnails(images, product_index, size)
+    sprite, boxes = await image_executor.run(composite_sprite, [tile["thumbnail"] for tile in tiles], size)
+    return {
+        "sprite": sprite,
+        "content_type": IMAGE_FORMATS["jpeg"][1],
+        "width": max(1, size * len(tiles)),
+        "height": size,
+        "tiles": [{"code": tile["code"], "name": tile["name"], **box} for tile, box in zip(tiles, boxes, strict=True)],
+    }
+
+
+async def main(images, product_index):
+    return await generate_grainger_thumbnails(images, product_index)
 
 
 # import asyncio
@@ -0,0 +1,254 @@
+# image_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from modules.metrics import CACHE_LOOKUPS
+
+tag = "image_cache"
+
+MEMORY_BYTES = int(os.getenv("IMAGE_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/grainger_image_cache")
+# Product images rarely change; within this age they are served without contacting the CDN, after it they are
+# revalidated with If-None-Match / If-Modified-Since
+MAX_AGE_SECONDS = int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", "86400"))
+# Nothing else removes files from the disk tier: entries not fetched or revalidated for this many max age periods are
+# deleted, with the objects no entry refers to any more, at most once per interval by one worker (0 disables)
+PRUNE_AGE_PERIODS = int(os.getenv("IMAGE_CACHE_PRUNE_AGE_PERIODS", "7"))
+PRUNE_INTERVAL_SECONDS = int(os.getenv("IMAGE_CACHE_PRUNE_INTERVAL_SECONDS", "3600"))
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv("IMAGE_THUMBNAIL_SIZES", "200").split(",") if size.strip())
+
+ORIGINAL = "original"
+
+
+def thumbnail_variant(size, image_format="jpeg"):
+    return f"thumbnail_{size}" if image_format == "jpeg" else f"thumbnail_{size}_{image_format}"
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ImageCache:
+    """Product images, original bytes plus precomputed thumbnails, in two tiers.
+
+    The memory tier is an LRU bounded by total bytes and private to the worker. The disk tier is content addressed
+    (identical images are stored once) and shared by every worker of the pod, so an image downloaded by one worker is
+    not downloaded again by the others or after a restart; prune() keeps it from growing without bound. Entries are
+    dicts with the bytes, the content digest, the CDN validators (etag, last_modified) and fetched_at.
+    """
+
+    def __init__(
+        self,
+        directory=CACHE_DIR,
+        memory_bytes=MEMORY_BYTES,
+        max_age=MAX_AGE_SECONDS,
+        prune_age_periods=PRUNE_AGE_PERIODS,
+        prune_interval=PRUNE_INTERVAL_SECONDS,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.max_age = max_age
+        self.prune_age_periods = prune_age_periods
+        self.prune_interval = prune_interval
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._next_prune_check = 0.0
+        if directory:
+            os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+            os.makedirs(os.path.join(directory, "index"), exist_ok=True)
+
+    @staticmethod
+    def key(url, variant=ORIGINAL):
+        return f"{variant}:{url}"
+
+    def _index_path(self, key):
+        return os.path.join(self.directory, "index", f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.json")
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_used -= len(previous["data"])
+            if len(entry["data"]) > self.memory_bytes:
+                return
+            self._memory[key] = entry
+            self._memory_used += len(entry["data"])
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted["data"])
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def get(self, url, variant=ORIGINAL):
+        key = self.key(url, variant)
+        entry = self._recall(key)
+        if entry is not None:
+            CACHE_LOOKUPS.labels(cache="image_memory", result="hit").inc()
+            return entry
+        CACHE_LOOKUPS.labels(cache="image_memory", result="miss").inc()
+        if not self.directory:
+            return None
+        try:
+            with open(self._index_path(key)) as index_file:
+                entry = json.load(index_file)
+            with open(self._object_path(entry["digest"]), "rb") as object_file:
+                entry["data"] = object_file.read()
+        except (OSError, ValueError, KeyError):
+            CACHE_LOOKUPS.labels(cache="image_disk", result="miss").inc()
+            return None
+        CACHE_LOOKUPS.labels(cache="image_disk", result="hit").inc()
+        self._remember(key, entry)
+        return entry
+
+    def put(self, url, data, variant=ORIGINAL, etag=None, last_modified=None, content_type=None):
+        entry = {
+            "data": data,
+            "digest": content_digest(data),
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": content_type,
+            "fetched_at": time.time(),
+        }
+        self._remember(self.key(url, variant), entry)
+        self._write(self.key(url, variant), entry)
+        self._schedule_prune()
+        return entry
+
+    def touch(self, url, entry):
+        """Mark an entry the CDN confirmed unchanged (304) as fresh again."""
+        entry["fetched_at"] = time.time()
+        self._write(self.key(url), entry)
+
+    def _write(self, key, entry):
+        if not self.directory:
+            return
+        try:
+            object_path = self._object_path(entry["digest"])
+            if os.path.exists(object_path):
+                # A newer modification time keeps a concurrent prune from taking the object as unreferenced
+                os.utime(object_path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                write_atomically(object_path, entry["data"])
+            metadata = {name: value for name, value in entry.items() if name != "data"}
+            write_atomically(self._index_path(key), json.dumps(metadata).encode())
+        except OSError as e:
+            logging.warning(f"{tag}/ Failed to write {key} to the disk cache: {e}")
+
+    def prune(self, max_age_periods=None):
+        """Delete the disk entries fetched or revalidated more than max_age_periods max ages ago, then the objects no
+        remaining entry refers to. Returns the number of entries and objects deleted and the bytes freed."""
+        max_age_periods = self.prune_age_periods if max_age_periods is None else max_age_periods
+        cutoff = time.time() - max_age_periods * self.max_age
+        removed = {"entries": 0, "objects": 0, "bytes": 0}
+        if not self.directory:
+            return removed
+        referenced = set()
+        index_directory = os.path.join(self.directory, "index")
+        for name in os.listdir(index_directory):
+            path = os.path.join(index_directory, name)
+            try:
+                with open(path) as index_file:
+                    metadata = json.load(index_file)
+                if metadata["fetched_at"] >= cutoff:
+                    referenced.add(metadata["digest"])
+                    continue
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, KeyError, TypeError):
+                # Unreadable: a half-written temporary file, or corrupt. Get treats it as a miss anyway
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            removed["entries"] += remove_file(path)
+        objects_directory = os.path.join(self.directory, "objects")
+        for prefix in os.listdir(objects_directory):
+            for name in os.listdir(os.path.join(objects_directory, prefix)):
+                path = os.path.join(objects_directory, prefix, name)
+                # Objects written or reused after the cutoff may belong to an entry being written right now
+                if name in referenced or os.path.getmtime(path) >= cutoff:
+                    continue
+                size = os.path.getsize(path)
+                if remove_file(path):
+                    removed["objects"] += 1
+                    removed["bytes"] += size
+        logging.info(
+            f"{tag}/ Pruned {removed['entries']} entries and {removed['objects']} objects "
+            f"({removed['bytes']} bytes) not fetched in {max_age_periods} max ages"
+        )
+        return removed
+
+    def _schedule_prune(self):
+        """Prune in a background thread when no worker of the pod has within prune_interval; the modification time of
+        a marker file in the cache directory records the last prune."""
+        if not self.directory or self.prune_age_periods <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_prune_check:
+                return
+            self._next_prune_check = now + self.prune_interval
+        marker = os.path.join(self.directory, "pruned_at")
+        try:
+            if time.time() - os.path.getmtime(marker) < self.prune_interval:
+                return
+        except FileNotFoundError:
+            pass
+        try:
+            write_atomically(marker, b"")
+        except OSError as e:
+            logging.warning(f"{tag}/ Failed to write the prune marker: {e}")
+            return
+        threading.Thread(target=self._prune_in_background, name="image-cache-prune", daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            self.prune()
+        except OSError as e:
+            logging.warning(f"{tag}/ Failed to prune the disk cache: {e}")
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.max_age
+
+    @staticmethod
+    def validators(entry):
+        """Conditional request headers for revalidating a cached entry with the CDN."""
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+def write_atomically(path, data):
+    # Workers write the same files concurrently; a reader sees either the old file or the complete new one
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as temporary_file:
+        temporary_file.write(data)
+    os.replace(temporary_path, path)
+
+
+def remove_file(path):
+    """Delete a file another worker may already have deleted; True if this call deleted it."""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+image_cache = ImageCache()
@@ -0,0 +1,64 @@
+# image_executor.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+tag = "image_executor"
+
+# Each gunicorn worker has its own pool; with several workers per host, size this to the cores per worker.
+# 0 runs image work in threads instead
+PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+
+class ImageExecutor:
+    """Runs CPU-bound image work (decode, resize, encode) in a process pool, off the event loop and the GIL.
+
+    The pool is started on first use, in the worker process that uses it, with the "spawn" start method: forking a
+    worker that already runs threads (Redis pub/sub, trace export) could copy a held lock into the child.
+    """
+
+    def __init__(self, max_workers=PROCESS_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        if self.max_workers <= 0:
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                logging.info(f"{tag}/ Started image process pool with {self.max_workers} processes")
+            return self._pool
+
+    async def run(self, function, *args):
+        executor = self._executor()
+        if executor is None:
+            return await asyncio.to_thread(function, *args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); start a new pool for the next call
+            logging.error(f"{tag}/ Image process pool broke, restarting it")
+            with self._lock:
+                if self._pool is executor:
+                    self._pool = None
+            raise
+
+    async def map(self, function, argument_tuples, return_exceptions=False):
+        """Run function once per tuple of arguments across the pool; results in input order, exceptions in place of
+        results when return_exceptions is set."""
+        return await asyncio.gather(*(self.run(function, *args) for args in argument_tuples), return_exceptions=return_exceptions)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+image_executor = ImageExecutor()
@@ -0,0 +1,86 @@
+# image_http.py
+import asyncio
+import logging
+import os
+import random
+
+import aiohttp
+
+from modules.metrics import IMAGE_FETCHES
+
+tag = "image_http"
+
+MAX_CONNECTIONS = int(os.getenv("IMAGE_HTTP_MAX_CONNECTIONS", "200"))
+# The images all come from one CDN host, so this caps the load one worker puts on it
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("IMAGE_HTTP_MAX_CONNECTIONS_PER_HOST", "32"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("IMAGE_HTTP_CONNECT_TIMEOUT_SECONDS", "2"))
+READ_TIMEOUT_SECONDS = float(os.getenv("IMAGE_HTTP_READ_TIMEOUT_SECONDS", "5"))
+RETRIES = int(os.getenv("IMAGE_HTTP_RETRIES", "2"))
+DNS_CACHE_SECONDS = int(os.getenv("IMAGE_HTTP_DNS_CACHE_SECONDS", "300"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ImageHttpClient:
+    """One keep-alive aiohttp connection pool per worker for CDN image downloads.
+
+    The session is created on first use, inside the worker's event loop, and reused by every request, so the TCP and
+    TLS handshakes and the DNS lookup are paid once per connection rather than once per request.
+    """
+
+    def __init__(
+        self,
+        max_connections=MAX_CONNECTIONS,
+        max_connections_per_host=MAX_CONNECTIONS_PER_HOST,
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        read_timeout=READ_TIMEOUT_SECONDS,
+        retries=RETRIES,
+        dns_cache_seconds=DNS_CACHE_SECONDS,
+        backoff=0.2,
+    ):
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self.retries = retries
+        self.dns_cache_seconds = dns_cache_seconds
+        self.backoff = backoff
+        self._session = None
+        self._loop = None
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                ttl_dns_cache=self.dns_cache_seconds,
+                keepalive_timeout=30,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    async def fetch(self, url, headers=None):
+        """GET url and return (status, headers, body), the body only for a 200. Connection errors, timeouts and
+        throttling or server errors are retried with jittered exponential backoff, at most `retries` times."""
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                async with self.session().get(url, headers=headers) as response:
+                    if response.status not in RETRYABLE_STATUSES or last_attempt:
+                        body = await response.read() if response.status == 200 else b""
+                        IMAGE_FETCHES.labels(outcome=str(response.status)).inc()
+                        return response.status, response.headers, body
+                    reason = f"status {response.status}"
+            except (TimeoutError, aiohttp.ClientError) as e:
+                if last_attempt:
+                    IMAGE_FETCHES.labels(outcome="error").inc()
+                    raise
+                reason = type(e).__name__
+            IMAGE_FETCHES.labels(outcome="retry").inc()
+            logging.warning(f"{tag}/ Retrying {url} after {reason} (attempt {attempt + 1} of {self.retries})")
+            await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
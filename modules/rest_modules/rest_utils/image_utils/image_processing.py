@@ -0,0 +1,105 @@
+# image_processing.py
+# CPU-bound image work, run in the image process pool (image_executor.py). Everything here is a plain function of bytes
+# and plain values, and the module imports only PIL, so pool processes start quickly and never load the application.
+import base64
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+IMAGE_FORMATS = {"jpeg": ("JPEG", "image/jpeg", 85), "webp": ("WEBP", "image/webp", 80)}
+
+
+def resize(image_data, size):
+    # Decoding as part of thumbnail() lets PIL decode a JPEG straight at a reduced scale
+    img = Image.open(io.BytesIO(image_data))
+    img.thumbnail((size, size))
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def encode(img, image_format):
+    pil_format, _, quality = IMAGE_FORMATS[image_format]
+    buffered = io.BytesIO()
+    img.save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue()
+
+
+def make_thumbnail(image_data, size, image_format="jpeg"):
+    return encode(resize(image_data, size), image_format)
+
+
+def render_thumbnails(image_data, sizes):
+    """Thumbnails of every size in every format, as {(size, image_format): bytes}, decoding the image once per size."""
+    thumbnails = {}
+    for size in sizes:
+        img = resize(image_data, size)
+        for image_format in IMAGE_FORMATS:
+            thumbnails[(size, image_format)] = encode(img, image_format)
+    return thumbnails
+
+
+def to_png_base64(image_data):
+    img = Image.open(io.BytesIO(image_data))
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format="PNG")
+    return base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
+
+
+def render_labeled_thumbnail(image_data, text, size=200):
+    """A JPEG thumbnail with text wrapped in a black caption box along the bottom."""
+    img = Image.open(io.BytesIO(image_data))
+    img.thumbnail((size, size))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+
+    max_text_width = img.width - 10
+    lines = []
+    words = text.split()
+    current_line = ""
+    while words:
+        word = words.pop(0)
+        if draw.textlength(current_line + word, font=font) > max_text_width:
+            lines.append(current_line.strip())
+            current_line = word + " "
+        else:
+            current_line += word + " "
+
+    if current_line.strip():
+        lines.append(current_line.strip())
+
+    wrapped_text = "\n".join(lines)
+
+    bbox = draw.textbbox((0, 0), wrapped_text, font=font)
+    text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+    box_height = text_height + 10
+
+    draw.rectangle([(0, img.height - box_height), (img.width, img.height)], fill="black")
+
+    text_x = (img.width - text_width) / 2
+    text_y = img.height - box_height + (box_height - text_height) / 2
+
+    draw.text((text_x, text_y), wrapped_text, fill="white", font=font)
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+def composite_sprite(thumbnails, cell_size, image_format="jpeg"):
+    """Thumbnails side by side, each centered in a cell_size px square cell, as one image plus the box of each
+    thumbnail in it ({"x", "y", "width", "height"}, in input order)."""
+    pil_format, _, quality = IMAGE_FORMATS[image_format]
+    tiles = [Image.open(io.BytesIO(thumbnail)) for thumbnail in thumbnails]
+    sprite = Image.new("RGB", (max(1, cell_size * len(tiles)), cell_size), "white")
+    boxes = []
+    for index, tile in enumerate(tiles):
+        x = index * cell_size + (cell_size - tile.width) // 2
+        y = (cell_size - tile.height) // 2
+        sprite.paste(tile if tile.mode == "RGB" else tile.convert("RGB"), (x, y))
+        boxes.append({"x": x, "y": y, "width": tile.width, "height": tile.height})
+    buffered = io.BytesIO()
+    sprite.save(buffered, format=pil_format, quality=quality)
+    return buffered.getvalue(), boxes
@@ -1,30 +1,33 @@
 import logging
 
-import httpx
-
+from modules.rest_modules.rest_utils.image_utils.image_http import ImageHttpClient
 from modules.vector_index.vector_implementations.VectorStoreImpl import VectorStoreImpl
+from modules.vector_index.vector_utils.product_index import ProductIndex
 
 
 class ResourceManager:
     def __init__(self):
-        self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.llm = (
+        self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.models = (
             VectorStoreImpl.initialize_embeddings_and_faiss()
         )
+        self.product_index = ProductIndex.from_dataframe(self.df)
         self.driver = None
         self.http_client = None
         self.initialize_http_client()  # Initialization call here is fine
 
     def initialize_http_client(self):
         try:
-            self.http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+            # Shared by every image download of this worker; the connection pool opens on first use in the event loop
+            self.http_client = ImageHttpClient()
             logging.info("HTTP client initialized successfully.")
         except Exception as e:
             logging.error(f"Failed to initialize HTTP client: {e}")
 
     async def refresh_bedrock_embeddings(self):
-        self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.llm = (
+        self.bedrock_embeddings, self.vectorstore_faiss_doc, self.exact_match_map, self.df, self.models = (
             VectorStoreImpl.initialize_embeddings_and_faiss()
         )
+        self.product_index = ProductIndex.from_dataframe(self.df)
 
 
 resource_manager = ResourceManager()
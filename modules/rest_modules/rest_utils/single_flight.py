@@ -0,0 +1,59 @@
+import asyncio
+import contextlib
+import logging
+import re
+
+from modules.tracing import current_trace, span
+
+tag = "single_flight"
+
+
+def normalize_question(question):
+    """Key used to coalesce questions that only differ in case, spacing or trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution whose result every caller receives.
+
+    The shared execution is only cancelled once every caller waiting on it has been cancelled. Its stages are traced
+    in the first caller's trace; the others record a coalesced_wait span pointing at that trace.
+    """
+
+    def __init__(self, on_coalesced=None):
+        self.on_coalesced = on_coalesced
+        self._in_flight = {}
+
+    async def do(self, key, coroutine_function, *args):
+        entry = self._in_flight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(coroutine_function(*args))
+            trace = current_trace.get()
+            entry = {"task": task, "waiters": 0, "trace_id": trace.trace_id if trace is not None else None}
+            self._in_flight[key] = entry
+            task.add_done_callback(lambda _: self._forget(key, entry))
+            waiting = contextlib.nullcontext()
+        else:
+            logging.info(f"{tag}/ Joining in-flight execution for key: {key}")
+            if self.on_coalesced:
+                self.on_coalesced()
+            waiting = span("coalesced_wait", leader_trace_id=entry["trace_id"])
+
+        entry["waiters"] += 1
+        try:
+            with waiting:
+                return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            if entry["waiters"] == 1 and not entry["task"].done():
+                logging.info(f"{tag}/ Last waiter cancelled, cancelling execution for key: {key}")
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def _forget(self, key, entry):
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+    def in_flight(self):
+        return len(self._in_flight)
@@ -7,6 +7,7 @@ from fastapi import HTTPException
 
 from modules.globals import session_store
 from modules.rest_modules.rest_utils.resource_manager import ResourceManager
+from modules.vector_index.vector_utils.chat_history import compact_turn
 from modules.vector_index.vector_utils.chat_processor import process_chat_question_with_customer_attribute_identifier
 
 
@@ -29,7 +30,8 @@ async def process_chat_question(chat_request, session_id, resource_manager_param
         logging.info(f"fast_api_main/ Products retrieved: {products}")
 
         # Update the session history with the latest question and response
-        session_store[session_id].append({"question": chat_request.question, "response": response_json})
+        turn = compact_turn(chat_request.question, message, customer_attributes_retrieved, products)
+        await asyncio.to_thread(session_store.append_turn, session_id, turn)
 
         return {
             "message": message,
@@ -0,0 +1,196 @@
+# session_store.py
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from modules.metrics import CHAT_SESSIONS, SESSION_EVICTIONS
+from modules.response_cache import decode, encode
+
+tag = "session_store"
+
+MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "100000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+# Older turns are normally folded into the summary long before this; the cap bounds a session whose summaries fail
+MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+
+
+def new_session():
+    # generation changes whenever turns are removed (clear, fold or trim), so a fold computed from an older read is discarded
+    return {"turns": [], "summary": None, "generation": 0}
+
+
+def append_to_session(state, turn, max_turns):
+    turns = state["turns"] + [turn]
+    if len(turns) > max_turns:
+        # Trimmed turns were never summarized, so a fold computed before the trim must not drop more of them
+        turns = turns[-max_turns:]
+        state["generation"] += 1
+    state["turns"] = turns
+    return len(turns)
+
+
+class InMemorySessionStore:
+    """Sessions of this process, evicted least recently used beyond max_sessions and after ttl seconds idle."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS, max_turns=MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            del self._sessions[session_id]
+            SESSION_EVICTIONS.labels(reason="ttl").inc()
+            CHAT_SESSIONS.set(len(self._sessions))
+            return None
+        entry["expires_at"] = time.time() + self.ttl
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def _create(self, session_id):
+        entry = {**new_session(), "expires_at": time.time() + self.ttl}
+        self._sessions[session_id] = entry
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            SESSION_EVICTIONS.labels(reason="capacity").inc()
+        CHAT_SESSIONS.set(len(self._sessions))
+        return entry
+
+    def ensure(self, session_id):
+        """Start the session if it does not exist; True if it was created."""
+        with self._lock:
+            if self._live(session_id) is not None:
+                return False
+            self._create(session_id)
+            return True
+
+    def load(self, session_id):
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None
+            return {"turns": list(entry["turns"]), "summary": entry["summary"], "generation": entry["generation"]}
+
+    def append_turn(self, session_id, turn):
+        """Add a turn; returns the number of turns in the session afterwards."""
+        with self._lock:
+            entry = self._live(session_id) or self._create(session_id)
+            return append_to_session(entry, turn, self.max_turns)
+
+    def clear(self, session_id):
+        with self._lock:
+            entry = self._live(session_id) or self._create(session_id)
+            entry.update(turns=[], summary=None, generation=entry["generation"] + 1)
+
+    def fold(self, session_id, generation, folded_turns, summary):
+        """Replace the first folded_turns turns with summary, unless turns were removed since generation was read."""
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None or entry["generation"] != generation:
+                return False
+            entry.update(turns=entry["turns"][folded_turns:], summary=summary, generation=generation + 1)
+            return True
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return self._live(session_id) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class RedisSessionStore:
+    """Sessions in Redis, so any gunicorn worker or replica can serve any session.
+
+    Each session is one compact zlib-compressed JSON value whose TTL is renewed on every write; updates are optimistic
+    WATCH/MULTI transactions, so two workers appending to the same session do not lose a turn. If Redis is down, history
+    reads come back empty and writes are dropped rather than failing the chat request.
+    """
+
+    def __init__(self, client, prefix="grainger", ttl=SESSION_TTL_SECONDS, max_turns=MAX_TURNS):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_turns = max_turns
+
+    def key(self, session_id):
+        return f"{self.prefix}:session:{session_id}"
+
+    def _update(self, session_id, change, create=True):
+        """Apply change to the session state and write it back; without create, a missing or expired session is left
+        alone and None returned."""
+        key = self.key(session_id)
+        result = []
+
+        def transaction(pipe):
+            data = pipe.get(key)
+            if not data and not create:
+                return
+            state = decode(data) if data else new_session()
+            result[:] = [change(state)]
+            pipe.multi()
+            pipe.set(key, encode(state), ex=self.ttl)
+
+        try:
+            self.client.transaction(transaction, key)
+        except redis.RedisError as e:
+            logging.error(f"{tag}/ Failed to update session {session_id}: {e}")
+            return None
+        return result[0] if result else None
+
+    def ensure(self, session_id):
+        try:
+            return bool(self.client.set(self.key(session_id), encode(new_session()), ex=self.ttl, nx=True))
+        except redis.RedisError as e:
+            logging.error(f"{tag}/ Failed to create session {session_id}: {e}")
+            return False
+
+    def load(self, session_id):
+        try:
+            data = self.client.get(self.key(session_id))
+        except redis.RedisError as e:
+            logging.error(f"{tag}/ Failed to load session {session_id}: {e}")
+            return None
+        return decode(data) if data else None
+
+    def append_turn(self, session_id, turn):
+        """Add a turn; returns the number of turns in the session afterwards, 0 if Redis is unavailable."""
+        return self._update(session_id, lambda state: append_to_session(state, turn, self.max_turns)) or 0
+
+    def clear(self, session_id):
+        def clear(state):
+            state.update(turns=[], summary=None, generation=state["generation"] + 1)
+
+        self._update(session_id, clear)
+
+    def fold(self, session_id, generation, folded_turns, summary):
+        def fold(state):
+            if state["generation"] != generation:
+                return False
+            state.update(turns=state["turns"][folded_turns:], summary=summary, generation=generation + 1)
+            return True
+
+        # A session that expired while its summary was written stays gone, as in the in-memory store
+        return bool(self._update(session_id, fold, create=False))
+
+    def __contains__(self, session_id):
+        try:
+            return bool(self.client.exists(self.key(session_id)))
+        except redis.RedisError:
+            return False
+
+
+def create_session_store(backend):
+    if backend == "redis":
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), socket_timeout=1.0, socket_connect_timeout=1.0)
+        return RedisSessionStore(client, prefix=os.getenv("RESPONSE_CACHE_PREFIX", "grainger"))
+    return InMemorySessionStore()
@@ -1,6 +1,6 @@
 import asyncio
 import base64
-import io
+import json
 import logging
 import os
 import time
@@ -8,7 +8,6 @@ import uuid
 
 import httpx
 import streamlit as st
-from PIL import Image
 from ui_utils.constants import messages_for_answering_questions, messages_for_getting_reviews
 from ui_utils.custom_spinner import message_spinner
 
@@ -105,14 +104,25 @@ class StreamlitInterface:
         try:
             with st.spinner("Fetching images..."):
                 start_time = time.time()
-                url = f"{backend_url}/fetch_images"
-                headers = {"Content-Type": "application/json", "session-id": self.session_id}
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(url, headers=headers, json=products, timeout=120)
-                    if response.status_code == 200:
-                        self.display_images(col3, response.json(), start_time)
-                    else:
-                        logging.error(f"Failed to fetch images: {response.text}")
+                url = f"{backend_url}/images/stream"
+                headers = {"Content-Type": "application/json", "Accept": "application/x-ndjson", "session-id": self.session_id}
+                # Each image is shown as soon as the backend has it, not after the slowest download
+                async with (
+                    httpx.AsyncClient() as client,
+                    client.stream("POST", url, headers=headers, json=products, timeout=120) as response,
+                ):
+                    if response.status_code != 200:
+                        logging.error(f"Failed to stream images: {(await response.aread()).decode()}")
+                        return
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        item = json.loads(line)
+                        if item["type"] == "image":
+                            self.display_images(col3, [{"code": item["code"], "image_data": base64.b64decode(item["image_data"])}])
+                        elif item["type"] == "error":
+                            logging.error(f"Failed to fetch image for {item['code']}: {item['error']}: {item['message']}")
+                col3.write(f"Total time taken to generate images: {time.time() - start_time}")
         except Exception as e:
             logging.error(f"Error fetching images: {e}")
             st.error(f"An error occurred while fetching images: {e}")
@@ -160,17 +170,14 @@ class StreamlitInterface:
         except Exception as e:
             logging.error(f"{tag} / Error displaying message: {e}")
 
-    def display_images(self, col3, data, start_time):
+    def display_images(self, col3, data):
         try:
             with st.spinner("Displaying images..."):
                 for image_info in data:
                     try:
-                        img = Image.open(io.BytesIO(base64.b64decode(image_info["image_data"])))
-                        col3.image(img, caption=f"Grainger Product Image ({image_info['code']})", use_column_width=True)
+                        col3.image(image_info["image_data"], caption=f"Grainger Product Image ({image_info['code']})", use_column_width=True)
                     except Exception as e:
                         logging.error(f"{tag} / Error displaying image: {e}")
-                time_to_generate_images = time.time() - start_time
-                col3.write(f"Total time taken to generate images: {time_to_generate_images}")
         except Exception as e:
             logging.error(f"{tag} / Error displaying images: {e}")
 
@@ -0,0 +1,216 @@
+# task_registry.py
+import asyncio
+import logging
+import os
+import secrets
+import threading
+
+import redis
+
+from modules.metrics import CHAT_TASK_CANCELLATIONS, CHAT_TASKS_IN_FLIGHT
+from modules.tracing import span
+
+tag = "task_registry"
+
+# Longest a chat task may hold its session; a worker that dies mid-task releases the session after this
+LEASE_SECONDS = int(os.getenv("CHAT_TASK_LEASE_SECONDS", "90"))
+
+# Deletes a key only while it still holds this run's token, so a run never releases a session claimed by a newer one
+RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call("get", key) == ARGV[1] then
+        redis.call("del", key)
+    end
+end
+return 0
+"""
+
+
+class TaskSuperseded(Exception):
+    """A newer question for the same session arrived before this one started."""
+
+
+class LocalTaskRegistry:
+    """Runs at most one chat task per session in this process; a new question cancels the running one and starts after
+    it has stopped, so the newest question always wins."""
+
+    def __init__(self):
+        self.tasks = {}
+        self._latest = {}
+
+    async def run(self, session_id, function, *args):
+        token = secrets.token_hex(8)
+        self._latest[session_id] = token
+        previous = self.tasks.get(session_id)
+        while previous is not None and not previous.done():
+            logging.info(f"{tag}/ Cancelling task for session ID: {session_id} due to new question.")
+            CHAT_TASK_CANCELLATIONS.labels(scope="local").inc()
+            previous.cancel()
+            await asyncio.wait({previous})
+            previous = self.tasks.get(session_id)
+        if self._latest.get(session_id) != token:
+            raise TaskSuperseded(session_id)
+        return await self._run_task(session_id, token, function, *args)
+
+    async def _run_task(self, session_id, token, function, *args):
+        task = asyncio.create_task(function(*args))
+        CHAT_TASKS_IN_FLIGHT.inc()
+        task.add_done_callback(lambda _: CHAT_TASKS_IN_FLIGHT.dec())
+        self.tasks[session_id] = task
+        try:
+            return await task
+        finally:
+            if self.tasks.get(session_id) is task:
+                del self.tasks[session_id]
+            if self._latest.get(session_id) == token:
+                del self._latest[session_id]
+
+
+class RedisTaskRegistry(LocalTaskRegistry):
+    """Serializes chat tasks per session across every gunicorn worker and replica.
+
+    A run claims the session by writing its token to a "latest" key and publishes a cancellation for the token it
+    replaced; the process running that token cancels it. The run then waits for the session lock, which the previous
+    run releases when it stops, so two generations never run for one session. If Redis is unavailable the registry
+    falls back to per-process serialization.
+    """
+
+    def __init__(self, client, prefix="grainger", lease=LEASE_SECONDS, poll_interval=0.05):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.channel = f"{prefix}:chat_task:cancel"
+        self._runs = {}
+        self._runs_lock = threading.Lock()
+        self._subscriber = None
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    def keys(self, session_id):
+        return f"{self.prefix}:chat_task:latest:{session_id}", f"{self.prefix}:chat_task:lock:{session_id}"
+
+    async def run(self, session_id, function, *args):
+        token = secrets.token_hex(8)
+        run = {"loop": asyncio.get_running_loop(), "task": None, "cancelled": False}
+        with self._runs_lock:
+            self._runs[token] = run
+        try:
+            try:
+                previous = await asyncio.to_thread(self._claim, session_id, token)
+            except redis.RedisError as e:
+                logging.warning(f"{tag}/ Redis unavailable, serializing session {session_id} in this process only: {e}")
+                return await super().run(session_id, function, *args)
+
+            if previous is not None:
+                logging.info(f"{tag}/ Cancelling task for session ID: {session_id} due to new question.")
+                CHAT_TASK_CANCELLATIONS.labels(scope="local" if previous in self._runs else "remote").inc()
+                self.cancel(previous)
+
+            with span("session_queue"):
+                acquired = await self._acquire(session_id, token, run)
+            if not acquired:
+                raise TaskSuperseded(session_id)
+            try:
+                return await self._run_task(session_id, token, self._registered(session_id, run, function), *args)
+            finally:
+                await asyncio.to_thread(self._release_session, session_id, token)
+        finally:
+            with self._runs_lock:
+                self._runs.pop(token, None)
+
+    def _registered(self, session_id, run, function):
+        async def registered(*args):
+            # Registered from inside the task so a cancellation that arrives while it starts is not lost
+            with self._runs_lock:
+                run["task"] = asyncio.current_task()
+                cancelled = run["cancelled"]
+            if cancelled:
+                raise TaskSuperseded(session_id)
+            return await function(*args)
+
+        return registered
+
+    def _claim(self, session_id, token):
+        self._subscribe()
+        latest_key, _ = self.keys(session_id)
+        pipe = self.client.pipeline()
+        pipe.getset(latest_key, token)
+        pipe.expire(latest_key, self.lease)
+        previous, _ = pipe.execute()
+        if previous is None:
+            return None
+        previous = previous.decode()
+        self.client.publish(self.channel, f"{session_id} {previous}")
+        return previous
+
+    async def _acquire(self, session_id, token, run):
+        latest_key, lock_key = self.keys(session_id)
+        while not run["cancelled"]:
+            try:
+                acquired, latest = await asyncio.to_thread(self._try_lock, latest_key, lock_key, token)
+            except redis.RedisError as e:
+                logging.warning(f"{tag}/ Redis unavailable while waiting for session {session_id}, running anyway: {e}")
+                return True
+            if latest is not None and latest.decode() != token:
+                if acquired:
+                    await asyncio.to_thread(self._release_session, session_id, token)
+                return False
+            if acquired:
+                return True
+            # The lock expires after the lease, so a run holding it in a worker that died cannot block the session
+            await asyncio.sleep(self.poll_interval)
+        return False
+
+    def _try_lock(self, latest_key, lock_key, token):
+        pipe = self.client.pipeline()
+        pipe.set(lock_key, token, ex=self.lease, nx=True)
+        pipe.get(latest_key)
+        acquired, latest = pipe.execute()
+        return bool(acquired), latest
+
+    def _release_session(self, session_id, token):
+        try:
+            self._release(keys=list(self.keys(session_id)), args=[token])
+        except redis.RedisError as e:
+            logging.warning(f"{tag}/ Failed to release session {session_id}, it frees up after {self.lease}s: {e}")
+
+    def cancel(self, token):
+        """Cancel the run holding token if it is in this process; True if it was."""
+        with self._runs_lock:
+            run = self._runs.get(token)
+            if run is None:
+                return False
+            run["cancelled"] = True
+            task = run["task"]
+        if task is not None:
+            run["loop"].call_soon_threadsafe(task.cancel)
+        return True
+
+    def _on_cancel_message(self, message):
+        session_id, _, token = message["data"].decode().rpartition(" ")
+        if self.cancel(token):
+            logging.info(f"{tag}/ Cancelled task for session ID: {session_id} superseded on another worker")
+
+    def _subscribe(self):
+        if self._subscriber is not None:
+            return
+        with self._runs_lock:
+            if self._subscriber is not None:
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_cancel_message})
+            self._subscriber = pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=self._on_subscriber_error)
+
+    def _on_subscriber_error(self, error, pubsub, thread):
+        # Runs stay serialized by the session lock; only the early cancellation of remote runs is lost until resubscribed
+        logging.error(f"{tag}/ Cancellation subscriber failed, resubscribing on the next question: {error}")
+        thread.stop()
+        self._subscriber = None
+
+
+def create_task_registry(backend):
+    if backend == "redis":
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), socket_timeout=1.0, socket_connect_timeout=1.0)
+        return RedisTaskRegistry(client, prefix=os.getenv("RESPONSE_CACHE_PREFIX", "grainger"))
+    return LocalTaskRegistry()
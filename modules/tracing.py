@@ -0,0 +1,248 @@
+# tracing.py
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from modules.metrics import CHAT_STAGE_DURATION
+
+tag = "tracing"
+
+# The trace of the request being served; asyncio tasks and asyncio.to_thread copy it, so stages running in worker
+# threads record into the same trace
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Spans recorded while serving one request, from the event loop and from worker threads."""
+
+    def __init__(self, name, request_id=None, session_id=None):
+        self.trace_id = secrets.token_hex(16)
+        self.root_span_id = secrets.token_hex(8)
+        self.name = name
+        self.request_id = request_id or self.trace_id
+        self.session_id = session_id
+        self.start_time = time.time()
+        self.end_time = None
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start_time, end_time, attributes=None):
+        span_record = {
+            "name": name,
+            "span_id": secrets.token_hex(8),
+            "start_time": start_time,
+            "end_time": end_time,
+            "attributes": attributes or {},
+        }
+        with self._lock:
+            self.spans.append(span_record)
+        CHAT_STAGE_DURATION.labels(stage=name).observe(end_time - start_time)
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def finish(self):
+        self.end_time = time.time()
+
+    def timings(self):
+        """Seconds spent per stage, summed over spans of the same stage, plus the total so far."""
+        with self._lock:
+            spans = list(self.spans)
+        timings = defaultdict(float)
+        for span_record in spans:
+            timings[span_record["name"]] += span_record["end_time"] - span_record["start_time"]
+        timings["total"] = (self.end_time or time.time()) - self.start_time
+        return {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "request_id": self.request_id,
+            "session_id": self.session_id,
+            "duration": round((self.end_time or time.time()) - self.start_time, 4),
+            "attributes": dict(self.attributes),
+            "spans": [
+                {"name": span_record["name"], "duration": round(span_record["end_time"] - span_record["start_time"], 4),
+                 "offset": round(span_record["start_time"] - self.start_time, 4), **span_record["attributes"]}
+                for span_record in spans
+            ],
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record the enclosed block as a stage of the current trace; does nothing outside a traced request."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start_time = time.time()
+    try:
+        yield
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        trace.add_span(name, start_time, time.time(), attributes)
+
+
+def annotate(**attributes):
+    """Attach per-request values, such as the retrieval depth chosen, to the current trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.annotate(**attributes)
+
+
+def bind_context(function):
+    """Run function in a copy of the caller's context, so work submitted to a thread pool keeps the trace."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """Records LangChain LLM calls as generation spans, and the time between retrieval and the LLM call (stuffing the
+    documents into the prompt) as a prompt_build span."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._llm_starts = {}
+        self._retriever_end = None
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._retriever_end = time.time()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        now = time.time()
+        if self._retriever_end is not None:
+            self.trace.add_span("prompt_build", self._retriever_end, now)
+            self._retriever_end = None
+        self._llm_starts[run_id] = now
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start_time = self._llm_starts.pop(run_id, None)
+        if start_time is not None:
+            self.trace.add_span("generation", start_time, time.time())
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start_time = self._llm_starts.pop(run_id, None)
+        if start_time is not None:
+            self.trace.add_span("generation", start_time, time.time(), {"error": type(error).__name__})
+
+
+class LogSpanExporter:
+    """Writes each finished trace as one JSON log line."""
+
+    def export(self, trace):
+        logging.info(f"{tag}/ {json.dumps(trace.to_dict())}")
+
+
+def otlp_attributes(values):
+    return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items() if value is not None]
+
+
+def to_otlp(trace, service_name):
+    """Encode a trace as an OTLP/HTTP JSON ExportTraceServiceRequest, stages as children of the request span."""
+    request_attributes = {"request.id": trace.request_id, "session.id": trace.session_id}
+    spans = [
+        {
+            "traceId": trace.trace_id,
+            "spanId": trace.root_span_id,
+            "name": trace.name,
+            "kind": 2,
+            "startTimeUnixNano": str(int(trace.start_time * 1e9)),
+            "endTimeUnixNano": str(int((trace.end_time or time.time()) * 1e9)),
+            "attributes": otlp_attributes({**request_attributes, **trace.attributes}),
+        }
+    ]
+    for span_record in trace.spans:
+        spans.append(
+            {
+                "traceId": trace.trace_id,
+                "spanId": span_record["span_id"],
+                "parentSpanId": trace.root_span_id,
+                "name": span_record["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(int(span_record["start_time"] * 1e9)),
+                "endTimeUnixNano": str(int(span_record["end_time"] * 1e9)),
+                "attributes": otlp_attributes({**request_attributes, **span_record["attributes"]}),
+            }
+        )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": otlp_attributes({"service.name": service_name})},
+                "scopeSpans": [{"scope": {"name": "modules.tracing"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class OtlpHttpSpanExporter:
+    """Sends traces to an OTLP/HTTP collector from a background thread, dropping them if the collector falls behind."""
+
+    def __init__(self, endpoint, service_name, max_queue_size=1000, timeout=5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logging.warning(f"{tag}/ Trace queue full, dropping trace {trace.trace_id}")
+
+    def _run(self):
+        with httpx.Client(timeout=self.timeout) as client:
+            while True:
+                trace = self._queue.get()
+                try:
+                    client.post(self.url, json=to_otlp(trace, self.service_name)).raise_for_status()
+                except httpx.HTTPError as e:
+                    logging.warning(f"{tag}/ Failed to export trace {trace.trace_id} to {self.url}: {e}")
+
+
+def create_exporter(kind):
+    if kind == "otlp":
+        return OtlpHttpSpanExporter(
+            os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"),
+            os.getenv("OTEL_SERVICE_NAME", "grainger-recommendations"),
+        )
+    if kind == "log":
+        return LogSpanExporter()
+    return None
+
+
+# "log" writes traces as JSON log lines, "otlp" sends them to OTEL_EXPORTER_OTLP_ENDPOINT, "none" only keeps timings
+span_exporter = create_exporter(os.getenv("TRACE_EXPORTER", "log"))
+
+
+def start_trace(name, request_id=None, session_id=None):
+    trace = Trace(name, request_id=request_id, session_id=session_id)
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace):
+    trace.finish()
+    if span_exporter is not None:
+        try:
+            span_exporter.export(trace)
+        except Exception as e:
+            logging.error(f"{tag}/ Failed to export trace {trace.trace_id}: {e}")
@@ -6,15 +6,19 @@ import threading
 from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+import numpy as np
 import pandas as pd
 import redis
-from langchain_aws import Bedrock
 from langchain_community.embeddings import BedrockEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
+from modules.metrics import VECTOR_INDEX_DOCUMENTS
+from modules.response_cache import index_version, response_cache
+from modules.tracing import bind_context, span
 from modules.vector_index.vector_facades.VectorStoreFacade import VectorStoreFacade
-from modules.vector_index.vector_utils.bedrock import BedrockClientManager
+from modules.vector_index.vector_utils.bedrock import BEDROCK_BACKEND, BedrockClientManager
+from modules.vector_index.vector_utils.model_registry import ModelRegistry
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +30,12 @@ faiss_creation_event = threading.Event()
 tag = "VectorStoreImpl"
 
 
+def extract_product_codes(query: str) -> list[str]:
+    """Find all product codes that are 5-7 characters long and include at least 2 numbers and 2 letters."""
+    product_codes = re.findall(r'\b[A-Za-z0-9]{5,7}\b', query.upper())
+    return [code for code in product_codes if sum(c.isdigit() for c in code) >= 2 and sum(c.isalpha() for c in code) >= 2]
+
+
 class VectorStoreImpl(VectorStoreFacade):
     def __init__(self, vectorstore):
         super().__init__(vectorstore)
@@ -37,12 +47,8 @@ class VectorStoreImpl(VectorStoreFacade):
         bedrock_manager = BedrockClientManager(refresh_interval=3600)
         bedrock_runtime_client = bedrock_manager.get_bedrock_client()
 
-        # Load or create LLM instance
-        model_parameter = {
-            "temperature": 0.0, "top_p": 0.5, "top_k": 250, "max_tokens_to_sample": 2000,
-            "stop_sequences": ["\n\n Human: bye"]
-        }
-        llm = Bedrock(model_id="anthropic.claude-v2", model_kwargs=model_parameter, client=bedrock_runtime_client)
+        # One LLM per pipeline step, each with its own model and generation parameters
+        models = ModelRegistry(bedrock_runtime_client)
 
         # Initialize Titan Embeddings Model
         logging.info("Initializing Titan Embeddings Model...")
@@ -113,7 +119,9 @@ class VectorStoreImpl(VectorStoreFacade):
                 exact_match_map[doc.metadata['Name']] = _index
 
         # Check if serialized FAISS index exists
-        serialized_index_file = os.path.join(data_source_dir, "vector_index.pkl")
+        # Local stand-in embeddings live in a different vector space, so they get their own index file
+        index_file_name = "vector_index_local.pkl" if BEDROCK_BACKEND == "local" else "vector_index.pkl"
+        serialized_index_file = os.path.join(data_source_dir, index_file_name)
         logging.info(f"{tag} / Serialized index file {serialized_index_file}")
         if os.path.exists(serialized_index_file):
             logging.info(f"{tag} / Serialized file {serialized_index_file} already exists. Loading...")
@@ -138,9 +146,11 @@ class VectorStoreImpl(VectorStoreFacade):
             except Exception as e:
                 logging.error(f"{tag} / Failed to create FAISS vector store: {e}")
         faiss_creation_event.set()
+        VECTOR_INDEX_DOCUMENTS.set(vectorstore_faiss_doc.index.ntotal)
+        response_cache.set_index_version(index_version(vectorstore_faiss_doc))
         first_5_items = list(exact_match_map.items())[:5]
         logging.info(f"{tag} / First 5 items of exact_match_map: {first_5_items}")
-        return bedrock_embeddings, vectorstore_faiss_doc, exact_match_map, df, llm
+        return bedrock_embeddings, vectorstore_faiss_doc, exact_match_map, df, models
 
     def parallel_search(self, queries: List[str], k: int = 5, search_type: str = "similarity", num_threads: int = 5) -> List[List[Document]]:
         logging.info("Starting parallel search")
@@ -152,33 +162,15 @@ class VectorStoreImpl(VectorStoreFacade):
         def search_faiss(query: str) -> List[Document]:
             query = query.upper().strip()
             logging.info(f"{tag} / Searching for query: {query}")
-            # Find all product codes that are 5-7 characters long and include at least 2 numbers and 2 letters
-            product_codes = re.findall(r'\b[A-Za-z0-9]{5,7}\b', query)
-            filtered_codes = [code for code in product_codes if
-                              sum(c.isdigit() for c in code) >= 2 and sum(c.isalpha() for c in code) >= 2]
-
-            logging.info(f"{tag} / Found product codes: {filtered_codes}")
 
             # Check for exact match first
-            documents = []
-            match_found = False
-            for code in filtered_codes:
-                if code in self.exact_match_map:
-                    logging.info(f"{tag} / Exact match found for product: {code}")
-                    index = self.exact_match_map[code]
-                    # Get the document ID
-                    doc_id = self.vectorstore_faiss_doc.index_to_docstore_id[index]
-                    logging.info(f"{tag} / Document ID for exact match: {doc_id}")
-
-                    # Retrieve the document from the docstore using the document ID
-                    document = self.vectorstore_faiss_doc.docstore.search(doc_id)
-                    logging.info(f"{tag} / Document retrieved for exact match: {document}")
-                    documents.append(document)
-                    match_found = True
-            if not match_found:
+            with span("exact_match"):
+                documents = self.exact_match_documents(query)
+            if not documents:
                 logging.info(f"{tag} / No exact match found for products. Performing FAISS search.")
-                # Fallback to FAISS search
-                faiss_results = self.vectorstore_faiss_doc.search(query, k=k, search_type=search_type)
+                # Fallback to FAISS search, which embeds the query itself
+                with span("faiss_search", includes_embedding=True):
+                    faiss_results = self.vectorstore_faiss_doc.search(query, k=k, search_type=search_type)
                 logging.info(f"{tag} / FAISS search results for query '{query}': {faiss_results}")
                 return faiss_results
             else:
@@ -187,6 +179,78 @@ class VectorStoreImpl(VectorStoreFacade):
         logging.info("Initializing ThreadPoolExecutor")
         with ThreadPoolExecutor(max_workers=num_threads) as executor:
             logging.info("Starting search using ThreadPoolExecutor")
-            results = list(executor.map(search_faiss, queries))
+            results = list(executor.map(bind_context(search_faiss), queries))
         logging.info(f"{tag} / Search completed with results: {results}")
         return results
+
+    def parallel_search_with_scores(self, queries: list[str], k: int = 5, num_threads: int = 5) -> list[list[tuple[Document, float]]]:
+        """Like parallel_search, but each document comes with its cosine similarity to the query.
+
+        Exact product-code matches are returned with a score of 1.0.
+        """
+        logging.info(f"{tag} / Starting scored parallel search for queries: {queries} with k: {k}")
+
+        def search_faiss_with_scores(query: str) -> list[tuple[Document, float]]:
+            query = query.upper().strip()
+            with span("exact_match"):
+                documents = self.exact_match_documents(query)
+            if documents:
+                return [(document, 1.0) for document in documents]
+            with span("retrieval_cache"):
+                cached = response_cache.get("retrieval", [query, k])
+            if cached is not None:
+                return self.documents_at(cached)
+            with span("embedding"):
+                embedding = self.vectorstore_faiss_doc.embeddings.embed_query(query)
+            with span("faiss_search"):
+                scored_positions = self.scored_positions_by_vector(embedding, k)
+            # Only index positions are cached, the documents themselves are already in memory; positions are stable
+            # within an index version, which namespaces the cache
+            response_cache.set("retrieval", [query, k], scored_positions)
+            return self.documents_at(scored_positions)
+
+        # Keep the request's trace and cancellation token in the pool threads
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            results = list(executor.map(bind_context(search_faiss_with_scores), queries))
+        return results
+
+    def exact_match_documents(self, query: str) -> list[Document]:
+        documents = []
+        filtered_codes = extract_product_codes(query)
+        logging.info(f"{tag} / Found product codes: {filtered_codes}")
+        for code in filtered_codes:
+            if code in self.exact_match_map:
+                logging.info(f"{tag} / Exact match found for product: {code}")
+                index = self.exact_match_map[code]
+                # Get the document ID
+                doc_id = self.vectorstore_faiss_doc.index_to_docstore_id[index]
+                logging.info(f"{tag} / Document ID for exact match: {doc_id}")
+
+                # Retrieve the document from the docstore using the document ID
+                document = self.vectorstore_faiss_doc.docstore.search(doc_id)
+                logging.info(f"{tag} / Document retrieved for exact match: {document}")
+                documents.append(document)
+        return documents
+
+    def scored_positions_by_vector(self, embedding: list[float], k: int) -> list[tuple[int, float]]:
+        """Search the FAISS index and score hits by cosine similarity, which unlike the raw L2 distance
+        does not depend on whether the stored embeddings are normalized."""
+        index = self.vectorstore_faiss_doc.index
+        query_vector = np.array([embedding], dtype=np.float32)
+        _, indices = index.search(query_vector, k)
+        query_norm = np.linalg.norm(query_vector[0]) or 1.0
+
+        scored_positions = []
+        for i in indices[0]:
+            if i == -1:
+                continue
+            stored_vector = index.reconstruct(int(i))
+            score = float(np.dot(query_vector[0], stored_vector) / (query_norm * (np.linalg.norm(stored_vector) or 1.0)))
+            scored_positions.append((int(i), score))
+        return scored_positions
+
+    def documents_at(self, scored_positions) -> list[tuple[Document, float]]:
+        return [
+            (self.vectorstore_faiss_doc.docstore.search(self.vectorstore_faiss_doc.index_to_docstore_id[int(position)]), score)
+            for position, score in scored_positions
+        ]
@@ -7,8 +7,14 @@ from typing import Optional
 import boto3
 from botocore.config import Config
 
+from modules.vector_index.vector_utils.bedrock_limiter import LimitedBedrockClient, bedrock_limiter, bedrock_retry_budget
+from modules.vector_index.vector_utils.local_bedrock import LocalBedrockRuntimeClient
+
 tag = "BedrockClientManager"
 
+# "aws" calls Amazon Bedrock; "local" serves embeddings and completions offline for load tests and benchmarks
+BEDROCK_BACKEND = os.getenv("BEDROCK_BACKEND", "aws")
+
 
 class BedrockClientManager:
     def __init__(self, refresh_interval: int = 850): # 15 minutes - 5 seconds
@@ -58,6 +64,11 @@ class BedrockClientManager:
         runtime :
             Optional choice of getting different client to perform operations with the Amazon Bedrock service.
         """
+        if BEDROCK_BACKEND == "local" and runtime:
+            logging.info(f"{tag} / Using the local Bedrock stand-in, no AWS calls will be made")
+            max_attempts = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3"))
+            return LimitedBedrockClient(LocalBedrockRuntimeClient.from_env(), bedrock_limiter, bedrock_retry_budget, max_attempts=max_attempts)
+
         aws_access_key_id = os.getenv("AWS_ACCESS_KEY_ID")
         aws_secret_access_key = os.getenv("AWS_SECRET_ACCESS_KEY")
         bedrock_assume_role = os.getenv("BEDROCK_ASSUME_ROLE")
@@ -75,10 +86,13 @@ class BedrockClientManager:
             logging.info(f"{tag} / Using profile: {profile_name}")
             session_kwargs["profile_name"] = profile_name
 
+        # Runtime calls make a single attempt: the LimitedBedrockClient wrapping them retries throttling, 5xx answers and
+        # connection failures, backing off with jitter under a retry budget. The control-plane client is not wrapped and
+        # keeps botocore's standard retries
         retry_config = Config(
             region_name=target_region,
             retries={
-                "max_attempts": 10,
+                "total_max_attempts": 1 if runtime else 3,
                 "mode": "standard",
             },
         )
@@ -100,4 +114,7 @@ class BedrockClientManager:
 
         logging.info("boto3 Bedrock client successfully created!")
         logging.info(bedrock_client._endpoint)
+        if runtime:
+            max_attempts = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3"))
+            return LimitedBedrockClient(bedrock_client, bedrock_limiter, bedrock_retry_budget, max_attempts=max_attempts)
         return bedrock_client
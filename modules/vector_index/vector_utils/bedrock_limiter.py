@@ -0,0 +1,241 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+from modules.metrics import (
+    BEDROCK_ADMISSION_REJECTIONS,
+    BEDROCK_CALL_DURATION,
+    BEDROCK_CALLS,
+    BEDROCK_CONCURRENCY_LIMIT,
+    BEDROCK_IN_FLIGHT,
+    BEDROCK_THROTTLES,
+    BEDROCK_TOKENS,
+)
+from modules.vector_index.vector_utils.cancellation import check_cancelled, current_cancellation
+
+tag = "bedrock_limiter"
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+TRANSIENT_ERROR_CODES = {"ServiceUnavailableException", "ModelNotReadyException", "InternalServerException"}
+# Connection failures and timeouts; the runtime client makes a single attempt, so these are retried here
+TRANSIENT_EXCEPTIONS = (BotocoreConnectionError, HTTPClientError)
+LIMITED_OPERATIONS = {"invoke_model", "invoke_model_with_response_stream"}
+
+
+class BedrockCapacityError(RuntimeError):
+    """Raised instead of queueing or retrying further when Bedrock has no capacity left for this worker."""
+
+    def __init__(self, reason):
+        super().__init__(f"BedrockCapacityError: {reason}")
+
+
+def error_code(error):
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def is_retryable(error):
+    """Throttling, a 5xx answer or a failed connection: worth another attempt under the retry budget."""
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return True
+    if error_code(error) in THROTTLING_ERROR_CODES | TRANSIENT_ERROR_CODES:
+        return True
+    return isinstance(error, ClientError) and error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency window shared by all Bedrock calls of this worker.
+
+    Each successful call grows the window by increase / limit (about +increase per window of calls); a throttle halves it
+    and a call much slower than the model's usual latency shrinks it gently. Callers wait at most queue_timeout seconds
+    for a slot before failing fast.
+    """
+
+    def __init__(
+        self,
+        initial_limit=8,
+        min_limit=1,
+        max_limit=64,
+        increase=1.0,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+        latency_decrease_factor=0.9,
+        queue_timeout=5.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.latency_decrease_factor = latency_decrease_factor
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.latency_baselines = {}
+        self._condition = threading.Condition()
+        BEDROCK_CONCURRENCY_LIMIT.set(self.limit)
+
+    def acquire(self, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout=timeout):
+                BEDROCK_ADMISSION_REJECTIONS.labels(reason="queue_timeout").inc()
+                raise BedrockCapacityError(
+                    f"no Bedrock capacity within {timeout:.1f}s (limit {int(self.limit)}, in flight {self.in_flight})"
+                )
+            self.in_flight += 1
+            BEDROCK_IN_FLIGHT.set(self.in_flight)
+
+    def release(self, model_id, latency, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            BEDROCK_IN_FLIGHT.set(self.in_flight)
+            baseline = self.latency_baselines.get(model_id)
+
+            if throttled:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                logging.warning(f"{tag}/ Throttled by Bedrock, concurrency limit decreased to {self.limit:.2f}")
+            elif baseline is not None and latency > baseline * self.latency_tolerance:
+                self.limit = max(self.min_limit, self.limit * self.latency_decrease_factor)
+                logging.info(f"{tag}/ {model_id} latency {latency:.2f}s over baseline {baseline:.2f}s, limit now {self.limit:.2f}")
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+            if not throttled:
+                self.latency_baselines[model_id] = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+            BEDROCK_CONCURRENCY_LIMIT.set(self.limit)
+            self._condition.notify_all()
+
+    def abandon(self):
+        """Return a slot that was never used for a call, leaving the window and latency baselines as they are."""
+        with self._condition:
+            self.in_flight -= 1
+            BEDROCK_IN_FLIGHT.set(self.in_flight)
+            self._condition.notify_all()
+
+
+class RetryBudget:
+    """Allows retries only up to ratio of recent requests, so retries cannot multiply load while Bedrock is throttling."""
+
+    def __init__(self, ratio=0.1, min_tokens=3, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class LimitedBedrockClient:
+    """Wraps a boto3 bedrock-runtime client so every model invocation goes through the limiter and retry budget.
+
+    All other attributes are passed through to the wrapped client.
+    """
+
+    def __init__(self, client, limiter, retry_budget, max_attempts=3, base_backoff=0.5, max_backoff=8.0):
+        self._client = client
+        self.limiter = limiter
+        self.retry_budget = retry_budget
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name in LIMITED_OPERATIONS:
+            return lambda **kwargs: self._invoke(name, attribute, **kwargs)
+        return attribute
+
+    def _invoke(self, name, operation, **kwargs):
+        model_id = kwargs.get("modelId", "")
+        token = current_cancellation.get()
+        self.retry_budget.deposit()
+        for attempt in range(1, self.max_attempts + 1):
+            check_cancelled("bedrock_call")
+            self.limiter.acquire()
+            if token is not None and token.cancelled:
+                # Superseded while queued for a slot; hand the slot straight back
+                self.limiter.abandon()
+                token.raise_if_cancelled("bedrock_call")
+            start_time = time.time()
+            try:
+                response = operation(**kwargs)
+            except (ClientError, *TRANSIENT_EXCEPTIONS) as e:
+                code = error_code(e) or type(e).__name__
+                throttled = code in THROTTLING_ERROR_CODES
+                self.limiter.release(model_id, time.time() - start_time, throttled=throttled)
+                BEDROCK_CALLS.labels(model=model_id, outcome="throttled" if throttled else "error").inc()
+                if throttled:
+                    BEDROCK_THROTTLES.inc()
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_attempts:
+                    BEDROCK_ADMISSION_REJECTIONS.labels(reason="max_attempts").inc()
+                    raise BedrockCapacityError(f"{code} from {model_id} after {attempt} attempts") from e
+                if not self.retry_budget.withdraw():
+                    BEDROCK_ADMISSION_REJECTIONS.labels(reason="retry_budget").inc()
+                    raise BedrockCapacityError(f"{code} from {model_id} and the retry budget is spent") from e
+                # Full jitter keeps throttled callers from retrying in lockstep
+                backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)))
+                logging.info(f"{tag}/ {code} from {model_id}, retrying attempt {attempt + 1} in {backoff:.2f}s")
+                if token is None:
+                    time.sleep(backoff)
+                elif token.wait(backoff):
+                    token.raise_if_cancelled("bedrock_retry")
+            except Exception:
+                self.limiter.release(model_id, time.time() - start_time)
+                BEDROCK_CALLS.labels(model=model_id, outcome="error").inc()
+                raise
+            else:
+                latency = time.time() - start_time
+                self.limiter.release(model_id, latency)
+                record_success(model_id, latency, response)
+                if name == "invoke_model_with_response_stream" and token is not None:
+                    response = {**response, "body": cancellable_stream(response["body"], token)}
+                return response
+
+
+def record_success(model_id, latency, response):
+    BEDROCK_CALLS.labels(model=model_id, outcome="success").inc()
+    BEDROCK_CALL_DURATION.labels(model=model_id).observe(latency)
+    # Bedrock reports token usage in response headers; streaming responses report it in the last event instead
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {}) if isinstance(response, dict) else {}
+    for direction in ("input", "output"):
+        tokens = headers.get(f"x-amzn-bedrock-{direction}-token-count")
+        if tokens:
+            BEDROCK_TOKENS.labels(model=model_id, direction=direction).inc(int(tokens))
+
+
+def cancellable_stream(events, token):
+    """Yield stream events until the token is cancelled, then close the underlying HTTP stream."""
+    try:
+        for event in events:
+            token.raise_if_cancelled("bedrock_stream")
+            yield event
+    finally:
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
+
+
+bedrock_limiter = AdaptiveConcurrencyLimiter(
+    initial_limit=int(os.getenv("BEDROCK_INITIAL_CONCURRENCY", "8")),
+    max_limit=int(os.getenv("BEDROCK_MAX_CONCURRENCY", "64")),
+    queue_timeout=float(os.getenv("BEDROCK_QUEUE_TIMEOUT_SECONDS", "5")),
+)
+bedrock_retry_budget = RetryBudget(ratio=float(os.getenv("BEDROCK_RETRY_BUDGET_RATIO", "0.1")))
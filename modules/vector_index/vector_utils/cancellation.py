@@ -0,0 +1,55 @@
+import contextvars
+import logging
+import threading
+import time
+
+from modules.metrics import CANCELLED_PIPELINE_STAGES
+
+tag = "cancellation"
+
+
+class PipelineCancelled(Exception):
+    """Raised inside the chat pipeline once the question it is answering has been superseded."""
+
+    def __init__(self, stage):
+        super().__init__(f"PipelineCancelled: stopped before {stage}")
+        self.stage = stage
+
+
+class CancellationToken:
+    """Thread-safe flag shared between the request coroutine and the worker thread running its pipeline.
+
+    asyncio can cancel the coroutine awaiting a thread but not the thread itself, so the pipeline checks this token
+    between stages and before every Bedrock call and stops cooperatively.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.created_at = time.time()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds, returning True early if the token is cancelled meanwhile."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self, stage):
+        if self.cancelled:
+            CANCELLED_PIPELINE_STAGES.labels(stage=stage).inc()
+            logging.info(f"{tag}/ Superseded work stopped before {stage}, {time.time() - self.created_at:.2f}s after it started")
+            raise PipelineCancelled(stage)
+
+
+# asyncio.to_thread copies the caller's context, so a token set by the request coroutine is visible in its worker thread
+current_cancellation = contextvars.ContextVar("current_cancellation", default=None)
+
+
+def check_cancelled(stage):
+    token = current_cancellation.get()
+    if token is not None:
+        token.raise_if_cancelled(stage)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import re
+
+from modules.vector_index.vector_utils.token_utils import estimate_tokens, truncate_to_tokens
+
+tag = "chat_history"
+
+MAX_RECENT_TURNS = int(os.getenv("CHAT_HISTORY_MAX_RECENT_TURNS", "4"))
+MAX_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1000"))
+MAX_SUMMARY_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_SUMMARY_TOKENS", "300"))
+
+
+def compact_turn(question, message, customer_attributes=None, products=None):
+    """Build the stored form of a chat turn: the text exchanged plus product codes, not the full response_json."""
+    turn = {"user": question, "assistant": message or ""}
+    if customer_attributes:
+        turn["customer_attributes"] = customer_attributes
+    codes = [product.get("code") for product in products or [] if isinstance(product, dict) and product.get("code")]
+    if codes:
+        turn["codes"] = codes
+    return turn
+
+
+def format_turn(turn):
+    line = f"User: {turn['user']}\nAssistant: {turn['assistant']}"
+    if turn.get("codes"):
+        line += f"\nRecommended codes: {', '.join(turn['codes'])}"
+    return line
+
+
+def format_chat_history(chat_history, summary=None, max_tokens=MAX_HISTORY_TOKENS):
+    """Format the summary and the most recent turns for the prompt, newest turns first until max_tokens is used up."""
+    summary_text = f"Summary of earlier conversation: {summary}" if summary else ""
+    budget = max_tokens - estimate_tokens(summary_text)
+
+    lines = []
+    for turn in reversed(chat_history):
+        line = format_turn(turn)
+        cost = estimate_tokens(line)
+        if cost > budget:
+            break
+        lines.append(line)
+        budget -= cost
+    lines.reverse()
+
+    if summary_text:
+        lines.insert(0, summary_text)
+    return "\n".join(lines)
+
+
+class ChatHistoryManager:
+    """Keeps the last max_recent_turns turns of each session verbatim and folds older turns into a cached rolling summary.
+
+    Turns and summaries live in a session store (modules.session_store), so with the Redis store any worker can serve
+    any session.
+    """
+
+    def __init__(self, session_store, max_recent_turns=MAX_RECENT_TURNS, max_summary_tokens=MAX_SUMMARY_TOKENS):
+        self.session_store = session_store
+        self.max_recent_turns = max_recent_turns
+        self.max_summary_tokens = max_summary_tokens
+        self._summarizing = set()
+
+    # The store may be Redis, so its calls run in a thread rather than on the event loop
+
+    async def get_history(self, session_id):
+        session = await asyncio.to_thread(self.session_store.load, session_id)
+        return (session["turns"], session["summary"]) if session else ([], None)
+
+    async def record_turn(self, session_id, question, message, customer_attributes=None, products=None):
+        """Store a turn; returns the number of turns in the session afterwards."""
+        turn = compact_turn(question, message, customer_attributes, products)
+        return await asyncio.to_thread(self.session_store.append_turn, session_id, turn)
+
+    async def clear(self, session_id):
+        await asyncio.to_thread(self.session_store.clear, session_id)
+
+    def needs_summary(self, turn_count):
+        return turn_count > self.max_recent_turns
+
+    async def summarize(self, session_id, llm):
+        """Fold turns older than the last max_recent_turns into the session summary.
+
+        Runs after the response has been sent, so the LLM call never sits on the request path.
+        """
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        try:
+            session = await asyncio.to_thread(self.session_store.load, session_id)
+            if session is None or len(session["turns"]) <= self.max_recent_turns:
+                return
+            older_turns = session["turns"][: len(session["turns"]) - self.max_recent_turns]
+
+            summary = await asyncio.to_thread(self.build_summary, session["summary"], older_turns, llm)
+
+            # Drop only the turns that were folded in; the history may have been cleared, folded by another worker or
+            # extended meanwhile, which the store detects from the generation read above
+            folded = await asyncio.to_thread(self.session_store.fold, session_id, session["generation"], len(older_turns), summary)
+            if folded:
+                logging.info(f"{tag}/ Folded {len(older_turns)} turns into summary for session_id: {session_id}")
+        except Exception as e:
+            logging.error(f"{tag}/ Error summarizing chat history for session_id {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    def build_summary(self, previous_summary, turns, llm):
+        conversation = "\n".join(format_turn(turn) for turn in turns)
+        summary_prompt = f"""Human: Update the summary of a conversation between a customer and a Grainger sales
+        assistant with the new turns below. Keep the customer's needs, attributes and the product codes discussed.
+        Use at most {self.max_summary_tokens * 3 // 4} words and return it inside the tags <summary></summary>.
+
+        Current summary: {previous_summary or "None"}
+
+        New turns:
+        {conversation}
+        Assistant:"""
+
+        summary = None
+        if llm is not None:
+            try:
+                result = re.search("<summary>(.*?)</summary>", llm(summary_prompt), re.DOTALL)
+                summary = result.group(1).strip() if result else None
+            except Exception as e:
+                logging.error(f"{tag}/ LLM summary failed, falling back to extractive summary: {e}")
+
+        if not summary:
+            questions = "; ".join(turn["user"] for turn in turns)
+            codes = [code for turn in turns for code in turn.get("codes", [])]
+            summary = " ".join(filter(None, [previous_summary, f"The customer asked: {questions}."]))
+            if codes:
+                summary += f" Products recommended: {', '.join(dict.fromkeys(codes))}."
+
+        return truncate_to_tokens(summary, self.max_summary_tokens)
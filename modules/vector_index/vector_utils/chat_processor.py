@@ -1,36 +1,85 @@
-import json
 import logging
+import os
+import re
 import sys
 import time
 
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 
+from modules.tracing import SpanCallbackHandler, annotate, current_trace, span
 from modules.vector_index.vector_implementations.VectorStoreImpl import VectorStoreImpl
+from modules.vector_index.vector_utils.bedrock_limiter import BedrockCapacityError
+from modules.vector_index.vector_utils.cancellation import PipelineCancelled, check_cancelled
+from modules.vector_index.vector_utils.chat_history import format_chat_history
+from modules.vector_index.vector_utils.context_builder import CANDIDATE_POOL, CatalogContextBuilder
 from modules.vector_index.vector_utils.custom_retriever import CustomRetriever
 from modules.vector_index.vector_utils.customer_attributes import extract_customer_attributes
-from modules.vector_index.vector_utils.response_parser import split_process_and_message_from_response
+from modules.vector_index.vector_utils.model_registry import route_llm
+from modules.vector_index.vector_utils.product_index import hydrate_products
+from modules.vector_index.vector_utils.response_parser import StreamingResponseParser, split_process_and_message_from_response
 
 tag = "chat_processor"
 
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
+# "compact" has the model return product codes only and fills in the product details from the catalog index;
+# "full" has the model write out the product description for every product
+OUTPUT_MODE = os.getenv("CHAT_OUTPUT_MODE", "compact")
 
-def process_chat_question_with_customer_attribute_identifier(question, vectorstore_faiss_doc, exact_match_map, llm, chat_history):
+# How a PipelineCancelled raised inside the Bedrock client reads once LangChain has wrapped it in a ValueError
+CANCELLED_STAGE = re.compile(r"PipelineCancelled: stopped before (\w+)")
+
+FULL_PRODUCTS_INSTRUCTION = """The output should be a json of the form <products>[{{"product": <description of the product from the 
+                catalog>, "code":<code of the product from the catalog>}}, ...]</products> for me to process."""
+
+COMPACT_PRODUCTS_INSTRUCTION = """The output should be a json list of only the codes of the products from the catalog in the 
+                form <products>["<code>", ...]</products> for me to process. Do not repeat the catalog descriptions."""
+
+
+class ResponseStreamHandler(BaseCallbackHandler):
+    """Feeds the answer to a StreamingResponseParser token by token while Bedrock streams it, so each product is
+    parsed as soon as it closes rather than after the whole completion has arrived."""
+
+    def __init__(self):
+        self.parser = None
+        self.tokens = 0
+        self.first_product_seconds = None
+        self._start_time = None
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.parser = StreamingResponseParser()
+        self.tokens = 0
+        self.first_product_seconds = None
+        self._start_time = time.time()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.parser is None:
+            return
+        self.tokens += 1
+        if self.parser.feed(token) and self.first_product_seconds is None:
+            self.first_product_seconds = time.time() - self._start_time
+
+
+def process_chat_question_with_customer_attribute_identifier(
+    question, vectorstore_faiss_doc, exact_match_map, llm, chat_history, history_summary=None, product_index=None
+):
     start_time = time.time()
+    compact_output = OUTPUT_MODE == "compact" and product_index is not None
+    products_instruction = COMPACT_PRODUCTS_INSTRUCTION if compact_output else FULL_PRODUCTS_INSTRUCTION
 
-    prompt_template = """Human: Extract a list of products (do not repeat or duplicate) and their respective Codes 
+    prompt_template = f"""Human: Extract a list of products (do not repeat or duplicate) and their respective Codes 
                         from catalog that answer the user question.
                 The catalog of products is provided under <catalog></catalog> tags below.
                 <catalog>
-                {context}
+                {{context}}
                 </catalog>
-                Question: {question}
+                Question: {{question}}
 
-                The output should be a json of the form <products>[{{"product": <description of the product from the 
-                catalog>, "code":<code of the product from the catalog>}}, ...]</products> for me to process.
+                {products_instruction}
                 Also, provide a user-readable message responding in full to the question speaking as a friendly 
-                salesperson chatbot with all the of the information to display to the user in the form <response>{{message}}</response>.
+                salesperson chatbot with all the of the information to display to the user in the form <response>{{{{message}}}}</response>.
                 Skip the preamble and always return valid json including empty json if no products are found.
                 Assistant: """
 
@@ -42,10 +91,11 @@ def process_chat_question_with_customer_attribute_identifier(question, vectorsto
 
     # Create the VectorStoreImpl instance
     vectorstore_impl = VectorStoreImpl((vectorstore_faiss_doc, exact_match_map))
-    custom_retriever = CustomRetriever(vectorstore_impl=vectorstore_impl, k=6)
+    # The builder picks how many of the candidates go into the prompt from their scores
+    custom_retriever = CustomRetriever(vectorstore_impl=vectorstore_impl, k=CANDIDATE_POOL, context_builder=CatalogContextBuilder())
 
     search_index_get_answer_from_llm = RetrievalQA.from_chain_type(
-        llm=llm,
+        llm=route_llm(llm, "answer"),
         chain_type="stuff",
         retriever=custom_retriever,
         return_source_documents=False,
@@ -53,7 +103,9 @@ def process_chat_question_with_customer_attribute_identifier(question, vectorsto
     )
 
     try:
-        customer_attributes_retrieved = extract_customer_attributes(question, llm)
+        check_cancelled("attributes")
+        with span("attributes"):
+            customer_attributes_retrieved = extract_customer_attributes(question, route_llm(llm, "attributes"))
         time_to_get_attributes = time.time() - start_time
         customer_input_with_attributes = f"{question} {str(customer_attributes_retrieved)}"
 
@@ -65,38 +117,42 @@ def process_chat_question_with_customer_attribute_identifier(question, vectorsto
             if not isinstance(entry, dict) or "user" not in entry or "assistant" not in entry:
                 raise ValueError("Each entry in chat history must be a dictionary with 'user' and 'assistant' keys.")
 
-        # Format chat history for the prompt
-        formatted_chat_history = "\n".join(
-            [f"User: {msg['user']}\nAssistant: {msg['assistant']}" for msg in chat_history])
+        # Format the rolling summary and recent turns for the prompt, capped at the history token budget
+        # The callback records stuffing the retrieved documents into the prompt as prompt_build
+        with span("history_format"):
+            formatted_chat_history = format_chat_history(chat_history, history_summary)
         context = {"query": customer_input_with_attributes, "chat_history": formatted_chat_history}
 
-        llm_retrieval_augmented_response = search_index_get_answer_from_llm.run(**context)
-        message, product_list_as_json = split_process_and_message_from_response(llm_retrieval_augmented_response)
-
-        logging.info(f"{tag}/ product_list_as_json: {product_list_as_json}")
-        try:
-            # Convert to string if not already
-            if isinstance(product_list_as_json, dict):
-                product_list_as_json = json.dumps(product_list_as_json)
-            # Attempt to load JSON directly
-            product_list_as_json = json.loads(product_list_as_json)
-            logging.info(f"{tag}/ product_list_as_json processed")
-        except json.JSONDecodeError:
-            logging.warning(f"{tag}/ Invalid JSON format detected. Attempting to fix.")
-            try:
-                # Attempt to fix JSON format by replacing single quotes with double quotes
-                fixed_json_str = product_list_as_json.replace("'", '"')
-                product_list_as_json = json.loads(fixed_json_str)
-                logging.info(f"{tag}/ Fixed JSON: {product_list_as_json}")
-            except json.JSONDecodeError as e:
-                logging.error(f"{tag}/ Failed to fix JSON format: {str(e)}")
-                product_list_as_json = None
+        # Retrieval records its own spans; the callback adds the prompt stuffing and the generation itself
+        trace = current_trace.get()
+        stream_handler = ResponseStreamHandler()
+        callbacks = [stream_handler] + ([SpanCallbackHandler(trace)] if trace is not None else [])
+        check_cancelled("generation")
+        llm_retrieval_augmented_response = search_index_get_answer_from_llm.run(**context, callbacks=callbacks)
+        check_cancelled("parsing")
+        with span("parsing"):
+            if stream_handler.tokens:
+                # The products were parsed as the answer streamed in; only the tail is left
+                message, product_list_as_json = stream_handler.parser.close()
+                annotate(first_product_seconds=stream_handler.first_product_seconds)
+            else:
+                message, product_list_as_json = split_process_and_message_from_response(llm_retrieval_augmented_response)
+            logging.info(f"{tag}/ product_list_as_json: {product_list_as_json}")
+
+            if compact_output and isinstance(product_list_as_json, dict):
+                product_list_as_json = hydrate_products(product_list_as_json, product_index)
 
         return message, product_list_as_json, str(customer_attributes_retrieved), time_to_get_attributes
 
     except ValueError as error:
         end_time = time.time()
         print("Time for process_chat_question:", end_time - start_time)
+        # LangChain wraps errors raised inside the Bedrock client, including a cancellation, in a ValueError
+        cancelled = CANCELLED_STAGE.search(str(error))
+        if cancelled:
+            # Already counted at the stage that stopped it; restore the type without counting it again
+            raise PipelineCancelled(cancelled.group(1)) from error
+        check_cancelled("generation")
         if "AccessDeniedException" in str(error):
 
             class StopExecution(ValueError):
@@ -107,5 +163,8 @@ def process_chat_question_with_customer_attribute_identifier(question, vectorsto
                     super().__init__(message)
 
             raise StopExecution(str(error)) from error
+        elif "BedrockCapacityError" in str(error):
+            # LangChain re-raises client errors as ValueError; restore the type so the endpoint can answer 503
+            raise BedrockCapacityError(str(error).split("BedrockCapacityError: ", 1)[-1]) from error
         else:
             raise error
@@ -0,0 +1,67 @@
+import logging
+import re
+import time
+
+from modules.vector_index.vector_implementations.VectorStoreImpl import extract_product_codes
+from modules.vector_index.vector_utils.product_index import hydrate_products
+
+tag = "code_lookup"
+
+# Words that may surround product codes in a question that is only asking what those products are
+LOOKUP_WORDS = {
+    "a", "about", "an", "and", "any", "are", "can", "code", "codes", "describe", "details", "do", "find", "for", "get",
+    "give", "have", "i", "info", "information", "is", "item", "items", "look", "lookup", "me", "number", "numbers", "of",
+    "on", "or", "part", "please", "product", "products", "see", "show", "sku", "skus", "tell", "the", "these", "this",
+    "up", "what", "whats", "what's", "which", "you",
+}
+
+
+def match_code_lookup(question, product_index):
+    """Return the product codes of a question that only asks about known product codes, otherwise None.
+
+    A question qualifies when, after removing its product codes, nothing but lookup filler words is left and every
+    code is in the catalog. Anything else (a need, a comparison, an unknown code) goes through the LLM pipeline.
+    """
+    if product_index is None or not isinstance(question, str):
+        return None
+
+    codes = list(dict.fromkeys(extract_product_codes(question)))
+    if not codes or any(code not in product_index for code in codes):
+        return None
+
+    code_set = set(codes)
+    remaining_words = [word for word in re.findall(r"[a-z0-9']+", question.lower()) if word.upper() not in code_set]
+    if any(word not in LOOKUP_WORDS for word in remaining_words):
+        return None
+    return codes
+
+
+def describe_product(product):
+    description = f"{product['code']} is the {product['product']}"
+    if product["brand"]:
+        description += f" by {product['brand']}"
+    if product["price"]:
+        description += f", priced at {product['price']}"
+    return description + "."
+
+
+def answer_code_lookup(question, product_index):
+    """Answer a pure product-code lookup straight from the catalog without calling Bedrock.
+
+    Returns the same (message, response_json, customer_attributes, time_to_get_attributes) tuple as the LLM pipeline,
+    or None when the question is not a pure lookup.
+    """
+    start_time = time.time()
+    codes = match_code_lookup(question, product_index)
+    if codes is None:
+        return None
+
+    response_json = hydrate_products({"products": codes}, product_index)
+    descriptions = [describe_product(product) for product in response_json["products"]]
+    if len(descriptions) == 1:
+        message = f"Here is the product you asked about: {descriptions[0]}"
+    else:
+        message = "Here are the products you asked about: " + " ".join(descriptions)
+
+    logging.info(f"{tag}/ Answered lookup for {codes} from the catalog in {(time.time() - start_time) * 1000:.2f} ms")
+    return message, response_json, str({}), 0.0
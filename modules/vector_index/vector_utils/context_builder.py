@@ -0,0 +1,119 @@
+import html
+import logging
+import os
+import re
+
+from langchain_core.documents import Document
+
+from modules.metrics import CATALOG_CONTEXT_TOKENS, RETRIEVAL_DEPTH
+from modules.tracing import annotate
+from modules.vector_index.vector_utils.token_utils import estimate_tokens, truncate_to_tokens
+
+tag = "context_builder"
+
+MIN_RELEVANCE_SCORE = float(os.getenv("CATALOG_MIN_RELEVANCE_SCORE", "0.25"))
+# Hits scoring under this fraction of the best hit are dropped, so one strong match is not padded with weak ones
+RELATIVE_SCORE_CUTOFF = float(os.getenv("CATALOG_RELATIVE_SCORE_CUTOFF", "0.75"))
+# Retrieval fetches CANDIDATE_POOL scored hits and keeps between MIN_DEPTH and MAX_DEPTH of them
+CANDIDATE_POOL = int(os.getenv("CATALOG_CANDIDATE_POOL", "12"))
+MIN_DEPTH = int(os.getenv("CATALOG_MIN_DEPTH", "1"))
+MAX_DEPTH = int(os.getenv("CATALOG_MAX_DEPTH", "6"))
+MAX_DESCRIPTION_TOKENS = int(os.getenv("CATALOG_MAX_DESCRIPTION_TOKENS", "60"))
+DEDUPE_SIMILARITY = float(os.getenv("CATALOG_DEDUPE_SIMILARITY", "0.9"))
+# The prompt used to hold the top k=6 documents uncompressed; the logged savings are measured against that
+BASELINE_CONTEXT_DEPTH = 6
+
+
+def clean_description(description):
+    """Strip the HTML markup the catalog descriptions are stored with."""
+    if not isinstance(description, str):
+        return ""
+    text = html.unescape(re.sub(r"<[^>]+>", " ", description))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def name_tokens(document):
+    metadata = document.metadata
+    text = f"{metadata.get('Brand', '')} {metadata.get('Name', '')}".lower()
+    return set(re.findall(r"[a-z0-9]+", text))
+
+
+class CatalogContextBuilder:
+    """Compresses retrieved catalog documents before they are stuffed into the <catalog> section of the prompt.
+
+    Near-identical products are collapsed to the highest-scoring one. The retrieval depth then adapts to the scores:
+    hits are kept while they score at least min_score and at least relative_cutoff of the best hit, within min_depth
+    and max_depth. Each description is cut to max_description_tokens.
+    """
+
+    def __init__(
+        self,
+        min_score=MIN_RELEVANCE_SCORE,
+        max_description_tokens=MAX_DESCRIPTION_TOKENS,
+        dedupe_similarity=DEDUPE_SIMILARITY,
+        relative_cutoff=RELATIVE_SCORE_CUTOFF,
+        min_depth=MIN_DEPTH,
+        max_depth=MAX_DEPTH,
+    ):
+        self.min_score = min_score
+        self.max_description_tokens = max_description_tokens
+        self.dedupe_similarity = dedupe_similarity
+        self.relative_cutoff = relative_cutoff
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+
+    def build(self, scored_documents):
+        ranked = sorted(scored_documents, key=lambda scored: scored[1], reverse=True)
+
+        unique = []
+        for document, score in ranked:
+            if any(self.is_near_duplicate(document, kept_document) for kept_document, _ in unique):
+                logging.info(f"{tag}/ Dropping near-duplicate product {document.metadata.get('Code')}")
+                continue
+            unique.append((document, score))
+
+        depth = self.select_depth([score for _, score in unique])
+        kept = unique[:depth]
+        compressed = [self.compress(document, score) for document, score in kept]
+
+        tokens_before = sum(estimate_tokens(document.page_content) for document, _ in ranked[:BASELINE_CONTEXT_DEPTH])
+        tokens_after = sum(estimate_tokens(document.page_content) for document in compressed)
+        RETRIEVAL_DEPTH.observe(depth)
+        CATALOG_CONTEXT_TOKENS.observe(tokens_after)
+        annotate(retrieval_candidates=len(scored_documents), retrieval_depth=depth, catalog_tokens=tokens_after)
+        logging.info(
+            f"{tag}/ Catalog context: {len(scored_documents)} -> {len(compressed)} documents, "
+            f"{tokens_after} tokens ({tokens_before - tokens_after} saved over the top {BASELINE_CONTEXT_DEPTH} uncompressed)"
+        )
+        return compressed
+
+    def select_depth(self, scores):
+        """How many of the hits, sorted by descending score, go into the prompt."""
+        if not scores:
+            return 0
+        best = scores[0]
+        depth = 0
+        for score in scores[: self.max_depth]:
+            if depth >= self.min_depth and (score < self.min_score or score < best * self.relative_cutoff):
+                logging.info(f"{tag}/ Cutting retrieval at depth {depth}: score {score:.3f}, best {best:.3f}")
+                break
+            depth += 1
+        return depth
+
+    def is_near_duplicate(self, document, other):
+        if document.metadata.get("Code") and document.metadata.get("Code") == other.metadata.get("Code"):
+            return True
+        tokens, other_tokens = name_tokens(document), name_tokens(other)
+        if not tokens or not other_tokens:
+            return False
+        return len(tokens & other_tokens) / len(tokens | other_tokens) >= self.dedupe_similarity
+
+    def compress(self, document, score):
+        metadata = document.metadata
+        if "Code" not in metadata:
+            return Document(page_content=truncate_to_tokens(document.page_content, self.max_description_tokens), metadata=metadata)
+
+        description = truncate_to_tokens(clean_description(metadata.get("Description")), self.max_description_tokens)
+        fields = [metadata.get("Code"), metadata.get("Name"), metadata.get("Brand"), metadata.get("Price"), description]
+        page_content = " ".join(str(field).strip() for field in fields if isinstance(field, str) and field.strip())
+        return Document(page_content=page_content, metadata={**metadata, "score": score})
@@ -17,15 +17,23 @@ logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 class CustomRetriever(BaseRetriever):
     vectorstore_impl: Any
     k: int = Field(default=6)
+    context_builder: Any = None
 
-    def __init__(self, vectorstore_impl: Any, k: int = 6, **data: Any):
+    def __init__(self, vectorstore_impl: Any, k: int = 6, context_builder: Any = None, **data: Any):
         super().__init__(**data)
         self.vectorstore_impl = vectorstore_impl
         self.k = k
+        self.context_builder = context_builder
 
     def _get_relevant_documents(
         self, query: str, *, run_manager: CallbackManagerForRetrieverRun
     ) -> List[Document]:
+        if self.context_builder is not None:
+            scored_results = self.vectorstore_impl.parallel_search_with_scores([query], k=self.k)
+            documents = self.context_builder.build(scored_results[0])
+            logging.info(f"{tag} / Retrieved {len(documents)} compressed documents: {documents}")
+            return documents
+
         results = self.vectorstore_impl.parallel_search([query], k=self.k)
         if results is not None and results[0] is not None:
             logging.info(f"{tag} / Retrieved {len(results[0])} documents: {results[0]}")
@@ -1,10 +1,8 @@
 import json
 import re
-import time
 
 
 def extract_customer_attributes(customer_input, llm):
-    start_time = time.time()
     ner_prompt = f"""Human: Find industry, size, Sustainability Focus, Inventory Manager, and the location in the 
     customer input. 
     Instructions: 
@@ -44,10 +42,6 @@ def extract_customer_attributes(customer_input, llm):
         else:
             print("No attributes found")
             attributes = {}
-        end_time = time.time()
-        print("Time for extract_customer_attributes:", end_time - start_time)
         return attributes
     else:
-        end_time = time.time()
-        print("Time for extract_customer_attributes:", end_time - start_time)
         return {}
@@ -0,0 +1,171 @@
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from modules.vector_index.vector_utils.token_utils import estimate_tokens
+
+tag = "local_bedrock"
+
+TITAN_EMBEDDING_DIMENSIONS = 1536
+STREAM_CHUNK_WORDS = 8
+
+
+def hash_embedding(text, dimensions=TITAN_EMBEDDING_DIMENSIONS):
+    """Deterministic stand-in for Titan embeddings.
+
+    Word unigrams and bigrams are hashed into signed buckets (a sparse random projection of the bag of words), so texts
+    sharing words end up close by cosine similarity. The vector is L2 normalized like Titan's.
+    """
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    features = words + [f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1)]
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return vector.tolist()
+    return (vector / norm).tolist()
+
+
+def parse_catalog(prompt):
+    """Return (code, description) for every catalog entry stuffed into a RetrievalQA prompt."""
+    # The instructions mention the empty <catalog></catalog> tags before the filled-in catalog, so take the last one
+    catalogs = re.findall(r"<catalog>(.*?)</catalog>", prompt, re.DOTALL)
+    if not catalogs:
+        return []
+    entries = []
+    for block in re.split(r"\n\s*\n", catalogs[-1]):
+        parts = block.strip().split(" ", 1)
+        if parts[0]:
+            entries.append((parts[0], parts[1][:80] if len(parts) > 1 else ""))
+    return entries
+
+
+def scripted_completion(prompt, max_products=3):
+    """Well-formed completion for each prompt the service sends to Claude, built from the prompt itself."""
+    if "<attributes>" in prompt:
+        return " <attributes>{}</attributes>"
+    if "<summary>" in prompt:
+        words = set(re.findall(r"\b[A-Z0-9]{5,7}\b", prompt))
+        codes = sorted(word for word in words if sum(c.isdigit() for c in word) >= 2 and sum(c.isalpha() for c in word) >= 2)
+        return f" <summary>The customer is looking for products; codes discussed: {', '.join(codes) or 'none'}.</summary>"
+
+    entries = parse_catalog(prompt)[:max_products]
+    question = re.search(r"Question:\s*(.*)", prompt)
+    question = question.group(1).strip() if question else ""
+    # The full output mode asks for {"product": ..., "code": ...} objects, the compact mode for codes only
+    full_output = '"code":' in prompt
+    products = [{"product": description, "code": code} if full_output else code for code, description in entries]
+    if products:
+        message = f"Here are {len(entries)} products from our catalog that match \"{question}\"."
+    else:
+        message = f"I could not find products in our catalog that match \"{question}\"."
+    return f" <products>{json.dumps(products)}</products><response>{message}</response>"
+
+
+class LatencyModel:
+    """Log-normal latency with the given median, plus a per-output-token cost for generation."""
+
+    def __init__(self, median_seconds, sigma=0.3, seconds_per_output_token=0.0):
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+        self.seconds_per_output_token = seconds_per_output_token
+
+    def sample(self, rng, output_tokens=0):
+        if self.median_seconds <= 0:
+            return output_tokens * self.seconds_per_output_token
+        return self.median_seconds * math.exp(self.sigma * rng.gauss(0, 1)) + output_tokens * self.seconds_per_output_token
+
+
+class LocalBedrockRuntimeClient:
+    """Offline stand-in for the boto3 bedrock-runtime client used for load tests and benchmarks.
+
+    Serves Titan embedding requests with hash_embedding and Claude requests with scripted_completion, in the same
+    response shapes as Bedrock, so LangChain, the limiter and the rest of the pipeline run unchanged. Latency follows
+    the configured distributions and throttle_rate of the calls fail with a ThrottlingException.
+    """
+
+    def __init__(self, llm_latency=None, embedding_latency=None, throttle_rate=0.0, seed=None):
+        self.llm_latency = llm_latency or LatencyModel(0.0)
+        self.embedding_latency = embedding_latency or LatencyModel(0.0)
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            llm_latency=LatencyModel(
+                float(os.getenv("LOCAL_BEDROCK_LLM_LATENCY_SECONDS", "1.0")),
+                float(os.getenv("LOCAL_BEDROCK_LLM_LATENCY_SIGMA", "0.3")),
+                float(os.getenv("LOCAL_BEDROCK_SECONDS_PER_OUTPUT_TOKEN", "0.01")),
+            ),
+            embedding_latency=LatencyModel(
+                float(os.getenv("LOCAL_BEDROCK_EMBEDDING_LATENCY_SECONDS", "0.05")),
+                float(os.getenv("LOCAL_BEDROCK_EMBEDDING_LATENCY_SIGMA", "0.2")),
+            ),
+            throttle_rate=float(os.getenv("LOCAL_BEDROCK_THROTTLE_RATE", "0")),
+            seed=int(os.environ["LOCAL_BEDROCK_SEED"]) if os.getenv("LOCAL_BEDROCK_SEED") else None,
+        )
+
+    def _simulate(self, operation_name, latency_model, output_tokens=0):
+        with self._lock:
+            throttled = self._random.random() < self.throttle_rate
+            latency = latency_model.sample(self._random, output_tokens)
+        if throttled:
+            # Bedrock rejects throttled calls quickly, before doing any work
+            time.sleep(min(latency, 0.05))
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation_name)
+        time.sleep(latency)
+
+    def _generate(self, operation_name, modelId, body):
+        request = json.loads(body)
+        if modelId.startswith("amazon.titan-embed"):
+            self._simulate(operation_name, self.embedding_latency)
+            input_text = request.get("inputText", "")
+            return {"embedding": hash_embedding(input_text), "inputTextTokenCount": estimate_tokens(input_text)}, input_text, ""
+        if modelId.startswith("anthropic."):
+            prompt = request.get("prompt", "")
+            completion = scripted_completion(prompt)
+            self._simulate(operation_name, self.llm_latency, estimate_tokens(completion))
+            return {"completion": completion, "stop_reason": "stop_sequence"}, prompt, completion
+        raise ClientError({"Error": {"Code": "ValidationException", "Message": f"Unsupported model {modelId}"}}, operation_name)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        payload, input_text, output_text = self._generate("InvokeModel", modelId, body)
+        return {
+            "body": io.BytesIO(json.dumps(payload).encode()),
+            "contentType": "application/json",
+            "ResponseMetadata": {
+                "HTTPHeaders": {
+                    "x-amzn-bedrock-input-token-count": str(estimate_tokens(input_text)),
+                    "x-amzn-bedrock-output-token-count": str(estimate_tokens(output_text)),
+                }
+            },
+        }
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        if not modelId.startswith("anthropic."):
+            raise ClientError(
+                {"Error": {"Code": "ValidationException", "Message": f"Streaming is not supported for {modelId}"}},
+                "InvokeModelWithResponseStream",
+            )
+        payload, _, completion = self._generate("InvokeModelWithResponseStream", modelId, body)
+        words = completion.split(" ")
+        pieces = [(" " if i else "") + " ".join(words[i : i + STREAM_CHUNK_WORDS]) for i in range(0, len(words), STREAM_CHUNK_WORDS)]
+        events = [{"chunk": {"bytes": json.dumps({"completion": piece}).encode()}} for piece in pieces]
+        events.append({"chunk": {"bytes": json.dumps({"completion": "", "stop_reason": payload["stop_reason"]}).encode()}})
+        logging.debug(f"{tag}/ Streaming {len(events)} events for {modelId}")
+        return {"body": iter(events), "contentType": "application/json"}
@@ -0,0 +1,101 @@
+import logging
+import os
+import time
+
+from langchain_aws import Bedrock
+from langchain_core.callbacks import BaseCallbackHandler
+
+from modules.metrics import MODEL_ROUTE_DURATION, MODEL_ROUTE_TOKENS
+
+tag = "model_registry"
+
+STOP_SEQUENCES = ["\n\n Human: bye"]
+
+
+class ModelRoute:
+    """The model and generation parameters one pipeline step calls Bedrock with."""
+
+    def __init__(self, model_id, max_tokens, temperature=0.0, top_p=0.5, top_k=250, streaming=False):
+        self.model_id = model_id
+        self.streaming = streaming
+        self.model_kwargs = {
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "max_tokens_to_sample": max_tokens,
+            "stop_sequences": STOP_SEQUENCES,
+        }
+
+
+def default_routes():
+    """Attribute extraction and history summaries are short, structured outputs a small fast model handles; the answer
+    needs the capable model and room for the product list and message."""
+    return {
+        "attributes": ModelRoute(
+            os.getenv("ATTRIBUTES_MODEL_ID", "anthropic.claude-instant-v1"), int(os.getenv("ATTRIBUTES_MAX_TOKENS", "300"))
+        ),
+        # Streamed, so the products are parsed while the rest of the answer is still being generated
+        "answer": ModelRoute(
+            os.getenv("ANSWER_MODEL_ID", "anthropic.claude-v2"),
+            int(os.getenv("ANSWER_MAX_TOKENS", "2000")),
+            streaming=os.getenv("ANSWER_STREAMING", "true").lower() == "true",
+        ),
+        "summary": ModelRoute(
+            os.getenv("SUMMARY_MODEL_ID", "anthropic.claude-instant-v1"), int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+        ),
+    }
+
+
+class RouteMetricsHandler(BaseCallbackHandler):
+    """Records latency and the token usage Bedrock reports for every call made through one route."""
+
+    def __init__(self, route, model_id):
+        self.route = route
+        self.model_id = model_id
+        self._starts = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.time()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        # langchain_aws reports the end of a call twice, only the first carries the usage
+        start_time = self._starts.pop(run_id, None)
+        if start_time is None:
+            return
+        MODEL_ROUTE_DURATION.labels(route=self.route, model=self.model_id).observe(time.time() - start_time)
+        usage = (response.llm_output or {}).get("usage") or {}
+        for direction, key in (("input", "prompt_tokens"), ("output", "completion_tokens")):
+            if usage.get(key):
+                MODEL_ROUTE_TOKENS.labels(route=self.route, model=self.model_id, direction=direction).inc(usage[key])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+class ModelRegistry:
+    """One LLM per pipeline step ("attributes", "answer", "summary"), all sharing the rate-limited Bedrock client."""
+
+    def __init__(self, client, routes=None):
+        self.routes = routes or default_routes()
+        self._llms = {
+            name: Bedrock(
+                model_id=route.model_id,
+                model_kwargs=route.model_kwargs,
+                client=client,
+                streaming=route.streaming,
+                callbacks=[RouteMetricsHandler(name, route.model_id)],
+            )
+            for name, route in self.routes.items()
+        }
+        for name, route in self.routes.items():
+            logging.info(f"{tag}/ Route {name}: {route.model_id}, max_tokens_to_sample={route.model_kwargs['max_tokens_to_sample']}")
+
+    def llm(self, route):
+        if route not in self._llms:
+            raise KeyError(f"{tag}/ Unknown model route {route}, expected one of {sorted(self._llms)}")
+        return self._llms[route]
+
+
+def route_llm(llm, route):
+    """The LLM for a pipeline step, from a ModelRegistry or a single LLM used for every step."""
+    return llm.llm(route) if isinstance(llm, ModelRegistry) else llm
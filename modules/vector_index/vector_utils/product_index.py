@@ -0,0 +1,70 @@
+import logging
+
+import pandas as pd
+
+tag = "product_index"
+
+
+def clean_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+
+class ProductIndex:
+    """Catalog rows keyed by product code, built once when the catalog is loaded."""
+
+    def __init__(self, products):
+        self.products = products
+
+    @classmethod
+    def from_dataframe(cls, df):
+        products = {}
+        for row in df.to_dict("records"):
+            code = clean_value(row.get("Code")).upper()
+            if not code or code in products:
+                continue
+            products[code] = {
+                "code": code,
+                "name": clean_value(row.get("Name")),
+                "brand": clean_value(row.get("Brand")),
+                "price": clean_value(row.get("Price")),
+                "image_url": clean_value(row.get("PictureUrl600")),
+            }
+        logging.info(f"{tag}/ Indexed {len(products)} products")
+        return cls(products)
+
+    def get(self, code):
+        if not isinstance(code, str):
+            return None
+        return self.products.get(code.strip().upper())
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __len__(self):
+        return len(self.products)
+
+
+def hydrate_products(response_json, product_index):
+    """Fill in product name, brand, price and image URL from the catalog for the codes the model returned.
+
+    Codes that are not in the catalog are dropped, since the model was asked to answer from the catalog only.
+    """
+    hydrated = []
+    for product in response_json.get("products", []):
+        code = product.get("code") if isinstance(product, dict) else product
+        details = product_index.get(code)
+        if details is None:
+            logging.warning(f"{tag}/ Dropping product code not found in catalog: {code}")
+            continue
+        hydrated.append(
+            {
+                "product": details["name"] or (product.get("product", "") if isinstance(product, dict) else ""),
+                "code": details["code"],
+                "brand": details["brand"],
+                "price": details["price"],
+                "image_url": details["image_url"],
+            }
+        )
+    return {**response_json, "products": hydrated}
@@ -1,85 +1,324 @@
 import json
+import logging
 import re
-import time
 
+tag = "response_parser"
 
-def split_process_and_message_from_response(recs_response):
-    start_time = time.time()
-    recs_response = recs_response.strip()
+RESPONSE_OPEN, RESPONSE_CLOSE = "<response>", "</response>"
+PRODUCTS_OPEN, PRODUCTS_CLOSE = "<products>", "</products>"
 
-    message_match = re.search("<response>(.*?)</response>", recs_response, re.DOTALL)
-    message = message_match.group(1).strip() if message_match else None
+# Element-level repairs, applied only to a product that failed to parse on its own
+JSON_STRING = re.compile(r'("(?:[^"\\]|\\.)*")')
+BARE_KEY = re.compile(r'([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:')
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+PYTHON_LITERAL = re.compile(r'(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]]|\s*$)')
+BARE_CODE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9\-]*$")
 
-    if "<products>" in recs_response and "</products>" in recs_response:
-        json_content = recs_response[recs_response.index("<products>") + len("<products>") : recs_response.index("</products>")].strip()
 
-        try:
-            parsed_response = json.loads(json_content)
+def normalize_product(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (str, int, float)):
+        # Compact output mode: the model returns codes only and the details are hydrated from the catalog
+        return {"product": "", "code": str(value)}
+    if isinstance(value, dict):
+        code = value.get("code", "")
+        return {"product": value.get("product", ""), "code": code if isinstance(code, str) else str(code)}
+    return None
 
-            if isinstance(parsed_response, list):
-                products_list = []
-                for product_info in parsed_response:
-                    product_data = {"product": product_info.get("product", ""), "code": product_info.get("code", "")}
-                    products_list.append(product_data)
 
-                response_json = {"products": products_list}
-                end_time = time.time()
-                print("Time for split_process_and_message_from_response:", end_time - start_time)
-                return message, response_json
-            else:
-                print("Error: Unexpected format of parsed response")
-                end_time = time.time()
-                print("Time for split_process_and_message_from_response:", end_time - start_time)
-                return None, None
-
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {str(e)}")
-            end_time = time.time()
-            print("Time for split_process_and_message_from_response:", end_time - start_time)
+def repair_element(text):
+    # Odd segments are string literals, which are left alone so names like "Wrench, Bolts: 18" survive
+    segments = JSON_STRING.split(text)
+    for i in range(0, len(segments), 2):
+        segment = BARE_KEY.sub(r'\1"\2":', segments[i])
+        segment = PYTHON_LITERAL.sub(lambda match: PYTHON_LITERALS[match.group(1)], segment)
+        segments[i] = TRAILING_COMMA.sub(r"\1", segment)
+    return "".join(segments)
+
+
+def parse_element(text, kind):
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+    if kind == "scalar":
+        text = text.strip().strip("`")
+        return text if BARE_CODE.match(text) else None
+    try:
+        return json.loads(repair_element(text), strict=False)
+    except json.JSONDecodeError as e:
+        logging.warning(f"{tag}/ Skipping unparseable product {text!r}: {e}")
+        return None
+
+
+class StreamingResponseParser:
+    """Incremental parser for the <response>...</response><products>[...]</products> completions.
+
+    Chunks are consumed once, in order, as they arrive: the <response> text is collected and every product is
+    emitted by feed() as soon as its element of the product list closes. Each product is parsed on its own, so a
+    malformed one is repaired or skipped without losing the others. Tolerated defects: single-quoted and smart-quoted
+    strings (apostrophes inside names are kept), raw newlines in strings, trailing and missing commas, bare keys,
+    Python literals, bare codes, and a list cut off by max_tokens.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._state = "outside"
+        self._message_parts = []
+        self.message = None
+        self.products = []
+        self.products_opened = False
+        self.products_valid = True
+        # Scanner state inside <products>
+        self._mode = "before_array"
+        self._element = None
+        self._kind = None
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+
+    def feed(self, chunk):
+        """Consume a chunk of the completion and return the products completed by it."""
+        self._pending += chunk
+        return self._consume(final=False)
+
+    def close(self):
+        """Consume the rest of the input and return (message, {"products": [...]}), or (None, None) without a
+        product list, like split_process_and_message_from_response."""
+        self._consume(final=True)
+        if self._state == "response":
+            self.message = "".join(self._message_parts).strip()
+        if self._state == "products" and self._kind == "scalar":
+            self._finish_element([])
+        if not self.products_opened or not self.products_valid:
+            logging.warning(f"{tag}/ No product list in the response")
             return None, None
-    else:
-        print("Error: Unexpected format of recs_response")
-        end_time = time.time()
-        print("Time for split_process_and_message_from_response:", end_time - start_time)
-        return None, None
-
-
-# def split_process_and_message_from_response(recs_response):
-#     start_time = time.time()
-#     recs_response = recs_response.strip()
-#
-#     message_match = re.search("<response>(.*?)</response>", recs_response, re.DOTALL)
-#     message = message_match.group(1).strip() if message_match else None
-#
-#     if "<products>" in recs_response and "</products>" in recs_response:
-#         json_content = recs_response[recs_response.index("<products>") + len("<products>") : recs_response.index("</products>")].strip()
-#
-#         try:
-#             parsed_response = json.loads(json_content)
-#
-#             if isinstance(parsed_response, list):
-#                 products_list = []
-#                 for product_info in parsed_response:
-#                     product_data = {"product": product_info.get("product", ""), "code": product_info.get("code", "")}
-#                     products_list.append(product_data)
-#
-#                 response_json = {"products": products_list}
-#                 end_time = time.time()
-#                 print("Time for split_process_and_message_from_response:", end_time - start_time)
-#                 return message, response_json
-#             else:
-#                 print("Error: Unexpected format of parsed response")
-#                 end_time = time.time()
-#                 print("Time for split_process_and_message_from_response:", end_time - start_time)
-#                 return None, None
-#
-#         except json.JSONDecodeError as e:
-#             print(f"Error decoding JSON: {str(e)}")
-#             end_time = time.time()
-#             print("Time for split_process_and_message_from_response:", end_time - start_time)
-#             return None, None
-#     else:
-#         print("Error: Unexpected format of recs_response")
-#         end_time = time.time()
-#         print("Time for split_process_and_message_from_response:", end_time - start_time)
-#         return None, None
+        return self.message, {"products": self.products}
+
+    def _consume(self, final):
+        completed = []
+        while True:
+            if self._state == "outside":
+                if not self._consume_outside(final):
+                    break
+            elif self._state == "response":
+                if not self._consume_response(final):
+                    break
+            elif not self._consume_products(final, completed):
+                break
+        return completed
+
+    def _consume_outside(self, final):
+        positions = [(self._pending.find(opening), opening) for opening in (RESPONSE_OPEN, PRODUCTS_OPEN)]
+        positions = [(position, opening) for position, opening in positions if position >= 0]
+        if not positions:
+            # Keep what could be the start of a tag split across chunks
+            keep = 0 if final else len(PRODUCTS_OPEN) - 1
+            self._pending = self._pending[-keep:] if keep else ""
+            return False
+        position, opening = min(positions)
+        self._pending = self._pending[position + len(opening) :]
+        if opening == RESPONSE_OPEN:
+            self._state = "response"
+            self._message_parts = []
+        else:
+            self._state = "products"
+            self._mode = "before_array"
+            self.products_opened = True
+        return True
+
+    def _consume_response(self, final):
+        position = self._pending.find(RESPONSE_CLOSE)
+        if position >= 0:
+            self._message_parts.append(self._pending[:position])
+            self.message = "".join(self._message_parts).strip()
+            self._pending = self._pending[position + len(RESPONSE_CLOSE) :]
+            self._state = "outside"
+            return True
+        keep = 0 if final else len(RESPONSE_CLOSE) - 1
+        split = max(len(self._pending) - keep, 0)
+        self._message_parts.append(self._pending[:split])
+        self._pending = self._pending[split:]
+        return False
+
+    def _consume_products(self, final, completed):
+        text = self._pending
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if self._quote is None and c == "<":
+                if text.startswith(PRODUCTS_CLOSE, i):
+                    self._close_products(completed)
+                    self._pending = text[i + len(PRODUCTS_CLOSE) :]
+                    return True
+                if not final and PRODUCTS_CLOSE.startswith(text[i:]):
+                    break
+
+            if self._mode in ("invalid", "after_array"):
+                i += 1
+            elif self._mode == "before_array":
+                if not final and len(text) - i < 4 and "json".startswith(text[i:]):
+                    break
+                if c == "[":
+                    self._mode = "array"
+                elif not (c.isspace() or c == "`" or text.startswith("json", i)):
+                    logging.warning(f"{tag}/ Product list is not a JSON list")
+                    self.products_valid = False
+                    self._mode = "invalid"
+                i += 4 if text.startswith("json", i) else 1
+            elif self._element is None:
+                i = self._start_element(c, i)
+            else:
+                consumed = self._scan_element(text, i, final, completed)
+                if consumed == 0:
+                    break
+                i += consumed
+        self._pending = text[i:]
+        return False
+
+    def _start_element(self, c, i):
+        if c == "]":
+            self._mode = "after_array"
+        elif c.isspace() or c == ",":
+            pass
+        elif c == "{":
+            self._element, self._kind, self._depth = ["{"], "object", 1
+        elif c in "\"'“":
+            self._element, self._kind, self._depth = ['"'], "string", 0
+            self._quote = "”" if c == "“" else c
+        else:
+            # A bare scalar, e.g. a code the model did not quote
+            self._element, self._kind, self._depth = [], "scalar", 0
+            return i
+        return i + 1
+
+    def _scan_element(self, text, i, final, completed):
+        """Consume characters of the current element starting at i, normalizing them to JSON; returns how many were
+        consumed, 0 when more input is needed to decide."""
+        c = text[i]
+        element = self._element
+        if self._quote is not None:
+            if self._escape:
+                if c == "'":
+                    # \' is not a JSON escape, the apostrophe needs none
+                    element[-1] = "'"
+                else:
+                    element.append(c)
+                self._escape = False
+            elif c == "\\":
+                element.append(c)
+                self._escape = True
+            elif self._quote == "'" and c == "'":
+                # An apostrophe closes a single-quoted string only if JSON structure follows it
+                j = i + 1
+                while j < len(text) and text[j].isspace():
+                    j += 1
+                if j == len(text) and not final:
+                    return 0
+                if j == len(text) or text[j] in ",:}]<":
+                    self._close_string(completed)
+                else:
+                    element.append("'")
+            elif c == self._quote:
+                self._close_string(completed)
+            elif c == '"':
+                element.append('\\"')
+            elif c == "\n":
+                element.append("\\n")
+            else:
+                element.append(c)
+            return 1
+
+        if self._kind == "scalar":
+            if c.isspace() or c in ",]":
+                self._finish_element(completed)
+                if c == "]":
+                    self._mode = "after_array"
+            else:
+                element.append(c)
+        elif c in "\"'“":
+            self._quote = "”" if c == "“" else c
+            element.append('"')
+        elif c in "{[":
+            self._depth += 1
+            element.append(c)
+        elif c in "}]":
+            while element and element[-1].isspace():
+                element.pop()
+            if element and element[-1] == ",":
+                element.pop()
+            self._depth -= 1
+            element.append(c)
+            if self._depth == 0:
+                self._finish_element(completed)
+        else:
+            element.append(c)
+        return 1
+
+    def _close_string(self, completed):
+        self._element.append('"')
+        self._quote = None
+        if self._kind == "string":
+            self._finish_element(completed)
+
+    def _finish_element(self, completed):
+        product = normalize_product(parse_element("".join(self._element), self._kind))
+        self._element, self._kind, self._depth = None, None, 0
+        if product is not None:
+            self.products.append(product)
+            completed.append(product)
+
+    def _close_products(self, completed):
+        if self._kind == "scalar":
+            self._finish_element(completed)
+        elif self._element is not None:
+            logging.warning(f"{tag}/ Dropping incomplete product {''.join(self._element)!r}")
+            self._element, self._kind, self._depth, self._quote = None, None, 0, None
+        self._state = "outside"
+        self._mode = "done"
+
+
+class TolerantValueScanner(StreamingResponseParser):
+    """Applies the same repairs to a standalone JSON value instead of the elements of a product list."""
+
+    def __init__(self):
+        super().__init__()
+        self._state, self._mode, self.products_opened = "products", "array", True
+        self.values = []
+
+    def _start_element(self, c, i):
+        # The top-level value may itself be a list, which the product scanner would take for the list it is inside
+        if c == "[":
+            self._element, self._kind, self._depth = ["["], "array", 1
+            return i + 1
+        return super()._start_element(c, i)
+
+    def _finish_element(self, completed):
+        self.values.append(parse_element("".join(self._element), self._kind))
+        self._element, self._kind, self._depth = None, None, 0
+
+
+def loads_tolerant(text):
+    """json.loads for model output that may have single quotes, trailing commas or bare keys; None if unrepairable."""
+    scanner = TolerantValueScanner()
+    scanner.feed(text)
+    scanner.close()
+    return scanner.values[0] if scanner.values else None
+
+
+def iter_products(chunks):
+    """Yield products from a stream of completion chunks as soon as each one is complete."""
+    parser = StreamingResponseParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    emitted = len(parser.products)
+    parser.close()
+    yield from parser.products[emitted:]
+
+
+def split_process_and_message_from_response(recs_response):
+    parser = StreamingResponseParser()
+    parser.feed(recs_response)
+    return parser.close()
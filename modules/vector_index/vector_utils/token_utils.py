@@ -0,0 +1,15 @@
+def estimate_tokens(text):
+    """Rough token count for Anthropic models (~4 characters per token)."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to roughly max_tokens, preferring to break on a word boundary."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max_tokens * 4]
+    if " " in cut:
+        cut = cut[: cut.rindex(" ")]
+    return cut.rstrip() + "..."
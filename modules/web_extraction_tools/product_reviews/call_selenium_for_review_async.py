@@ -14,6 +14,8 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
+from modules.metrics import SELENIUM_SESSIONS, SELENIUM_SESSIONS_ACTIVE
+
 logging.basicConfig(level=logging.INFO)
 tag = "call_selenium_for_review_async.py"
 
@@ -89,8 +91,25 @@ async def async_navigate_to_reviews_selenium(product_id):
         # Ensure the ChromeDriver executable has the correct permissions
         os.chmod(chrome_driver_path, os.stat(chrome_driver_path).st_mode | stat.S_IEXEC)
 
-    driver = webdriver.Chrome(service=service, options=options)
+    try:
+        driver = await asyncio.to_thread(webdriver.Chrome, service=service, options=options)
+    except Exception:
+        SELENIUM_SESSIONS.labels(outcome="error").inc()
+        raise
+
+    SELENIUM_SESSIONS_ACTIVE.inc()
+    try:
+        reviews_data = await scrape_reviews(driver, product_id)
+    finally:
+        SELENIUM_SESSIONS_ACTIVE.dec()
+        # Every request starts its own browser, which has to be shut down or Chrome processes pile up
+        await asyncio.to_thread(driver.quit)
+    SELENIUM_SESSIONS.labels(outcome="reviews" if reviews_data else "no_reviews").inc()
+    return reviews_data
+
 
+async def scrape_reviews(driver, product_id):
+    """Search for the product, follow its reviews link and extract the reviews; [] if any step fails."""
     search_url = f'https://www.zoro.com/search?q={product_id}'
     try:
         # Navigate to the search results page and wait for the product link to appear
@@ -46,9 +46,18 @@ else
   exit 1
 fi
 
+# Chat sessions live in Redis so either gunicorn worker can serve any session
+export SESSION_STORE_BACKEND="${SESSION_STORE_BACKEND:-redis}"
+
+# Metrics from all gunicorn workers are aggregated through this directory; stale files from a previous run would be
+# counted again, so start from an empty one
+export PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus_multiproc
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # Start FastAPI on port 8000
 echo "Starting FastAPI Application on port $FASTAPI_PORT..."
-gunicorn modules.fast_api_main:app --workers 2 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:$FASTAPI_PORT --access-logfile - --timeout 60 &
+gunicorn modules.fast_api_main:app --config gunicorn.conf.py --workers 2 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:$FASTAPI_PORT --access-logfile - --timeout 60 &
 
 # Wait a few seconds for FastAPI to start
 sleep 5
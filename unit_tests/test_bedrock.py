@@ -8,6 +8,7 @@ import boto3
 from moto import mock_aws
 
 from modules.vector_index.vector_utils.bedrock import BedrockClientManager
+from modules.vector_index.vector_utils.bedrock_limiter import LimitedBedrockClient
 
 current_dir = os.path.dirname(__file__)
 project_root = os.path.abspath(os.path.join(current_dir, ".."))
@@ -89,6 +90,19 @@ class TestBedrockClientManager(unittest.TestCase):
             # Verify update_client_kwargs_with_credentials was called with the expected arguments
             mock_update.assert_called_once_with(mock_credentials, client_kwargs)
 
+    @patch.dict(os.environ, {"BEDROCK_ASSUME_ROLE": ""})
+    @patch("modules.vector_index.vector_utils.bedrock.boto3.Session")
+    def test_should_leave_retries_to_the_limited_client_only_for_runtime_calls(self, mock_session):
+        # Act
+        runtime_client = self.manager.get_bedrock_client(runtime=True)
+        self.manager.get_bedrock_client(runtime=False)
+
+        # Assert
+        runtime_config, control_plane_config = (call.kwargs["config"] for call in mock_session().client.call_args_list)
+        self.assertIsInstance(runtime_client, LimitedBedrockClient)
+        self.assertEqual(runtime_config.retries["total_max_attempts"], 1)
+        self.assertEqual(control_plane_config.retries["total_max_attempts"], 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,196 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+from modules.vector_index.vector_utils.bedrock_limiter import (
+    AdaptiveConcurrencyLimiter,
+    BedrockCapacityError,
+    LimitedBedrockClient,
+    RetryBudget,
+)
+
+
+def throttling_error():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "InvokeModel")
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+
+    def test_should_grow_window_additively_on_success(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+
+        # Act
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release("model", 1.0)
+
+        # Assert
+        self.assertAlmostEqual(limiter.limit, 5.0, delta=0.1)
+
+    def test_should_halve_window_on_throttle(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+        # Act
+        limiter.acquire()
+        limiter.release("model", 1.0, throttled=True)
+
+        # Assert
+        self.assertEqual(limiter.limit, 4.0)
+
+    def test_should_shrink_window_when_latency_exceeds_baseline(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, latency_tolerance=2.0, latency_decrease_factor=0.5)
+        limiter.acquire()
+        limiter.release("model", 1.0)
+        limit_after_baseline = limiter.limit
+
+        # Act
+        limiter.acquire()
+        limiter.release("model", 5.0)
+
+        # Assert
+        self.assertEqual(limiter.limit, limit_after_baseline * 0.5)
+
+    def test_should_never_drop_below_min_limit(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1)
+
+        # Act
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release("model", 1.0, throttled=True)
+
+        # Assert
+        self.assertEqual(limiter.limit, 1)
+
+    def test_should_fail_fast_when_no_slot_frees_up(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        limiter.acquire()
+
+        # Act & Assert
+        with self.assertRaises(BedrockCapacityError) as context:
+            limiter.acquire(timeout=0.01)
+        self.assertIn("no Bedrock capacity", str(context.exception))
+
+    def test_should_admit_waiter_when_slot_is_released(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release, args=("model", 0.05)).start()
+
+        # Act
+        limiter.acquire(timeout=1)
+
+        # Assert
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_should_leave_window_and_baseline_alone_when_slot_is_abandoned(self):
+        # Arrange
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+        limiter.acquire()
+        limiter.release("model", 1.0)
+        limit, baselines = limiter.limit, dict(limiter.latency_baselines)
+
+        # Act
+        limiter.acquire()
+        limiter.abandon()
+
+        # Assert
+        self.assertEqual((limiter.limit, limiter.latency_baselines, limiter.in_flight), (limit, baselines, 0))
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_should_refuse_retries_once_tokens_are_spent(self):
+        # Arrange
+        budget = RetryBudget(ratio=0.5, min_tokens=1, max_tokens=10)
+
+        # Act & Assert
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+
+
+class TestLimitedBedrockClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+
+    @patch("modules.vector_index.vector_utils.bedrock_limiter.time.sleep")
+    def test_should_retry_throttled_call_within_budget(self, mock_sleep):
+        # Arrange
+        self.client.invoke_model.side_effect = [throttling_error(), {"body": "ok"}]
+        limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget(min_tokens=3))
+
+        # Act
+        response = limited_client.invoke_model(modelId="anthropic.claude-v2", body="{}")
+
+        # Assert
+        self.assertEqual(response, {"body": "ok"})
+        self.assertEqual(self.client.invoke_model.call_count, 2)
+        self.assertEqual(self.limiter.in_flight, 0)
+        self.assertLess(self.limiter.limit, 4)
+
+    @patch("modules.vector_index.vector_utils.bedrock_limiter.time.sleep")
+    def test_should_fail_fast_when_retry_budget_is_spent(self, mock_sleep):
+        # Arrange
+        self.client.invoke_model.side_effect = throttling_error()
+        limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget(ratio=0.0, min_tokens=0))
+
+        # Act & Assert
+        with self.assertRaises(BedrockCapacityError) as context:
+            limited_client.invoke_model(modelId="anthropic.claude-v2", body="{}")
+        self.assertIn("retry budget is spent", str(context.exception))
+        self.assertEqual(self.client.invoke_model.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    @patch("modules.vector_index.vector_utils.bedrock_limiter.time.sleep")
+    def test_should_retry_connection_failures_and_server_errors_within_budget(self, mock_sleep):
+        # Arrange
+        server_error = ClientError({"Error": {"Code": "InternalFailure"}, "ResponseMetadata": {"HTTPStatusCode": 500}}, "InvokeModel")
+        self.client.invoke_model.side_effect = [
+            EndpointConnectionError(endpoint_url="https://bedrock-runtime"),
+            ReadTimeoutError(endpoint_url="https://bedrock-runtime"),
+            server_error,
+            {"body": "ok"},
+        ]
+        limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget(min_tokens=3), max_attempts=4)
+
+        # Act
+        response = limited_client.invoke_model(modelId="anthropic.claude-v2", body="{}")
+
+        # Assert
+        self.assertEqual(response, {"body": "ok"})
+        self.assertEqual(self.client.invoke_model.call_count, 4)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_should_not_retry_non_throttling_errors(self):
+        # Arrange
+        self.client.invoke_model.side_effect = ClientError({"Error": {"Code": "AccessDeniedException"}}, "InvokeModel")
+        limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget())
+
+        # Act & Assert
+        with self.assertRaises(ClientError):
+            limited_client.invoke_model(modelId="anthropic.claude-v2", body="{}")
+        self.assertEqual(self.client.invoke_model.call_count, 1)
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_should_pass_other_attributes_through(self):
+        # Arrange
+        self.client.meta.region_name = "us-east-1"
+        limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget())
+
+        # Act & Assert
+        self.assertEqual(limited_client.meta.region_name, "us-east-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
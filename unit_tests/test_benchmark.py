@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from utils.benchmark.run_benchmark import (
+    BenchmarkRecorder,
+    compare_reports,
+    load_question_mix,
+    parse_args,
+    percentile,
+    run_benchmark,
+    summarize_latencies,
+)
+
+
+def fake_service(request):
+    if request.url.path == "/ask_question":
+        body = {
+            "message": "ok",
+            "time_to_get_attributes": 0.2,
+            "timings": {"generation": 0.5},
+            "stats": {"retrieval_depth": 2},
+            "products": [{"product": "A", "code": "5TUR3"}],
+        }
+        return httpx.Response(200, json=body)
+    if request.url.path == "/images/manifest":
+        return httpx.Response(200, json={"images": [{"code": "5TUR3", "url": "http://test/images/5TUR3"}], "missing": []})
+    if request.url.path == "/fetch_images":
+        return httpx.Response(200, json=[{"code": "5TUR3", "image_data": "aW1hZ2U="}])
+    if request.url.path == "/images/5TUR3":
+        return httpx.Response(200, content=b"image bytes", headers={"Content-Type": "image/jpeg"})
+    return httpx.Response(500, json={"detail": "Error fetching reviews"})
+
+
+class TestBenchmarkStatistics(unittest.TestCase):
+
+    def test_should_compute_nearest_rank_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_should_summarize_latencies(self):
+        self.assertEqual(summarize_latencies([30, 10, 20]), {"p50": 20, "p95": 30, "p99": 30, "mean": 20.0, "max": 30})
+
+    def test_should_count_failures_as_errors_only(self):
+        # Arrange
+        recorder = BenchmarkRecorder()
+        recorder.started_at, recorder.finished_at = 0, 2
+
+        # Act
+        recorder.record("/ask_question", 100, 200)
+        recorder.record("/ask_question", 5, 503)
+        report = recorder.report({})
+
+        # Assert
+        stats = report["endpoints"]["/ask_question"]
+        self.assertEqual((stats["requests"], stats["errors"], stats["error_rate"]), (2, {"503": 1}, 0.5))
+        self.assertEqual(stats["throughput_rps"], 0.5)
+
+    def test_should_default_question_weight_to_one(self):
+        # Act
+        questions = load_question_mix(parse_args([]).questions)
+
+        # Assert
+        self.assertTrue(questions)
+        self.assertTrue(all(question["weight"] > 0 for question in questions))
+
+    def test_should_report_relative_changes_against_baseline(self):
+        # Arrange
+        baseline = {"endpoints": {"/ask_question": {"throughput_rps": 10, "latency_ms": {"p50": 100, "p95": 200, "p99": 400}}}}
+        current = {"endpoints": {"/ask_question": {"throughput_rps": 12, "latency_ms": {"p50": 90, "p95": 200, "p99": 500}}}}
+
+        # Act
+        comparison = compare_reports(baseline, current)
+
+        # Assert
+        self.assertEqual(comparison["/ask_question"], {"throughput_rps": 0.2, "p50": -0.1, "p95": 0.0, "p99": 0.25})
+
+
+class TestRunBenchmark(unittest.TestCase):
+
+    def test_should_drive_endpoints_and_report_per_endpoint_and_stage(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            questions = os.path.join(directory, "questions.jsonl")
+            with open(questions, "w") as file:
+                file.write(json.dumps({"question": "What is 5TUR3?", "weight": 2}) + "\n")
+            arguments = ["--questions", questions, "--concurrency", "2", "--requests", "6", "--base-url", "http://test"]
+            options = parse_args(arguments + ["--images", "--fetch-images", "--reviews"])
+
+            # Act
+            report = asyncio.run(run_benchmark(options, transport=httpx.MockTransport(fake_service)))
+
+        # Assert
+        self.assertEqual(report["endpoints"]["/ask_question"]["requests"], 6)
+        self.assertEqual(report["endpoints"]["/images/manifest"]["requests"], 6)
+        self.assertEqual(report["endpoints"]["/images/{code}"]["requests"], 6)
+        self.assertEqual(report["endpoints"]["/fetch_images"]["requests"], 6)
+        self.assertEqual(report["endpoints"]["/fetch_reviews"]["errors"], {"500": 6})
+        self.assertEqual(set(report["stages"]), {"attributes", "generation"})
+        self.assertEqual(report["stages"]["generation"]["p50"], 500.0)
+        self.assertEqual(report["stats"]["retrieval_depth"]["p50"], 2)
+        self.assertEqual(report["metadata"]["network_calls"], ["grainger_cdn", "zoro_reviews"])
+
+    def test_should_call_no_external_services_by_default(self):
+        # Arrange
+        with tempfile.TemporaryDirectory() as directory:
+            questions = os.path.join(directory, "questions.jsonl")
+            with open(questions, "w") as file:
+                file.write(json.dumps({"question": "What is 5TUR3?"}) + "\n")
+            options = parse_args(["--questions", questions, "--requests", "2", "--base-url", "http://test"])
+
+            # Act
+            report = asyncio.run(run_benchmark(options, transport=httpx.MockTransport(fake_service)))
+
+        # Assert
+        self.assertEqual(set(report["endpoints"]), {"/ask_question"})
+        self.assertEqual(report["metadata"]["network_calls"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from modules.vector_index.vector_utils.bedrock_limiter import AdaptiveConcurrencyLimiter, LimitedBedrockClient, RetryBudget
+from modules.vector_index.vector_utils.cancellation import (
+    CancellationToken,
+    PipelineCancelled,
+    check_cancelled,
+    current_cancellation,
+)
+
+
+class TestCancellationToken(unittest.TestCase):
+
+    def test_should_raise_with_stage_once_cancelled(self):
+        # Arrange
+        token = CancellationToken()
+        token.raise_if_cancelled("generation")
+
+        # Act
+        token.cancel()
+
+        # Assert
+        with self.assertRaises(PipelineCancelled) as context:
+            token.raise_if_cancelled("generation")
+        self.assertEqual(context.exception.stage, "generation")
+
+    def test_should_do_nothing_without_a_token_in_context(self):
+        contextvars.Context().run(check_cancelled, "generation")
+
+
+class TestCancellableBedrockClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+        self.limited_client = LimitedBedrockClient(self.client, self.limiter, RetryBudget())
+
+    def run_with_token(self, token, function, *args, **kwargs):
+        def run():
+            current_cancellation.set(token)
+            return function(*args, **kwargs)
+
+        return contextvars.Context().run(run)
+
+    def test_should_skip_bedrock_call_for_superseded_work(self):
+        # Arrange
+        token = CancellationToken()
+        token.cancel()
+
+        # Act & Assert
+        with self.assertRaises(PipelineCancelled):
+            self.run_with_token(token, self.limited_client.invoke_model, modelId="anthropic.claude-v2", body="{}")
+        self.client.invoke_model.assert_not_called()
+        self.assertEqual(self.limiter.in_flight, 0)
+
+    def test_should_stop_reading_stream_and_close_it_when_cancelled(self):
+        # Arrange
+        token = CancellationToken()
+        events = MagicMock()
+        events.__iter__.return_value = iter([{"chunk": 1}, {"chunk": 2}, {"chunk": 3}])
+        self.client.invoke_model_with_response_stream.return_value = {"body": events}
+        response = self.run_with_token(
+            token, self.limited_client.invoke_model_with_response_stream, modelId="anthropic.claude-v2", body="{}"
+        )
+        received = []
+
+        # Act & Assert
+        with self.assertRaises(PipelineCancelled):
+            for event in response["body"]:
+                received.append(event)
+                token.cancel()
+        self.assertEqual(received, [{"chunk": 1}])
+        events.close.assert_called_once()
+
+
+class TestThreadCancellation(unittest.IsolatedAsyncioTestCase):
+
+    async def test_should_stop_worker_thread_when_awaiting_coroutine_is_cancelled(self):
+        # Arrange
+        stopped = threading.Event()
+        started = threading.Event()
+
+        def pipeline():
+            started.set()
+            try:
+                while True:
+                    check_cancelled("generation")
+                    threading.Event().wait(0.01)
+            except PipelineCancelled:
+                stopped.set()
+                raise
+
+        async def run_pipeline():
+            cancellation = CancellationToken()
+            current_cancellation.set(cancellation)
+            try:
+                return await asyncio.to_thread(pipeline)
+            except asyncio.CancelledError:
+                cancellation.cancel()
+                raise
+
+        task = asyncio.create_task(run_pipeline())
+        await asyncio.to_thread(started.wait, 1)
+
+        # Act
+        task.cancel()
+
+        # Assert
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(await asyncio.to_thread(stopped.wait, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -97,7 +97,7 @@ async def test_process_question_task_success():
         assert response["message"] == "42"
         assert response["products"] == []
         assert session_id in session_store
-        assert len(session_store[session_id]) == 1
+        assert len(session_store.load(session_id)["turns"]) == 1
 
 
 @pytest.mark.asyncio
@@ -116,7 +116,7 @@ async def test_process_question_task_cancelled():
 # @pytest.mark.asyncio
 async def test_process_chat_question_success():
     session_id = "test-session-id"
-    session_store[session_id] = []
+    session_store.ensure(session_id)
 
     with patch("modules.rest_modules.endpoints.chat.process_chat_question_with_customer_attribute_identifier",
                return_value=("42", {"products": []}, None, None)):
@@ -127,7 +127,7 @@ async def test_process_chat_question_success():
         assert message == "42"
         assert response_json == {"products": []}
         assert session_id in session_store
-        assert len(session_store[session_id]) == 1
+        assert len(session_store.load(session_id)["turns"]) == 1
 
 # import asyncio
 # import unittest
@@ -0,0 +1,133 @@
+import unittest
+from unittest.mock import MagicMock
+
+from modules.session_store import InMemorySessionStore
+from modules.vector_index.vector_utils.chat_history import (
+    ChatHistoryManager,
+    compact_turn,
+    estimate_tokens,
+    format_chat_history,
+)
+
+
+class TestFormatChatHistory(unittest.TestCase):
+
+    def test_should_format_summary_before_recent_turns(self):
+        # Arrange
+        chat_history = [{"user": "Hello", "assistant": "Hi"}]
+
+        # Act
+        formatted = format_chat_history(chat_history, summary="Customer runs a warehouse.")
+
+        # Assert
+        self.assertEqual(formatted, "Summary of earlier conversation: Customer runs a warehouse.\nUser: Hello\nAssistant: Hi")
+
+    def test_should_keep_newest_turns_within_token_budget(self):
+        # Arrange
+        chat_history = [{"user": f"question {i} " + "x" * 200, "assistant": "answer"} for i in range(10)]
+
+        # Act
+        formatted = format_chat_history(chat_history, max_tokens=150)
+
+        # Assert
+        self.assertLessEqual(estimate_tokens(formatted), 150)
+        self.assertIn("question 9", formatted)
+        self.assertNotIn("question 0", formatted)
+
+    def test_should_store_codes_instead_of_full_products(self):
+        # Act
+        turn = compact_turn("Need gloves", "Here you go", "{}", [{"product": "Nitrile Gloves, long description", "code": "5TUR3"}])
+
+        # Assert
+        self.assertEqual(turn, {"user": "Need gloves", "assistant": "Here you go", "customer_attributes": "{}", "codes": ["5TUR3"]})
+
+
+class TestChatHistoryManager(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.session_store = InMemorySessionStore()
+        self.manager = ChatHistoryManager(self.session_store, max_recent_turns=2)
+
+    async def test_should_fold_older_turns_into_summary(self):
+        # Arrange
+        for i in range(4):
+            await self.manager.record_turn("session", f"question {i}", f"answer {i}")
+        mock_llm = MagicMock(return_value="<summary>Customer asked about questions 0 and 1.</summary>")
+
+        # Act
+        await self.manager.summarize("session", mock_llm)
+
+        # Assert
+        chat_history, summary = await self.manager.get_history("session")
+        self.assertEqual([turn["user"] for turn in chat_history], ["question 2", "question 3"])
+        self.assertEqual(summary, "Customer asked about questions 0 and 1.")
+
+    async def test_should_fall_back_to_extractive_summary_when_llm_fails(self):
+        # Arrange
+        for i in range(3):
+            await self.manager.record_turn("session", f"question {i}", f"answer {i}", products=[{"product": "p", "code": f"CODE{i}"}])
+        mock_llm = MagicMock(side_effect=ValueError("ThrottlingException"))
+
+        # Act
+        await self.manager.summarize("session", mock_llm)
+
+        # Assert
+        chat_history, summary = await self.manager.get_history("session")
+        self.assertEqual(len(chat_history), 2)
+        self.assertIn("question 0", summary)
+        self.assertIn("CODE0", summary)
+
+    async def test_should_not_summarize_short_history(self):
+        # Arrange
+        turn_count = await self.manager.record_turn("session", "question", "answer")
+        mock_llm = MagicMock()
+
+        # Act
+        await self.manager.summarize("session", mock_llm)
+
+        # Assert
+        self.assertFalse(self.manager.needs_summary(turn_count))
+        mock_llm.assert_not_called()
+        self.assertIsNone((await self.manager.get_history("session"))[1])
+
+    async def test_should_need_summary_beyond_recent_turns(self):
+        # Act
+        turn_counts = [await self.manager.record_turn("session", f"question {i}", f"answer {i}") for i in range(3)]
+
+        # Assert
+        self.assertEqual([self.manager.needs_summary(turn_count) for turn_count in turn_counts], [False, False, True])
+
+    async def test_should_clear_turns_and_summary(self):
+        # Arrange
+        for i in range(3):
+            await self.manager.record_turn("session", f"question {i}", f"answer {i}")
+        await self.manager.summarize("session", MagicMock(return_value="<summary>summary</summary>"))
+
+        # Act
+        await self.manager.clear("session")
+
+        # Assert
+        self.assertEqual(await self.manager.get_history("session"), ([], None))
+
+    async def test_should_discard_summary_when_history_cleared_meanwhile(self):
+        # Arrange
+        for i in range(3):
+            await self.manager.record_turn("session", f"question {i}", f"answer {i}")
+
+        def clear_then_summarize(prompt):
+            # Runs in the summary thread, as another request on the same session would meanwhile
+            self.session_store.clear("session")
+            self.session_store.append_turn("session", compact_turn("new question", "new answer"))
+            return "<summary>stale</summary>"
+
+        # Act
+        await self.manager.summarize("session", MagicMock(side_effect=clear_then_summarize))
+
+        # Assert
+        chat_history, summary = await self.manager.get_history("session")
+        self.assertEqual([turn["user"] for turn in chat_history], ["new question"])
+        self.assertIsNone(summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
 
+from modules.vector_index.vector_utils.cancellation import PipelineCancelled
 from modules.vector_index.vector_utils.chat_processor import process_chat_question_with_customer_attribute_identifier
 
 
@@ -21,7 +22,7 @@ class TestProcessChatQuestionWithCustomerAttributeIdentifier(unittest.TestCase):
         mock_search_index_get_answer_from_llm = MagicMock()
         mock_from_chain_type.return_value = mock_search_index_get_answer_from_llm
         mock_extract_attributes.return_value = {"attribute": "value"}
-        mock_split_process_and_message.return_value = ("message", '{"products": [{"product": "example", "code": "123"}]}')
+        mock_split_process_and_message.return_value = ("message", {"products": [{"product": "example", "code": "123"}]})
 
         question = "What products do you have?"
         document = mock_document
@@ -93,29 +94,23 @@ class TestProcessChatQuestionWithCustomerAttributeIdentifier(unittest.TestCase):
 
     @patch("time.time")
     @patch("modules.vector_index.vector_utils.chat_processor.extract_customer_attributes")
-    @patch("modules.vector_index.vector_utils.chat_processor.split_process_and_message_from_response")
     @patch("modules.vector_index.vector_utils.chat_processor.RetrievalQA.from_chain_type")
     def test_process_chat_question_with_customer_attribute_identifier_invalid_json_format(
-            self, mock_from_chain_type, mock_split_process_and_message, mock_extract_attributes, mock_time):
+            self, mock_from_chain_type, mock_extract_attributes, mock_time):
         # Arrange
         mock_time.side_effect = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19]
-        mock_llm = MagicMock()
-        mock_document = MagicMock()
-        mock_retriever = MagicMock()
-        mock_document.as_retriever.return_value = mock_retriever
         mock_search_index_get_answer_from_llm = MagicMock()
+        # Single-quoted, as the model sometimes writes it
+        mock_search_index_get_answer_from_llm.run.return_value = (
+            "<response>message</response><products>[{'product': 'example', 'code': '123'}]</products>"
+        )
         mock_from_chain_type.return_value = mock_search_index_get_answer_from_llm
         mock_extract_attributes.return_value = {"attribute": "value"}
-        mock_split_process_and_message.return_value = ("message", "{'products': [{'product': 'example', 'code': '123'}]}")  # Invalid JSON format
-
-        question = "What products do you have?"
-        document = mock_document
-        llm = mock_llm
         chat_history = [{"user": "Hello", "assistant": "Hi"}]
 
         # Act
         message, product_list_as_json, attributes, time_to_get_attributes = process_chat_question_with_customer_attribute_identifier(
-            question, document, {}, llm, chat_history)
+            "What products do you have?", MagicMock(), {}, MagicMock(), chat_history)
 
         # Assert
         self.assertEqual(message, "message")
@@ -123,6 +118,38 @@ class TestProcessChatQuestionWithCustomerAttributeIdentifier(unittest.TestCase):
         self.assertEqual(attributes, "{'attribute': 'value'}")
         self.assertEqual(time_to_get_attributes, 1)
 
+    @patch("modules.vector_index.vector_utils.chat_processor.extract_customer_attributes")
+    @patch("modules.vector_index.vector_utils.chat_processor.split_process_and_message_from_response")
+    @patch("modules.vector_index.vector_utils.chat_processor.RetrievalQA.from_chain_type")
+    def test_process_chat_question_with_customer_attribute_identifier_parses_streamed_answer(
+            self, mock_from_chain_type, mock_split_process_and_message, mock_extract_attributes):
+        # Arrange
+        chunks = [
+            '<response>Two wrenches</response><products>[{"product": "Pipe',
+            ' Wrench", "code": "5TUR3"},',
+            ' {"product": "Hex Key", "code": "1AAA1"}]</products>',
+        ]
+
+        def stream_answer(callbacks=None, **context):
+            handler = callbacks[0]
+            handler.on_llm_start({}, ["prompt"], run_id="run")
+            for chunk in chunks:
+                handler.on_llm_new_token(chunk)
+            return "".join(chunks)
+
+        mock_from_chain_type.return_value.run.side_effect = stream_answer
+        mock_extract_attributes.return_value = {}
+        chat_history = [{"user": "Hello", "assistant": "Hi"}]
+
+        # Act
+        message, product_list_as_json, _, _ = process_chat_question_with_customer_attribute_identifier(
+            "Do you have wrenches?", MagicMock(), {}, MagicMock(), chat_history)
+
+        # Assert
+        self.assertEqual(message, "Two wrenches")
+        self.assertEqual([product["code"] for product in product_list_as_json["products"]], ["5TUR3", "1AAA1"])
+        mock_split_process_and_message.assert_not_called()
+
     @patch("time.time")
     @patch("modules.vector_index.vector_utils.chat_processor.extract_customer_attributes")
     @patch("modules.vector_index.vector_utils.chat_processor.split_process_and_message_from_response")
@@ -149,6 +176,21 @@ class TestProcessChatQuestionWithCustomerAttributeIdentifier(unittest.TestCase):
             process_chat_question_with_customer_attribute_identifier(question, document, {}, llm, chat_history)
         self.assertIn("AccessDeniedException", str(context.exception))
 
+    @patch("modules.vector_index.vector_utils.chat_processor.check_cancelled")
+    @patch("modules.vector_index.vector_utils.chat_processor.extract_customer_attributes")
+    @patch("modules.vector_index.vector_utils.chat_processor.RetrievalQA.from_chain_type")
+    def test_process_chat_question_with_customer_attribute_identifier_wrapped_cancellation(
+            self, mock_from_chain_type, mock_extract_attributes, mock_check_cancelled):
+        # Arrange
+        mock_extract_attributes.side_effect = ValueError("Error raised by bedrock service: PipelineCancelled: stopped before bedrock_call")
+        chat_history = [{"user": "Hello", "assistant": "Hi"}]
+
+        # Act & Assert
+        with self.assertRaises(PipelineCancelled) as context:
+            process_chat_question_with_customer_attribute_identifier("What products do you have?", MagicMock(), {}, MagicMock(), chat_history)
+        self.assertEqual(context.exception.stage, "bedrock_call")
+        self.assertNotIn("generation", [call.args[0] for call in mock_check_cancelled.call_args_list])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+import pandas as pd
+
+from modules.vector_index.vector_utils.code_lookup import answer_code_lookup, match_code_lookup
+from modules.vector_index.vector_utils.product_index import ProductIndex
+
+
+def make_product_index():
+    return ProductIndex.from_dataframe(
+        pd.DataFrame(
+            [
+                {"Code": "5TUR3", "Name": "Pipe Wrench", "Brand": "Ridgid", "Price": "$42.00", "PictureUrl600": ""},
+                {"Code": "1AA11", "Name": "Claw Hammer", "Brand": "Estwing", "Price": "", "PictureUrl600": ""},
+            ]
+        )
+    )
+
+
+class TestMatchCodeLookup(unittest.TestCase):
+
+    def setUp(self):
+        self.product_index = make_product_index()
+
+    def test_should_match_lookup_style_questions(self):
+        self.assertEqual(match_code_lookup("What is 5TUR3?", self.product_index), ["5TUR3"])
+        self.assertEqual(match_code_lookup("5tur3, 1AA11", self.product_index), ["5TUR3", "1AA11"])
+        self.assertEqual(match_code_lookup("Tell me about product 5TUR3 and 5TUR3", self.product_index), ["5TUR3"])
+
+    def test_should_leave_questions_with_other_intent_to_the_llm(self):
+        self.assertIsNone(match_code_lookup("Is 5TUR3 good for plumbing?", self.product_index))
+        self.assertIsNone(match_code_lookup("I need gloves", self.product_index))
+
+    def test_should_leave_unknown_codes_to_the_llm(self):
+        self.assertIsNone(match_code_lookup("What is 5TUR3 and 9ZZ99?", self.product_index))
+
+
+class TestAnswerCodeLookup(unittest.TestCase):
+
+    def test_should_answer_from_catalog(self):
+        # Act
+        message, response_json, customer_attributes, time_to_get_attributes = answer_code_lookup(
+            "what is 5TUR3", make_product_index()
+        )
+
+        # Assert
+        self.assertEqual(message, "Here is the product you asked about: 5TUR3 is the Pipe Wrench by Ridgid, priced at $42.00.")
+        self.assertEqual([product["code"] for product in response_json["products"]], ["5TUR3"])
+        self.assertEqual((customer_attributes, time_to_get_attributes), ("{}", 0.0))
+
+    def test_should_return_none_when_not_a_lookup(self):
+        self.assertIsNone(answer_code_lookup("What wrench fits a 2 inch pipe?", make_product_index()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+import contextvars
+import os
+import unittest
+
+import pandas as pd
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from modules.tracing import start_trace
+from modules.vector_index.vector_implementations.VectorStoreImpl import VectorStoreImpl, extract_product_codes
+from modules.vector_index.vector_utils.context_builder import (
+    BASELINE_CONTEXT_DEPTH,
+    CANDIDATE_POOL,
+    CatalogContextBuilder,
+    clean_description,
+)
+from modules.vector_index.vector_utils.custom_retriever import CustomRetriever
+from modules.vector_index.vector_utils.local_bedrock import hash_embedding
+from modules.vector_index.vector_utils.token_utils import estimate_tokens
+from utils.benchmark.run_benchmark import DEFAULT_QUESTION_MIX, load_question_mix
+
+CATALOG = os.path.join(os.path.dirname(__file__), "..", "modules", "web_extraction_tools", "processed", "grainger_products.parquet")
+
+
+def make_document(code, name, brand="Brand A", description="<p>A long description of the product.</p>"):
+    metadata = {"Code": code, "Name": name, "Brand": brand, "Price": "$10.00", "Description": description}
+    return Document(page_content=f"{code} {name} {brand} $10.00 {description}", metadata=metadata)
+
+
+class TestCatalogContextBuilder(unittest.TestCase):
+
+    def test_should_drop_hits_under_min_score_but_keep_best_hit(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.5)
+        scored_documents = [(make_document("1AAA1", "Hammer"), 0.3), (make_document("2BBB2", "Wrench"), 0.2)]
+
+        # Act
+        documents = builder.build(scored_documents)
+
+        # Assert
+        self.assertEqual([document.metadata["Code"] for document in documents], ["1AAA1"])
+
+    def test_should_collapse_near_identical_products(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.0, dedupe_similarity=0.8)
+        scored_documents = [
+            (make_document("1AAA1", "Nitrile Disposable Gloves Blue Powder Free Size L"), 0.9),
+            (make_document("2BBB2", "Nitrile Disposable Gloves Blue Powder Free Size M"), 0.8),
+            (make_document("3CCC3", "Safety Glasses Clear Anti Fog"), 0.7),
+        ]
+
+        # Act
+        documents = builder.build(scored_documents)
+
+        # Assert
+        self.assertEqual([document.metadata["Code"] for document in documents], ["1AAA1", "3CCC3"])
+
+    def test_should_keep_only_hits_close_to_a_strong_match(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.2, relative_cutoff=0.75, max_depth=6)
+        scored_documents = [
+            (make_document("1AAA1", "Hammer"), 1.0),
+            (make_document("2BBB2", "Wrench"), 0.6),
+            (make_document("3CCC3", "Pliers"), 0.55),
+        ]
+
+        # Act
+        documents = builder.build(scored_documents)
+
+        # Assert
+        self.assertEqual([document.metadata["Code"] for document in documents], ["1AAA1"])
+
+    def test_should_select_depth_within_bounds(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.2, relative_cutoff=0.75, min_depth=2, max_depth=4)
+
+        # Act & Assert
+        self.assertEqual(builder.select_depth([0.6, 0.58, 0.57, 0.55, 0.54, 0.53]), 4)
+        self.assertEqual(builder.select_depth([0.9, 0.1, 0.05]), 2)
+        self.assertEqual(builder.select_depth([0.6, 0.5, 0.3]), 2)
+        self.assertEqual(builder.select_depth([]), 0)
+
+    def test_should_report_depth_on_the_trace(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.0)
+        scored_documents = [(make_document("1AAA1", "Hammer"), 0.8), (make_document("2BBB2", "Wrench"), 0.7)]
+
+        def traced():
+            trace = start_trace("ask_question")
+            builder.build(scored_documents)
+            return trace
+
+        # Act
+        trace = contextvars.Context().run(traced)
+
+        # Assert
+        self.assertEqual(trace.attributes["retrieval_depth"], 2)
+        self.assertEqual(trace.attributes["retrieval_candidates"], 2)
+        self.assertGreater(trace.attributes["catalog_tokens"], 0)
+
+    def test_should_truncate_descriptions_to_token_budget(self):
+        # Arrange
+        builder = CatalogContextBuilder(min_score=0.0, max_description_tokens=10)
+        description = "<p>" + "Heavy duty steel construction. " * 50 + "</p>"
+        scored_documents = [(make_document("1AAA1", "Hammer", description=description), 0.9)]
+
+        # Act
+        documents = builder.build(scored_documents)
+
+        # Assert
+        self.assertTrue(documents[0].page_content.startswith("1AAA1 Hammer Brand A $10.00 Heavy duty steel"))
+        self.assertNotIn("<p>", documents[0].page_content)
+        self.assertLess(len(documents[0].page_content), 100)
+
+    def test_should_clean_html_from_description(self):
+        self.assertEqual(clean_description("<p>Fits 1&quot; pipe</p><ul><li>Steel</li></ul>"), 'Fits 1" pipe Steel')
+        self.assertEqual(clean_description(None), "")
+
+
+class TestScoredRetrieval(unittest.TestCase):
+
+    def setUp(self):
+        documents = [make_document("1AAA1", "Hammer"), make_document("2BBB2", "Wrench"), make_document("3CCC3", "Pliers")]
+        vectorstore_faiss_doc = FAISS.from_documents(documents, DeterministicFakeEmbedding(size=16))
+        exact_match_map = {"1AAA1": 0, "2BBB2": 1, "3CCC3": 2}
+        self.vectorstore_impl = VectorStoreImpl((vectorstore_faiss_doc, exact_match_map))
+
+    def test_should_score_exact_match_as_one(self):
+        # Act
+        results = self.vectorstore_impl.parallel_search_with_scores(["what is 2BBB2"], k=3)
+
+        # Assert
+        self.assertEqual([(document.metadata["Code"], score) for document, score in results[0]], [("2BBB2", 1.0)])
+
+    def test_should_return_cosine_scores_for_faiss_hits(self):
+        # Act
+        results = self.vectorstore_impl.parallel_search_with_scores(["something to fix a pipe"], k=3)
+
+        # Assert
+        self.assertEqual(len(results[0]), 3)
+        for _, score in results[0]:
+            self.assertGreaterEqual(score, -1.0)
+            self.assertLessEqual(score, 1.0)
+
+    def test_retriever_should_return_compressed_documents(self):
+        # Arrange
+        retriever = CustomRetriever(vectorstore_impl=self.vectorstore_impl, k=3, context_builder=CatalogContextBuilder(min_score=-1.0))
+
+        # Act
+        documents = retriever.invoke("3CCC3")
+
+        # Assert
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(documents[0].page_content, "3CCC3 Pliers Brand A $10.00 A long description of the product.")
+
+
+class HashEmbeddings(Embeddings):
+    """The local Bedrock stand-in's embeddings, without the simulated latency."""
+
+    def embed_documents(self, texts):
+        return [hash_embedding(text) for text in texts]
+
+    def embed_query(self, text):
+        return hash_embedding(text)
+
+
+class TestContextQuality(unittest.TestCase):
+    """Replays the benchmark questions and checks the compressed context keeps the products the old top-6 context
+    answered them from."""
+
+    @classmethod
+    def setUpClass(cls):
+        questions = [question["question"] for question in load_question_mix(DEFAULT_QUESTION_MIX)]
+        asked_codes = {code for question in questions for code in extract_product_codes(question)}
+        catalog = pd.read_parquet(CATALOG)
+        # Every tenth product keeps the index small enough for a unit test; the products asked for by code are added
+        catalog = catalog[(catalog.index % 10 == 0) | catalog["Code"].isin(asked_codes)].reset_index(drop=True)
+        documents = [
+            Document(
+                page_content=f"{row.Code} {row.Name.strip()} {row.Brand.strip()} {row.Price or ''} {row.Description or ''}",
+                metadata={"Brand": row.Brand, "Code": row.Code, "Name": row.Name, "Description": row.Description, "Price": row.Price},
+            )
+            for row in catalog.itertuples()
+        ]
+        exact_match_map = {row.Code: index for index, row in enumerate(catalog.itertuples())}
+        cls.questions = questions
+        cls.vectorstore_impl = VectorStoreImpl((FAISS.from_documents(documents, HashEmbeddings()), exact_match_map))
+
+    def test_compressed_context_should_keep_the_products_that_answer_each_question(self):
+        builder = CatalogContextBuilder()
+        for question in self.questions:
+            with self.subTest(question=question):
+                # Arrange
+                scored_documents = self.vectorstore_impl.parallel_search_with_scores([question], k=CANDIDATE_POOL)[0]
+                baseline = sorted(scored_documents, key=lambda scored: scored[1], reverse=True)[:BASELINE_CONTEXT_DEPTH]
+                expected_codes = set(extract_product_codes(question)) or {baseline[0][0].metadata["Code"]}
+
+                # Act
+                documents = builder.build(scored_documents)
+
+                # Assert
+                codes = {document.metadata["Code"] for document in documents}
+                self.assertLessEqual(expected_codes, codes)
+                self.assertLessEqual(
+                    sum(estimate_tokens(document.page_content) for document in documents),
+                    sum(estimate_tokens(document.page_content) for document, _ in baseline),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import AsyncMock, patch
+
+import pandas as pd
+from PIL import Image
+
+from modules.rest_modules.rest_utils.image_utils.grainger_image_util import (
+    fetch_image,
+    generate_grainger_thumbnails,
+    get_images,
+    load_image,
+    stream_images,
+)
+from modules.rest_modules.rest_utils.image_utils.image_cache import ImageCache, thumbnail_variant
+from modules.rest_modules.rest_utils.image_utils.image_executor import image_executor
+from modules.vector_index.vector_utils.product_index import ProductIndex
+
+
+def make_jpeg(color="red", size=(600, 600)):
+    buffered = io.BytesIO()
+    Image.new("RGB", size, color).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+class FakeHttpClient:
+    """Answers every fetch with the next scripted (status, headers, body) and records the request headers."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def fetch(self, url, headers=None):
+        self.requests.append(headers or {})
+        return self.responses.pop(0)
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.directory.name, memory_bytes=1000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_evict_least_recently_used_beyond_memory_bytes(self):
+        # Arrange
+        memory_only = ImageCache(None, memory_bytes=1000)
+        memory_only.put("https://img/a.jpg", b"a" * 400)
+        memory_only.put("https://img/b.jpg", b"b" * 400)
+        memory_only.get("https://img/a.jpg")
+
+        # Act
+        memory_only.put("https://img/c.jpg", b"c" * 400)
+
+        # Assert
+        self.assertIsNotNone(memory_only.get("https://img/a.jpg"))
+        self.assertIsNone(memory_only.get("https://img/b.jpg"))
+
+    def test_should_serve_disk_entries_to_other_workers(self):
+        # Arrange
+        self.cache.put("https://img/a.jpg", b"image bytes", etag='"v1"')
+        other_worker = ImageCache(self.directory.name, memory_bytes=1000)
+
+        # Act
+        entry = other_worker.get("https://img/a.jpg")
+
+        # Assert
+        self.assertEqual(entry["data"], b"image bytes")
+        self.assertEqual(entry["etag"], '"v1"')
+
+    def test_should_store_identical_images_once(self):
+        # Act
+        self.cache.put("https://img/a.jpg", b"same bytes")
+        self.cache.put("https://img/b.jpg", b"same bytes")
+
+        # Assert
+        objects = [name for _, _, names in os.walk(os.path.join(self.directory.name, "objects")) for name in names]
+        self.assertEqual(len(objects), 1)
+
+    def test_should_prune_entries_and_objects_not_fetched_for_several_max_ages(self):
+        # Arrange
+        cache = ImageCache(self.directory.name, memory_bytes=0, max_age=100, prune_age_periods=0)
+        long_ago = time.time() - 1000
+        with patch("modules.rest_modules.rest_utils.image_utils.image_cache.time.time", return_value=long_ago):
+            cache.put("https://img/old.jpg", b"old bytes")
+            cache.put("https://img/shared-old.jpg", b"shared bytes")
+        for directory, _, names in os.walk(os.path.join(self.directory.name, "objects")):
+            for name in names:
+                os.utime(os.path.join(directory, name), (long_ago, long_ago))
+        cache.put("https://img/fresh.jpg", b"fresh bytes")
+        cache.put("https://img/shared-fresh.jpg", b"shared bytes")
+
+        # Act
+        removed = cache.prune(max_age_periods=5)
+
+        # Assert
+        self.assertEqual(removed, {"entries": 2, "objects": 1, "bytes": len(b"old bytes")})
+        self.assertIsNone(cache.get("https://img/old.jpg"))
+        self.assertIsNone(cache.get("https://img/shared-old.jpg"))
+        self.assertEqual(cache.get("https://img/fresh.jpg")["data"], b"fresh bytes")
+        self.assertEqual(cache.get("https://img/shared-fresh.jpg")["data"], b"shared bytes")
+
+
+class TestFetchImage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_cache_image_and_thumbnails_on_first_fetch(self):
+        # Arrange
+        http_client = FakeHttpClient((200, {"ETag": '"v1"'}, make_jpeg()))
+
+        # Act
+        first = asyncio.run(fetch_image(http_client, "5TUR3", "https://img/5TUR3.jpg", self.cache))
+        second = asyncio.run(fetch_image(http_client, "5TUR3", "https://img/5TUR3.jpg", self.cache))
+
+        # Assert
+        self.assertEqual(first, second)
+        self.assertEqual(len(http_client.requests), 1)
+        thumbnail = self.cache.get("https://img/5TUR3.jpg", thumbnail_variant(200))
+        self.assertEqual(Image.open(io.BytesIO(thumbnail["data"])).size, (200, 200))
+
+    def test_should_revalidate_stale_image_with_etag(self):
+        # Arrange
+        self.cache.put("https://img/5TUR3.jpg", make_jpeg(), etag='"v1"')
+        http_client = FakeHttpClient((304, {}, b""))
+
+        # Act
+        with patch("modules.rest_modules.rest_utils.image_utils.image_cache.time.time", return_value=4102444800.0):
+            result = asyncio.run(fetch_image(http_client, "5TUR3", "https://img/5TUR3.jpg", self.cache))
+
+        # Assert
+        self.assertEqual(http_client.requests, [{"If-None-Match": '"v1"'}])
+        self.assertEqual(result["Image Data"], self.cache.get("https://img/5TUR3.jpg")["data"])
+
+    def test_should_return_original_when_a_pool_process_dies(self):
+        # Arrange
+        http_client = FakeHttpClient((200, {}, make_jpeg()))
+
+        # Act
+        with patch(
+            "modules.rest_modules.rest_utils.image_utils.grainger_image_util.image_executor.run",
+            new_callable=AsyncMock,
+            side_effect=BrokenProcessPool("worker died"),
+        ):
+            result = asyncio.run(fetch_image(http_client, "5TUR3", "https://img/5TUR3.jpg", self.cache))
+
+        # Assert
+        self.assertEqual(result["Image Data"], self.cache.get("https://img/5TUR3.jpg")["data"])
+        self.assertIsNone(self.cache.get("https://img/5TUR3.jpg", thumbnail_variant(200)))
+
+    def test_should_render_each_thumbnail_once_on_a_cold_request(self):
+        # Arrange
+        http_client = FakeHttpClient((200, {}, make_jpeg()))
+        run = AsyncMock(side_effect=image_executor.run)
+
+        # Act
+        with patch("modules.rest_modules.rest_utils.image_utils.grainger_image_util.image_executor.run", run):
+            entry = asyncio.run(load_image(http_client, "5TUR3", "https://img/5TUR3.jpg", 200, "webp", self.cache))
+
+        # Assert
+        self.assertEqual(run.await_count, 1)
+        self.assertEqual(entry["content_type"], "image/webp")
+        self.assertEqual(entry, self.cache.get("https://img/5TUR3.jpg", thumbnail_variant(200, "webp")))
+
+    def test_should_report_failure_without_cached_copy(self):
+        # Arrange
+        http_client = FakeHttpClient((404, {}, b""))
+
+        # Act
+        result = asyncio.run(fetch_image(http_client, "5TUR3", "https://img/5TUR3.jpg", self.cache))
+
+        # Assert
+        self.assertEqual(result, "Failed to fetch image for 5TUR3: https://img/5TUR3.jpg")
+
+
+class TestGetImages(unittest.TestCase):
+
+    def test_should_fetch_each_catalog_image_once(self):
+        # Arrange
+        product_index = ProductIndex.from_dataframe(
+            pd.DataFrame(
+                [
+                    {"Code": "5TUR3", "Name": "Pipe Wrench", "PictureUrl600": "https://img/5TUR3.jpg"},
+                    {"Code": "1AAA1", "Name": "Claw Hammer", "PictureUrl600": None},
+                ]
+            )
+        )
+        recommendations = ["Pipe Wrench, 5TUR3", "Pipe Wrench, 5tur3", "Claw Hammer, 1AAA1", "Unknown, 9ZZZ9"]
+
+        # Act
+        with patch(
+            "modules.rest_modules.rest_utils.image_utils.grainger_image_util.fetch_image", new_callable=AsyncMock
+        ) as mock_fetch_image:
+            asyncio.run(get_images(recommendations, product_index, FakeHttpClient()))
+
+        # Assert
+        self.assertEqual([call.args[1:] for call in mock_fetch_image.call_args_list], [("5TUR3", "https://img/5TUR3.jpg")])
+
+    def test_should_build_thumbnail_strip_skipping_failures(self):
+        # Arrange
+        product_index = ProductIndex.from_dataframe(pd.DataFrame([{"Code": "5TUR3", "Name": "Pipe Wrench", "PictureUrl600": "https://img/5TUR3.jpg"}]))
+        images = [
+            {"Code": "5TUR3", "Image Data": make_jpeg()},
+            "Failed to fetch image for 1AAA1: https://img/1AAA1.jpg",
+            {"Code": "9ZZZ9", "Image Data": b"broken"},
+        ]
+
+        # Act
+        html_content, _ = asyncio.run(generate_grainger_thumbnails(images, product_index))
+
+        # Assert
+        self.assertEqual(html_content.count("<td><img src='data:image/jpeg;base64,"), 1)
+
+
+class SlowHttpClient:
+    """Answers each URL with a JPEG after the delay given for it, or a 404 for URLs without one."""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def fetch(self, url, headers=None):
+        if url not in self.delays:
+            return 404, {}, b""
+        await asyncio.sleep(self.delays[url])
+        return 200, {}, make_jpeg()
+
+
+class TestStreamImages(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.directory.name)
+        self.product_index = ProductIndex.from_dataframe(
+            pd.DataFrame(
+                [
+                    {"Code": code, "Name": name, "PictureUrl600": f"https://img/{code}.jpg"}
+                    for code, name in [("1SLOW", "Slow"), ("2FAST", "Fast"), ("3GONE", "Gone"), ("4HUNG", "Hung")]
+                ]
+            )
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def collect(self, http_client, codes, deadline):
+        async def run():
+            return [item async for item in stream_images(codes, self.product_index, http_client, deadline, cache=self.cache)]
+
+        return asyncio.run(run())
+
+    def test_should_yield_images_in_completion_order_with_typed_errors(self):
+        # Arrange
+        http_client = SlowHttpClient({"https://img/1SLOW.jpg": 0.5, "https://img/2FAST.jpg": 0.0})
+
+        # Act
+        items = self.collect(http_client, ["1SLOW", "2FAST", "3GONE", "9ZZZ9"], deadline=5)
+
+        # Assert
+        self.assertEqual(
+            [(item["type"], item.get("code"), item.get("error")) for item in items],
+            [
+                ("error", "9ZZZ9", "not_found"),
+                ("error", "3GONE", "fetch_failed"),
+                ("image", "2FAST", None),
+                ("image", "1SLOW", None),
+                ("done", None, None),
+            ],
+        )
+        self.assertEqual((items[-1]["images"], items[-1]["errors"]), (2, 2))
+
+    def test_should_report_images_still_loading_at_the_deadline(self):
+        # Arrange
+        http_client = SlowHttpClient({"https://img/2FAST.jpg": 0.0, "https://img/4HUNG.jpg": 30})
+
+        # Act
+        started = time.monotonic()
+        items = self.collect(http_client, ["4HUNG", "2FAST"], deadline=0.3)
+
+        # Assert
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(
+            [(item["type"], item.get("code"), item.get("error")) for item in items],
+            [("image", "2FAST", None), ("error", "4HUNG", "deadline_exceeded"), ("done", None, None)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
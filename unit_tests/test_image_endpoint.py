@@ -0,0 +1,162 @@
+import base64
+import io
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from modules.rest_modules.endpoints import images
+from modules.rest_modules.rest_utils.image_utils.grainger_image_util import store_image
+from modules.rest_modules.rest_utils.image_utils.image_cache import THUMBNAIL_SIZES, ImageCache
+from modules.rest_modules.rest_utils.image_utils.image_processing import render_thumbnails
+from modules.vector_index.vector_utils.product_index import ProductIndex
+
+
+class CatalogResourceManager:
+
+    def __init__(self):
+        # Every image the tests request is already cached
+        self.http_client = None
+        self.product_index = ProductIndex.from_dataframe(
+            pd.DataFrame(
+                [
+                    {"Code": "5TUR3", "Name": "Pipe Wrench", "PictureUrl600": "https://img/5TUR3.jpg"},
+                    {"Code": "1AAA1", "Name": "Claw Hammer", "PictureUrl600": None},
+                    {"Code": "3CCC3", "Name": "Tape Measure", "PictureUrl600": "https://img/3CCC3.jpg"},
+                ]
+            )
+        )
+
+
+class TestImageEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.directory.name)
+        buffered = io.BytesIO()
+        Image.new("RGB", (600, 600), "red").save(buffered, format="JPEG")
+        self.original = buffered.getvalue()
+        store_image(
+            self.cache, "https://img/5TUR3.jpg", self.original, {"Content-Type": "image/jpeg"}, render_thumbnails(self.original, THUMBNAIL_SIZES)
+        )
+
+        patcher = patch.object(images, "image_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = FastAPI()
+        app.include_router(images.router)
+        app.dependency_overrides[images.get_resource_manager] = CatalogResourceManager
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_serve_original_bytes_with_caching_headers(self):
+        # Act
+        response = self.client.get("/images/5TUR3")
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.original)
+        self.assertEqual(response.headers["content-type"], "image/jpeg")
+        self.assertIn("max-age=", response.headers["cache-control"])
+
+    def test_should_serve_webp_thumbnail_when_accepted(self):
+        # Act
+        response = self.client.get("/images/5tur3?size=200", headers={"Accept": "image/webp,image/*"})
+
+        # Assert
+        self.assertEqual(response.headers["content-type"], "image/webp")
+        self.assertEqual(Image.open(io.BytesIO(response.content)).size, (200, 200))
+
+    def test_should_answer_not_modified_for_matching_etag(self):
+        # Arrange
+        etag = self.client.get("/images/5TUR3?size=200").headers["etag"]
+
+        # Act
+        response = self.client.get("/images/5TUR3?size=200", headers={"If-None-Match": etag})
+
+        # Assert
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_should_reject_unknown_products_and_sizes(self):
+        # Act
+        unknown = self.client.get("/images/9ZZZ9")
+        without_image = self.client.get("/images/1AAA1")
+        bad_size = self.client.get("/images/5TUR3?size=123")
+
+        # Assert
+        self.assertEqual([unknown.status_code, without_image.status_code, bad_size.status_code], [404, 404, 400])
+
+    def test_should_reject_product_lists_with_items_that_are_not_objects(self):
+        # Act
+        responses = [self.client.post(path, json=[{"code": "5TUR3"}, "5TUR3"]) for path in ("/images/manifest", "/images/stream", "/images/sprite")]
+
+        # Assert
+        self.assertEqual([response.status_code for response in responses], [422, 422, 422])
+
+    def test_should_list_image_urls_in_manifest(self):
+        # Act
+        response = self.client.post("/images/manifest?size=200", json=[{"code": "5TUR3"}, {"code": "5TUR3"}, {"code": "1AAA1"}])
+
+        # Assert
+        self.assertEqual(
+            response.json(),
+            {"images": [{"code": "5TUR3", "name": "Pipe Wrench", "url": "http://testserver/images/5TUR3?size=200"}], "missing": ["1AAA1"]},
+        )
+
+    def test_should_stream_typed_items_as_ndjson(self):
+        # Act
+        response = self.client.post("/images/stream", json=[{"code": "5TUR3"}, {"code": "1AAA1"}])
+
+        # Assert
+        items = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual([(item["type"], item.get("code")) for item in items], [("error", "1AAA1"), ("image", "5TUR3"), ("done", None)])
+        self.assertEqual(items[0]["error"], "not_found")
+        self.assertEqual(base64.b64decode(items[1]["image_data"]), self.original)
+
+    def test_should_stream_server_sent_events_when_accepted(self):
+        # Act
+        response = self.client.post("/images/stream?size=200", json=[{"code": "5TUR3"}], headers={"Accept": "text/event-stream"})
+
+        # Assert
+        events = response.text.strip().split("\n\n")
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        self.assertEqual([event.splitlines()[0] for event in events], ["event: image", "event: done"])
+
+    def test_should_composite_thumbnails_into_one_sprite_with_a_map(self):
+        # Arrange
+        blue = io.BytesIO()
+        Image.new("RGB", (300, 600), "blue").save(blue, format="JPEG")
+        self.cache.put("https://img/3CCC3.jpg", blue.getvalue())
+
+        # Act
+        response = self.client.post("/images/sprite", json=[{"code": "5TUR3"}, {"code": "3CCC3"}, {"code": "1AAA1"}])
+
+        # Assert
+        body = response.json()
+        sprite = Image.open(io.BytesIO(base64.b64decode(body["image_data"])))
+        self.assertEqual(sprite.size, (400, 200))
+        self.assertEqual((body["width"], body["height"], body["missing"]), (400, 200, ["1AAA1"]))
+        self.assertEqual(
+            body["tiles"],
+            [
+                {"code": "5TUR3", "name": "Pipe Wrench", "x": 0, "y": 0, "width": 200, "height": 200},
+                {"code": "3CCC3", "name": "Tape Measure", "x": 250, "y": 0, "width": 100, "height": 200},
+            ],
+        )
+        red, green, blue_channel = sprite.getpixel((300, 20))
+        self.assertGreater(blue_channel, 200)
+        self.assertLess(red, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
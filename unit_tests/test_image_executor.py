@@ -0,0 +1,70 @@
+import asyncio
+import io
+import os
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from modules.rest_modules.rest_utils.image_utils.image_executor import ImageExecutor
+from modules.rest_modules.rest_utils.image_utils.image_processing import make_thumbnail, render_thumbnails
+
+
+def make_jpeg(size=(600, 400)):
+    buffered = io.BytesIO()
+    Image.new("RGB", size, "blue").save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+class TestImageExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ImageExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_should_run_work_in_another_process(self):
+        # Act
+        worker_pid = asyncio.run(self.executor.run(os.getpid))
+
+        # Assert
+        self.assertNotEqual(worker_pid, os.getpid())
+
+    def test_should_map_in_input_order_with_exceptions_in_place(self):
+        # Arrange
+        arguments = [(make_jpeg((600, 400)), 300), (b"not an image", 300), (make_jpeg((200, 400)), 100)]
+
+        # Act
+        results = asyncio.run(self.executor.map(make_thumbnail, arguments, return_exceptions=True))
+
+        # Assert
+        self.assertEqual(Image.open(io.BytesIO(results[0])).size, (300, 200))
+        self.assertIsInstance(results[1], OSError)
+        self.assertEqual(Image.open(io.BytesIO(results[2])).size, (50, 100))
+
+    def test_should_run_in_threads_without_workers(self):
+        # Arrange
+        executor = ImageExecutor(max_workers=0)
+
+        # Act
+        thumbnails = asyncio.run(executor.run(render_thumbnails, make_jpeg(), [200]))
+
+        # Assert
+        self.assertEqual(sorted(thumbnails), [(200, "jpeg"), (200, "webp")])
+        self.assertIsNone(executor._pool)
+
+    def test_should_decode_once_per_size_for_every_format(self):
+        # Arrange
+        image_data = make_jpeg()
+
+        # Act
+        with patch("modules.rest_modules.rest_utils.image_utils.image_processing.Image.open", wraps=Image.open) as image_open:
+            thumbnails = render_thumbnails(image_data, [100, 200])
+
+        # Assert
+        self.assertEqual(image_open.call_count, 2)
+        self.assertEqual(sorted(thumbnails), [(100, "jpeg"), (100, "webp"), (200, "jpeg"), (200, "webp")])
+        self.assertEqual(thumbnails[(200, "webp")], make_thumbnail(image_data, 200, "webp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
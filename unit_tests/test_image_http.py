@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from modules.rest_modules.rest_utils.image_utils.image_http import ImageHttpClient
+
+
+class CdnStub:
+    """Serves image bytes, failing the first `failures` requests with 503, and records the client port per request."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.client_ports = []
+
+    async def handle(self, request):
+        self.client_ports.append(request.transport.get_extra_info("peername")[1])
+        if self.failures > 0:
+            self.failures -= 1
+            return web.Response(status=503)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b"image bytes", headers={"ETag": '"v1"'})
+
+
+def run_against(cdn, scenario):
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{name}", cdn.handle)
+        async with TestServer(app) as server:
+            http_client = ImageHttpClient(backoff=0.0)
+            try:
+                return await scenario(http_client, str(server.make_url("/5TUR3.jpg")))
+            finally:
+                await http_client.aclose()
+
+    return asyncio.run(run())
+
+
+class TestImageHttpClient(unittest.TestCase):
+
+    def test_should_reuse_one_connection_for_sequential_fetches(self):
+        # Arrange
+        cdn = CdnStub()
+
+        async def fetch_three_times(http_client, url):
+            return [await http_client.fetch(url) for _ in range(3)]
+
+        # Act
+        responses = run_against(cdn, fetch_three_times)
+
+        # Assert
+        self.assertEqual([(status, body) for status, _, body in responses], [(200, b"image bytes")] * 3)
+        self.assertEqual(len(set(cdn.client_ports)), 1)
+
+    def test_should_retry_server_errors_up_to_the_limit(self):
+        # Arrange
+        cdn = CdnStub(failures=2)
+
+        # Act
+        status, headers, body = run_against(cdn, lambda http_client, url: http_client.fetch(url))
+
+        # Assert
+        self.assertEqual((status, body, headers["ETag"]), (200, b"image bytes", '"v1"'))
+        self.assertEqual(len(cdn.client_ports), 3)
+
+    def test_should_return_last_error_status_when_retries_run_out(self):
+        # Arrange
+        cdn = CdnStub(failures=5)
+
+        # Act
+        status, _, body = run_against(cdn, lambda http_client, url: http_client.fetch(url))
+
+        # Assert
+        self.assertEqual((status, body), (503, b""))
+        self.assertEqual(len(cdn.client_ports), 3)
+
+    def test_should_pass_conditional_headers(self):
+        # Act
+        status, _, _ = run_against(CdnStub(), lambda http_client, url: http_client.fetch(url, headers={"If-None-Match": '"v1"'}))
+
+        # Assert
+        self.assertEqual(status, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import io
+import tempfile
+import time
+import unittest
+from collections import Counter
+
+import pandas as pd
+from PIL import Image
+
+from modules.rest_modules.rest_utils.image_utils.image_cache import ImageCache, thumbnail_variant
+from modules.vector_index.vector_utils.product_index import ProductIndex
+from utils.image_prewarm.prewarm_images import RateLimiter, count_requested_codes, prewarm, select_products
+
+
+def make_jpeg():
+    buffered = io.BytesIO()
+    Image.new("RGB", (400, 400), "green").save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+class CountingHttpClient:
+    """Serves a JPEG for every URL except those listed as missing, and records the URLs requested."""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.urls = []
+
+    async def fetch(self, url, headers=None):
+        self.urls.append(url)
+        if url in self.missing:
+            return 404, {}, b""
+        return 200, {"ETag": '"v1"'}, make_jpeg()
+
+
+def catalog():
+    return ProductIndex.from_dataframe(
+        pd.DataFrame(
+            [
+                {"Code": "5TUR3", "Name": "Pipe Wrench", "PictureUrl600": "https://img/5TUR3.jpg"},
+                {"Code": "1AAA1", "Name": "Claw Hammer", "PictureUrl600": "https://img/1AAA1.jpg"},
+                {"Code": "2BBB2", "Name": "Tape Measure", "PictureUrl600": None},
+            ]
+        )
+    )
+
+
+class TestRequestedCodes(unittest.TestCase):
+
+    def test_should_count_codes_from_access_and_application_logs(self):
+        # Arrange
+        lines = [
+            '127.0.0.1:5000 - "GET /images/5tur3?size=200 HTTP/1.1" 200',
+            '127.0.0.1:5000 - "POST /images/stream HTTP/1.1" 200',
+            '127.0.0.1:5000 - "POST /images/sprite?size=200 HTTP/1.1" 200',
+            "INFO:root:image.py/ Fetching images for products: ['Claw Hammer, 1AAA1', 'Pipe Wrench, 5TUR3']",
+            "INFO:root:images.py/ Streaming images for codes: ['1AAA1']",
+        ]
+
+        # Act
+        counts = count_requested_codes(lines)
+
+        # Assert
+        self.assertEqual(counts, Counter({"5TUR3": 2, "1AAA1": 2}))
+
+    def test_should_select_most_requested_products_with_images(self):
+        # Act
+        products = select_products(catalog(), Counter({"2BBB2": 9, "1AAA1": 5, "9ZZZ9": 4, "5TUR3": 1}), top=1)
+
+        # Assert
+        self.assertEqual([product["code"] for product in products], ["1AAA1"])
+
+
+class TestPrewarm(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.directory.name, memory_bytes=0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_skip_images_already_warm_on_rerun(self):
+        # Arrange
+        products = select_products(catalog())
+        first_client = CountingHttpClient(missing={"https://img/1AAA1.jpg"})
+        second_client = CountingHttpClient()
+
+        # Act
+        first = asyncio.run(prewarm(products, first_client, self.cache, concurrency=2))
+        second = asyncio.run(prewarm(products, second_client, self.cache, concurrency=2))
+
+        # Assert
+        self.assertEqual((first["warmed"], first["skipped"], first["failed"], first["failed_codes"]), (1, 0, 1, ["1AAA1"]))
+        self.assertEqual((second["warmed"], second["skipped"], second["failed"]), (1, 1, 0))
+        self.assertEqual(second_client.urls, ["https://img/1AAA1.jpg"])
+        self.assertGreater(first["bytes"], 0)
+
+    def test_should_render_missing_thumbnails_of_a_fresh_original(self):
+        # Arrange
+        products = select_products(catalog())[:1]
+        self.cache.put("https://img/5TUR3.jpg", make_jpeg(), etag='"v1"')
+        http_client = CountingHttpClient()
+
+        # Act
+        first = asyncio.run(prewarm(products, http_client, self.cache))
+        second = asyncio.run(prewarm(products, http_client, self.cache))
+
+        # Assert
+        self.assertEqual((first["warmed"], first["skipped"], first["failed"], first["bytes"]), (1, 0, 0, 0))
+        self.assertEqual((second["warmed"], second["skipped"]), (0, 1))
+        self.assertEqual(http_client.urls, [])
+        self.assertEqual(Image.open(io.BytesIO(self.cache.get("https://img/5TUR3.jpg", thumbnail_variant(200))["data"])).size, (200, 200))
+
+    def test_should_space_acquisitions_by_rate(self):
+        # Arrange
+        limiter = RateLimiter(rate=20)
+
+        async def acquire_five():
+            await asyncio.gather(*(limiter.acquire() for _ in range(5)))
+
+        # Act
+        started = time.monotonic()
+        asyncio.run(acquire_five())
+
+        # Assert
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+if __name__ == "__main__":
+    unittest.main()
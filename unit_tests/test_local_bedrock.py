@@ -0,0 +1,122 @@
+import json
+import random
+import unittest
+
+import numpy as np
+from botocore.exceptions import ClientError
+from langchain_aws import Bedrock
+from langchain_community.embeddings import BedrockEmbeddings
+
+from modules.vector_index.vector_utils.local_bedrock import (
+    TITAN_EMBEDDING_DIMENSIONS,
+    LatencyModel,
+    LocalBedrockRuntimeClient,
+    hash_embedding,
+    scripted_completion,
+)
+from modules.vector_index.vector_utils.response_parser import split_process_and_message_from_response
+
+CATALOG_PROMPT = """Human: Extract a list of products from catalog that answer the user question.
+The catalog of products is provided under <catalog></catalog> tags below.
+<catalog>
+5TUR3 Pipe Wrench Ridgid $42.00 Heavy duty
+
+1AA11 Claw Hammer Estwing $20.00 Steel
+</catalog>
+Question: I need tools for plumbing
+The output should be a json list of only the codes of the products from the catalog in the form <products>["<code>", ...]</products>
+Assistant: """
+
+
+class TestHashEmbedding(unittest.TestCase):
+
+    def test_should_be_deterministic_normalized_and_titan_sized(self):
+        # Act
+        embedding = hash_embedding("nitrile gloves")
+
+        # Assert
+        self.assertEqual(len(embedding), TITAN_EMBEDDING_DIMENSIONS)
+        self.assertEqual(embedding, hash_embedding("nitrile gloves"))
+        self.assertAlmostEqual(float(np.linalg.norm(embedding)), 1.0, places=5)
+
+    def test_should_place_texts_sharing_words_closer(self):
+        # Arrange
+        query = np.array(hash_embedding("blue nitrile gloves"))
+
+        # Act
+        related = float(query @ np.array(hash_embedding("nitrile gloves size large")))
+        unrelated = float(query @ np.array(hash_embedding("cordless drill battery")))
+
+        # Assert
+        self.assertGreater(related, unrelated)
+
+
+class TestScriptedCompletion(unittest.TestCase):
+
+    def test_should_answer_with_catalog_codes_in_parseable_form(self):
+        # Act
+        message, products_json = split_process_and_message_from_response(scripted_completion(CATALOG_PROMPT))
+
+        # Assert
+        self.assertIn("I need tools for plumbing", message)
+        self.assertEqual([product["code"] for product in products_json["products"]], ["5TUR3", "1AA11"])
+
+    def test_should_return_empty_attributes_for_attribute_prompt(self):
+        self.assertEqual(scripted_completion("Return them inside <attributes></attributes>"), " <attributes>{}</attributes>")
+
+
+class TestLocalBedrockRuntimeClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = LocalBedrockRuntimeClient(seed=7)
+
+    def test_should_serve_langchain_llm_and_embeddings(self):
+        # Arrange
+        llm = Bedrock(model_id="anthropic.claude-v2", client=self.client)
+        embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=self.client)
+
+        # Act
+        completion = llm.invoke(CATALOG_PROMPT)
+        vector = embeddings.embed_query("pipe wrench")
+
+        # Assert
+        self.assertIn("<products>", completion)
+        self.assertEqual(len(vector), TITAN_EMBEDDING_DIMENSIONS)
+
+    def test_should_stream_completion_in_chunks(self):
+        # Arrange
+        body = json.dumps({"prompt": CATALOG_PROMPT})
+
+        # Act
+        response = self.client.invoke_model_with_response_stream(modelId="anthropic.claude-v2", body=body)
+        pieces = [json.loads(event["chunk"]["bytes"])["completion"] for event in response["body"]]
+
+        # Assert
+        self.assertEqual("".join(pieces), scripted_completion(CATALOG_PROMPT))
+
+    def test_should_inject_throttling(self):
+        # Arrange
+        client = LocalBedrockRuntimeClient(throttle_rate=1.0)
+
+        # Act & Assert
+        with self.assertRaises(ClientError) as context:
+            client.invoke_model(modelId="anthropic.claude-v2", body=json.dumps({"prompt": "Human: hi"}))
+        self.assertEqual(context.exception.response["Error"]["Code"], "ThrottlingException")
+
+
+class TestLatencyModel(unittest.TestCase):
+
+    def test_should_center_samples_on_median(self):
+        # Arrange
+        latency_model = LatencyModel(median_seconds=0.5, sigma=0.3)
+        rng = random.Random(1)
+
+        # Act
+        samples = sorted(latency_model.sample(rng) for _ in range(1001))
+
+        # Assert
+        self.assertAlmostEqual(samples[500], 0.5, delta=0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from modules.rest_modules.endpoints import metrics
+from modules.tracing import Trace
+from modules.vector_index.vector_utils.bedrock_limiter import AdaptiveConcurrencyLimiter, LimitedBedrockClient, RetryBudget
+from modules.vector_index.vector_utils.local_bedrock import LocalBedrockRuntimeClient
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+        app.middleware("http")(metrics.record_request_duration)
+        app.include_router(metrics.router)
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: str):
+            return {"item_id": item_id}
+
+        self.client = TestClient(app)
+
+    def test_should_label_request_durations_with_route_template(self):
+        # Arrange
+        before = sample("http_request_duration_seconds_count", method="GET", endpoint="/items/{item_id}", status="200")
+
+        # Act
+        self.client.get("/items/1")
+        self.client.get("/items/2")
+        self.client.get("/no-such-route")
+
+        # Assert
+        after = sample("http_request_duration_seconds_count", method="GET", endpoint="/items/{item_id}", status="200")
+        self.assertEqual(after - before, 2)
+        self.assertGreaterEqual(sample("http_request_duration_seconds_count", method="GET", endpoint="unmatched", status="404"), 1)
+
+    def test_should_expose_metrics_in_prometheus_text_format(self):
+        # Arrange
+        Trace("ask_question").add_span("embedding", 0.0, 0.02)
+
+        # Act
+        response = self.client.get("/metrics")
+
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn('chat_stage_duration_seconds_bucket{le="0.025",stage="embedding"}', response.text)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", response.text)
+
+
+class TestBedrockMetrics(unittest.TestCase):
+
+    def test_should_count_calls_and_tokens_reported_by_bedrock(self):
+        # Arrange
+        model_id = "anthropic.claude-v2"
+        client = LimitedBedrockClient(LocalBedrockRuntimeClient(seed=1), AdaptiveConcurrencyLimiter(), RetryBudget())
+        calls_before = sample("bedrock_calls_total", model=model_id, outcome="success")
+        input_before = sample("bedrock_tokens_total", model=model_id, direction="input")
+        output_before = sample("bedrock_tokens_total", model=model_id, direction="output")
+
+        # Act
+        client.invoke_model(modelId=model_id, body=json.dumps({"prompt": "\n\nHuman: hello <attributes>\n\nAssistant:"}))
+
+        # Assert
+        self.assertEqual(sample("bedrock_calls_total", model=model_id, outcome="success") - calls_before, 1)
+        self.assertGreater(sample("bedrock_tokens_total", model=model_id, direction="input"), input_before)
+        self.assertGreater(sample("bedrock_tokens_total", model=model_id, direction="output"), output_before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import unittest
+
+from langchain_community.embeddings import BedrockEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from prometheus_client import REGISTRY
+
+from modules.vector_index.vector_utils.chat_processor import process_chat_question_with_customer_attribute_identifier
+from modules.vector_index.vector_utils.local_bedrock import LocalBedrockRuntimeClient
+from modules.vector_index.vector_utils.model_registry import ModelRegistry, ModelRoute, route_llm
+
+
+class RecordingBedrockClient(LocalBedrockRuntimeClient):
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.calls.append((modelId, json.loads(body)))
+        return super().invoke_model(modelId=modelId, body=body, **kwargs)
+
+
+def route_tokens(route, model, direction):
+    return REGISTRY.get_sample_value("model_route_tokens_total", {"route": route, "model": model, "direction": direction}) or 0.0
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.client = RecordingBedrockClient()
+        self.registry = ModelRegistry(
+            self.client,
+            routes={
+                "attributes": ModelRoute("anthropic.claude-instant-v1", max_tokens=300),
+                "answer": ModelRoute("anthropic.claude-v2", max_tokens=2000),
+                "summary": ModelRoute("anthropic.claude-instant-v1", max_tokens=400),
+            },
+        )
+
+    def test_should_route_each_pipeline_step_to_its_model(self):
+        # Arrange
+        embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=LocalBedrockRuntimeClient())
+        documents = [
+            Document(page_content="5TUR3 Pipe Wrench Ridgid $42.00 Heavy duty", metadata={"Code": "5TUR3", "Name": "Pipe Wrench", "Brand": "Ridgid"}),
+        ]
+        vectorstore_faiss_doc = FAISS.from_documents(documents, embeddings)
+        answer_tokens_before = route_tokens("answer", "anthropic.claude-v2", "output")
+
+        # Act
+        message, response_json, _, _ = process_chat_question_with_customer_attribute_identifier(
+            "I need a wrench", vectorstore_faiss_doc, {"5TUR3": 0}, self.registry, []
+        )
+
+        # Assert
+        self.assertEqual([model_id for model_id, _ in self.client.calls], ["anthropic.claude-instant-v1", "anthropic.claude-v2"])
+        self.assertEqual(self.client.calls[0][1]["max_tokens_to_sample"], 300)
+        self.assertEqual(self.client.calls[1][1]["max_tokens_to_sample"], 2000)
+        self.assertIn("wrench", message)
+        self.assertGreater(route_tokens("answer", "anthropic.claude-v2", "output"), answer_tokens_before)
+
+    def test_should_count_tokens_per_route(self):
+        # Arrange
+        input_before = route_tokens("summary", "anthropic.claude-instant-v1", "input")
+
+        # Act
+        self.registry.llm("summary").invoke("\n\nHuman: Summarize <summary></summary>\n\nAssistant:")
+
+        # Assert
+        self.assertGreater(route_tokens("summary", "anthropic.claude-instant-v1", "input"), input_before)
+
+    def test_should_reject_unknown_route(self):
+        # Act & Assert
+        with self.assertRaises(KeyError):
+            self.registry.llm("translation")
+
+    def test_should_use_single_llm_for_every_route(self):
+        # Arrange
+        llm = object()
+
+        # Act & Assert
+        self.assertIs(route_llm(llm, "attributes"), llm)
+        self.assertIs(route_llm(self.registry, "answer"), self.registry.llm("answer"))
+
+
+if __name__ == "__main__":
+    unittest.main()
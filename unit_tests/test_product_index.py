@@ -0,0 +1,64 @@
+import unittest
+
+import pandas as pd
+
+from modules.vector_index.vector_utils.product_index import ProductIndex, hydrate_products
+
+
+def make_catalog():
+    return pd.DataFrame(
+        [
+            {"Code": "5TUR3", "Name": "Pipe Wrench", "Brand": "Ridgid", "Price": "$42.00", "PictureUrl600": "https://img/5TUR3.jpg"},
+            {"Code": "1AAA1", "Name": "Claw Hammer", "Brand": "Estwing", "Price": None, "PictureUrl600": None},
+        ]
+    )
+
+
+class TestProductIndex(unittest.TestCase):
+
+    def test_should_look_up_codes_case_insensitively(self):
+        # Arrange
+        product_index = ProductIndex.from_dataframe(make_catalog())
+
+        # Act
+        details = product_index.get(" 5tur3 ")
+
+        # Assert
+        self.assertEqual(details["name"], "Pipe Wrench")
+        self.assertIn("1AAA1", product_index)
+        self.assertNotIn("9ZZZ9", product_index)
+        self.assertEqual(len(product_index), 2)
+
+    def test_should_blank_missing_values(self):
+        # Arrange
+        product_index = ProductIndex.from_dataframe(make_catalog())
+
+        # Act
+        details = product_index.get("1AAA1")
+
+        # Assert
+        self.assertEqual((details["price"], details["image_url"]), ("", ""))
+
+
+class TestHydrateProducts(unittest.TestCase):
+
+    def test_should_fill_details_and_drop_unknown_codes(self):
+        # Arrange
+        product_index = ProductIndex.from_dataframe(make_catalog())
+        response_json = {"products": [{"product": "", "code": "5TUR3"}, "9ZZZ9", "1aaa1"]}
+
+        # Act
+        hydrated = hydrate_products(response_json, product_index)
+
+        # Assert
+        self.assertEqual(
+            hydrated["products"],
+            [
+                {"product": "Pipe Wrench", "code": "5TUR3", "brand": "Ridgid", "price": "$42.00", "image_url": "https://img/5TUR3.jpg"},
+                {"product": "Claw Hammer", "code": "1AAA1", "brand": "Estwing", "price": "", "image_url": ""},
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+import zlib
+from unittest.mock import patch
+
+import redis
+from langchain_community.embeddings import BedrockEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from modules.response_cache import ResponseCache, decode, encode, index_version
+from modules.vector_index.vector_implementations.VectorStoreImpl import VectorStoreImpl
+from modules.vector_index.vector_utils.local_bedrock import LocalBedrockRuntimeClient
+
+
+class InMemoryRedis:
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expiries[key] = ex
+
+
+class UnavailableRedis:
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        raise redis.ConnectionError("Connection refused")
+
+    def set(self, key, value, ex=None):
+        self.calls += 1
+        raise redis.ConnectionError("Connection refused")
+
+
+class CountingBedrockClient(LocalBedrockRuntimeClient):
+
+    def __init__(self):
+        super().__init__()
+        self.invocations = 0
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.invocations += 1
+        return super().invoke_model(modelId=modelId, body=body, **kwargs)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_should_round_trip_values_through_compact_encoding(self):
+        # Arrange
+        value = ["Here are 2 products", {"products": [{"product": "Pipe Wrench", "code": "5TUR3"}]}, "{}", 0.4]
+
+        # Act
+        data = encode(value)
+
+        # Assert
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(decode(data), value)
+
+    def test_should_store_with_ttl_and_namespace_by_index_version(self):
+        # Arrange
+        client = InMemoryRedis()
+        cache = ResponseCache(client, ttls={"answer": 60})
+        cache.set_index_version("v1")
+
+        # Act
+        cache.set("answer", ["what is 5tur3"], {"message": "ok"})
+        hit = cache.get("answer", ["what is 5tur3"])
+        cache.set_index_version("v2")
+        miss_after_reindex = cache.get("answer", ["what is 5tur3"])
+
+        # Assert
+        self.assertEqual(hit, {"message": "ok"})
+        self.assertIsNone(miss_after_reindex)
+        key = next(iter(client.values))
+        self.assertTrue(key.startswith("grainger:v1:answer:"))
+        self.assertEqual(client.expiries[key], 60)
+
+    def test_should_treat_undecodable_entries_as_misses(self):
+        # Arrange
+        client = InMemoryRedis()
+        cache = ResponseCache(client)
+        cache.set_index_version("v1")
+        cache.set("answer", ["not compressed"], "ok")
+        cache.set("answer", ["not json"], "ok")
+        client.values[cache.key("answer", ["not compressed"])] = b"plain bytes"
+        client.values[cache.key("answer", ["not json"])] = zlib.compress(b"{not json")
+
+        # Act
+        results = [cache.get("answer", ["not compressed"]), cache.get("answer", ["not json"])]
+
+        # Assert
+        self.assertEqual(results, [None, None])
+
+    def test_should_bypass_cache_without_index_version(self):
+        # Arrange
+        client = InMemoryRedis()
+        cache = ResponseCache(client)
+
+        # Act
+        cache.set("answer", ["question"], "answer")
+
+        # Assert
+        self.assertIsNone(cache.get("answer", ["question"]))
+        self.assertEqual(client.values, {})
+
+    def test_should_back_off_when_redis_is_unavailable(self):
+        # Arrange
+        client = UnavailableRedis()
+        cache = ResponseCache(client, retry_after=30.0)
+        cache.set_index_version("v1")
+
+        # Act
+        first = cache.get("answer", ["question"])
+        second = cache.get("answer", ["question"])
+        cache.set("answer", ["question"], "answer")
+
+        # Assert
+        self.assertIsNone(first)
+        self.assertIsNone(second)
+        self.assertEqual(client.calls, 1)
+
+
+class TestRetrievalCache(unittest.TestCase):
+
+    def test_should_skip_embedding_for_cached_retrieval(self):
+        # Arrange
+        documents = [
+            Document(page_content="5TUR3 Pipe Wrench Ridgid $42.00 Heavy duty", metadata={"Code": "5TUR3"}),
+            Document(page_content="1AA11 Claw Hammer Estwing $20.00 Steel", metadata={"Code": "1AA11"}),
+        ]
+        vectorstore_faiss_doc = FAISS.from_documents(
+            documents, BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=LocalBedrockRuntimeClient())
+        )
+        client = CountingBedrockClient()
+        vectorstore_faiss_doc.embedding_function = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=client)
+        cache = ResponseCache(InMemoryRedis())
+        cache.set_index_version(index_version(vectorstore_faiss_doc))
+        vector_store = VectorStoreImpl((vectorstore_faiss_doc, {}))
+
+        # Act
+        with patch("modules.vector_index.vector_implementations.VectorStoreImpl.response_cache", cache):
+            first = vector_store.parallel_search_with_scores(["heavy duty wrench"], k=2)
+            second = vector_store.parallel_search_with_scores(["heavy duty wrench"], k=2)
+
+        # Assert
+        self.assertEqual(client.invocations, 1)
+        self.assertEqual(
+            [(document.page_content, round(score, 6)) for document, score in first[0]],
+            [(document.page_content, round(score, 6)) for document, score in second[0]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
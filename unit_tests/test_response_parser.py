@@ -1,7 +1,60 @@
+import json
+import random
 import unittest
 from unittest.mock import patch
 
-from modules.vector_index.vector_utils.response_parser import split_process_and_message_from_response
+from modules.vector_index.vector_utils.response_parser import (
+    StreamingResponseParser,
+    iter_products,
+    loads_tolerant,
+    split_process_and_message_from_response,
+)
+
+NAME_WORDS = ["Men's", "O'Brien", 'Pipe 18"', "{Heavy}", "[Pro]", "a<b", "Crème", "50%", "Tab\tStop", "Wrench,", "Bolts:", "\\"]
+
+
+def random_products(rng):
+    products = []
+    for _ in range(rng.randint(0, 6)):
+        name = " ".join(rng.choice(NAME_WORDS) for _ in range(rng.randint(1, 4)))
+        code = "".join(rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for _ in range(rng.randint(5, 7)))
+        products.append({"product": name, "code": code})
+    return products
+
+
+def single_quoted(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def render(products, style, rng):
+    """A completion listing products, with the defects a given style of model output has."""
+    if style == "json":
+        listing = json.dumps(products)
+    elif style == "single_quotes":
+        listing = "[" + ", ".join(f"{{'product': {single_quoted(p['product'])}, 'code': '{p['code']}'}}" for p in products) + "]"
+    elif style == "trailing_commas":
+        listing = "[" + "".join(f'{{"product": {json.dumps(p["product"])}, "code": "{p["code"]}",}}, ' for p in products) + "]"
+    elif style == "bare_keys":
+        listing = "[" + " ".join(f'{{product: {json.dumps(p["product"])}, code: "{p["code"]}"}}' for p in products) + "]"
+    else:
+        listing = "[" + ", ".join(p["code"] if rng.random() < 0.5 else f'"{p["code"]}"' for p in products) + "]"
+    message = "Here's what I found for you: " + ", ".join(p["code"] for p in products)
+    return f" <products>{listing}</products><response>{message}</response>"
+
+
+def expected_products(products, style):
+    if style == "codes":
+        return [{"product": "", "code": p["code"]} for p in products]
+    return products
+
+
+def random_chunks(text, rng):
+    chunks, position = [], 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        chunks.append(text[position : position + size])
+        position += size
+    return chunks
 
 
 class TestSplitProcessAndMessageFromResponse(unittest.TestCase):
@@ -101,6 +154,147 @@ class TestSplitProcessAndMessageFromResponse(unittest.TestCase):
         self.assertEqual(message, expected_message)
         self.assertEqual(products_json, expected_products_json)
 
+    @patch("time.time")
+    def test_split_process_and_message_from_response_code_only_products(self, mock_time):
+        # Arrange
+        mock_time.side_effect = [0, 1]  # Simulating time taken
+        recs_response = "<response>Here you go:</response><products>[\"123\", \"456\"]</products>"
+
+        # Act
+        message, products_json = split_process_and_message_from_response(recs_response)
+
+        # Assert
+        expected_products_json = {
+            "products": [
+                {"product": "", "code": "123"},
+                {"product": "", "code": "456"}
+            ]
+        }
+        self.assertEqual(message, "Here you go:")
+        self.assertEqual(products_json, expected_products_json)
+
+
+
+class TestStreamingResponseParser(unittest.TestCase):
+
+    def test_should_keep_apostrophes_in_single_quoted_names(self):
+        # Arrange
+        recs_response = "<response>Hi</response><products>[{'product': 'Men's Work Boots', 'code': '5TUR3'}]</products>"
+
+        # Act
+        message, products_json = split_process_and_message_from_response(recs_response)
+
+        # Assert
+        self.assertEqual(message, "Hi")
+        self.assertEqual(products_json, {"products": [{"product": "Men's Work Boots", "code": "5TUR3"}]})
+
+    def test_should_skip_only_the_malformed_product(self):
+        # Arrange
+        recs_response = '<products>[{"product": "A", "code": "X1"}, {"product": "B" "code"}, {"product": "C", "code": "Z9"}]</products>'
+
+        # Act
+        _, products_json = split_process_and_message_from_response(recs_response)
+
+        # Assert
+        self.assertEqual([product["code"] for product in products_json["products"]], ["X1", "Z9"])
+
+    def test_should_emit_each_product_as_soon_as_it_closes(self):
+        # Arrange
+        parser = StreamingResponseParser()
+
+        # Act
+        first = parser.feed('<response>Hi</response><products>[{"product": "A", "code": "X1"}, {"product": "B",')
+        second = parser.feed(' "code": "Y2"}]</products>')
+        message, products_json = parser.close()
+
+        # Assert
+        self.assertEqual(first, [{"product": "A", "code": "X1"}])
+        self.assertEqual(second, [{"product": "B", "code": "Y2"}])
+        self.assertEqual(message, "Hi")
+        self.assertEqual(len(products_json["products"]), 2)
+
+    def test_should_keep_complete_products_of_a_truncated_list(self):
+        # Arrange
+        recs_response = '<response>Hi</response><products>[{"product": "A", "code": "X1"}, {"product": "B", "co'
+
+        # Act
+        _, products_json = split_process_and_message_from_response(recs_response)
+
+        # Assert
+        self.assertEqual(products_json, {"products": [{"product": "A", "code": "X1"}]})
+
+    def test_should_repair_a_standalone_value(self):
+        # Act
+        value = loads_tolerant("{'products': [{'product': 'Men's Boots', code: '123',}]}")
+
+        # Assert
+        self.assertEqual(value, {"products": [{"product": "Men's Boots", "code": "123"}]})
+
+    def test_should_parse_a_standalone_array(self):
+        # Act
+        strings = loads_tolerant('["a"]')
+        products = loads_tolerant('[{"product": "x"}, {"product": "y"}]')
+        repaired = loads_tolerant("[{'product': 'Men's Boots', code: '123',}, 'b',]")
+
+        # Assert
+        self.assertEqual(strings, ["a"])
+        self.assertEqual(products, [{"product": "x"}, {"product": "y"}])
+        self.assertEqual(repaired, [{"product": "Men's Boots", "code": "123"}, "b"])
+
+
+class TestResponseParserFuzz(unittest.TestCase):
+
+    def test_should_parse_every_style_the_same_streamed_or_whole(self):
+        rng = random.Random(20240601)
+        for iteration in range(300):
+            # Arrange
+            products = random_products(rng)
+            style = rng.choice(["json", "single_quotes", "trailing_commas", "bare_keys", "codes"])
+            completion = render(products, style, rng)
+
+            # Act
+            whole = split_process_and_message_from_response(completion)
+            streamed = list(iter_products(random_chunks(completion, rng)))
+
+            # Assert
+            with self.subTest(iteration=iteration, style=style, completion=completion):
+                self.assertEqual(whole[1], {"products": expected_products(products, style)})
+                self.assertEqual(streamed, expected_products(products, style))
+                self.assertTrue(whole[0].startswith("Here's what I found"))
+
+    def test_should_return_a_prefix_of_the_products_when_cut_off(self):
+        rng = random.Random(7)
+        for iteration in range(300):
+            # Arrange
+            products = random_products(rng)
+            style = rng.choice(["json", "single_quotes", "trailing_commas", "bare_keys"])
+            completion = render(products, style, rng)
+            truncated = completion[: rng.randint(0, len(completion))]
+
+            # Act
+            _, products_json = split_process_and_message_from_response(truncated)
+
+            # Assert
+            with self.subTest(iteration=iteration, truncated=truncated):
+                parsed = products_json["products"] if products_json else []
+                self.assertEqual(parsed, products[: len(parsed)])
+
+    def test_should_never_raise_on_corrupted_completions(self):
+        rng = random.Random(99)
+        alphabet = "{}[]\"',:<>/\\ \nabc123"
+        for _ in range(500):
+            # Arrange
+            completion = list(render(random_products(rng), rng.choice(["json", "single_quotes", "codes"]), rng))
+            for _ in range(rng.randint(1, 5)):
+                completion.insert(rng.randint(0, len(completion)), rng.choice(alphabet))
+
+            # Act
+            message, products_json = split_process_and_message_from_response("".join(completion))
+
+            # Assert
+            if products_json is not None:
+                self.assertTrue(all(set(product) == {"product", "code"} for product in products_json["products"]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+from unittest.mock import patch
+
+import redis
+from prometheus_client import REGISTRY
+
+from modules.session_store import InMemorySessionStore, RedisSessionStore
+
+
+class InMemoryRedis:
+    """The subset of redis.Redis the session store uses; transactions run the function once against this client."""
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        self.expiries[key] = ex
+        return True
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def multi(self):
+        pass
+
+    def transaction(self, function, *watches):
+        function(self)
+
+
+class UnavailableRedis:
+
+    def get(self, key):
+        raise redis.ConnectionError("Connection refused")
+
+    def transaction(self, function, *watches):
+        raise redis.ConnectionError("Connection refused")
+
+
+class TestInMemorySessionStore(unittest.TestCase):
+
+    def test_should_evict_least_recently_used_session_beyond_capacity(self):
+        # Arrange
+        store = InMemorySessionStore(max_sessions=2)
+        store.ensure("first")
+        store.ensure("second")
+        store.load("first")
+
+        # Act
+        store.ensure("third")
+
+        # Assert
+        self.assertIn("first", store)
+        self.assertNotIn("second", store)
+        self.assertEqual(len(store), 2)
+
+    def test_should_expire_idle_sessions(self):
+        # Arrange
+        store = InMemorySessionStore(ttl=60)
+        with patch("modules.session_store.time.time", return_value=1000.0):
+            store.append_turn("session", {"user": "question", "assistant": "answer"})
+
+        # Act
+        with patch("modules.session_store.time.time", return_value=1061.0):
+            session = store.load("session")
+
+        # Assert
+        self.assertIsNone(session)
+
+    def test_should_count_sessions_expired_by_ttl(self):
+        # Arrange
+        store = InMemorySessionStore(ttl=60)
+        with patch("modules.session_store.time.time", return_value=1000.0):
+            store.ensure("session")
+        evictions = REGISTRY.get_sample_value("session_evictions_total", {"reason": "ttl"}) or 0.0
+
+        # Act
+        with patch("modules.session_store.time.time", return_value=1061.0):
+            store.load("session")
+
+        # Assert
+        self.assertEqual(REGISTRY.get_sample_value("session_evictions_total", {"reason": "ttl"}), evictions + 1)
+        self.assertEqual(REGISTRY.get_sample_value("chat_sessions"), 0)
+
+    def test_should_cap_turns_per_session(self):
+        # Arrange
+        store = InMemorySessionStore(max_turns=3)
+
+        # Act
+        for i in range(5):
+            store.append_turn("session", {"user": f"question {i}", "assistant": ""})
+
+        # Assert
+        self.assertEqual([turn["user"] for turn in store.load("session")["turns"]], ["question 2", "question 3", "question 4"])
+
+    def test_should_reject_fold_after_turns_were_trimmed(self):
+        # Arrange
+        store = InMemorySessionStore(max_turns=3)
+        for i in range(3):
+            store.append_turn("session", {"user": f"question {i}", "assistant": ""})
+        generation = store.load("session")["generation"]
+        turn_count = store.append_turn("session", {"user": "question 3", "assistant": ""})
+
+        # Act
+        folded = store.fold("session", generation, 2, "summary of questions 0 and 1")
+
+        # Assert
+        self.assertEqual(turn_count, 3)
+        self.assertFalse(folded)
+        self.assertEqual([turn["user"] for turn in store.load("session")["turns"]], ["question 1", "question 2", "question 3"])
+
+    def test_should_reject_fold_after_history_changed(self):
+        # Arrange
+        store = InMemorySessionStore()
+        for i in range(3):
+            store.append_turn("session", {"user": f"question {i}", "assistant": ""})
+        generation = store.load("session")["generation"]
+        store.clear("session")
+
+        # Act
+        folded = store.fold("session", generation, 2, "stale summary")
+
+        # Assert
+        self.assertFalse(folded)
+        self.assertIsNone(store.load("session")["summary"])
+
+
+class TestRedisSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.client = InMemoryRedis()
+        self.store = RedisSessionStore(self.client, prefix="test", ttl=600, max_turns=3)
+
+    def test_should_share_sessions_between_workers(self):
+        # Arrange
+        other_worker = RedisSessionStore(self.client, prefix="test", ttl=600, max_turns=3)
+
+        # Act
+        self.store.append_turn("session", {"user": "question", "assistant": "answer", "codes": ["5TUR3"]})
+
+        # Assert
+        self.assertIn("session", other_worker)
+        self.assertEqual(other_worker.load("session")["turns"], [{"user": "question", "assistant": "answer", "codes": ["5TUR3"]}])
+        self.assertEqual(self.client.expiries["test:session:session"], 600)
+
+    def test_should_fold_turns_into_summary(self):
+        # Arrange
+        for i in range(4):
+            self.store.append_turn("session", {"user": f"question {i}", "assistant": ""})
+        session = self.store.load("session")
+
+        # Act
+        folded = self.store.fold("session", session["generation"], 1, "Customer asked about question 1.")
+
+        # Assert
+        session = self.store.load("session")
+        self.assertTrue(folded)
+        self.assertEqual([turn["user"] for turn in session["turns"]], ["question 2", "question 3"])
+        self.assertEqual(session["summary"], "Customer asked about question 1.")
+
+    def test_should_not_recreate_an_expired_session_when_folding(self):
+        # Act
+        folded = self.store.fold("expired", 0, 1, "Customer asked about question 1.")
+
+        # Assert
+        self.assertFalse(folded)
+        self.assertNotIn("expired", self.store)
+
+    def test_should_create_session_once(self):
+        # Act
+        created = [self.store.ensure("session"), self.store.ensure("session")]
+
+        # Assert
+        self.assertEqual(created, [True, False])
+
+    def test_should_degrade_to_empty_history_when_redis_unavailable(self):
+        # Arrange
+        store = RedisSessionStore(UnavailableRedis())
+
+        # Act
+        turn_count = store.append_turn("session", {"user": "question", "assistant": "answer"})
+
+        # Assert
+        self.assertEqual(turn_count, 0)
+        self.assertIsNone(store.load("session"))
+        self.assertFalse(store.fold("session", 0, 1, "summary"))
+
+
+if __name__ == "__main__":
+    unittest.main()
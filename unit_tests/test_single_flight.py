@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import unittest
+from unittest.mock import MagicMock
+
+from modules.rest_modules.rest_utils.single_flight import SingleFlight, normalize_question
+from modules.tracing import span, start_trace
+
+
+class TestNormalizeQuestion(unittest.TestCase):
+
+    def test_should_ignore_case_spacing_and_trailing_punctuation(self):
+        self.assertEqual(normalize_question("  What is  5TUR3? "), normalize_question("what is 5tur3"))
+
+    def test_should_keep_different_questions_apart(self):
+        self.assertNotEqual(normalize_question("What is 5TUR3?"), normalize_question("What is 5TUR4?"))
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def test_should_share_one_execution_between_concurrent_callers(self):
+        # Arrange
+        on_coalesced = MagicMock()
+        single_flight = SingleFlight(on_coalesced=on_coalesced)
+        calls = []
+
+        async def pipeline(question):
+            calls.append(question)
+            await asyncio.sleep(0.01)
+            return f"answer to {question}"
+
+        # Act
+        results = await asyncio.gather(*[single_flight.do("key", pipeline, "question") for _ in range(5)])
+
+        # Assert
+        self.assertEqual(calls, ["question"])
+        self.assertEqual(results, ["answer to question"] * 5)
+        self.assertEqual(on_coalesced.call_count, 4)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    async def test_should_record_the_wait_in_the_traces_of_coalesced_callers(self):
+        # Arrange
+        single_flight = SingleFlight()
+
+        async def pipeline():
+            with span("generation"):
+                await asyncio.sleep(0.01)
+            return "answer"
+
+        async def traced_call():
+            trace = start_trace("ask_question")
+            await single_flight.do("key", pipeline)
+            return trace
+
+        # Act
+        leader, follower = await asyncio.gather(
+            *(asyncio.create_task(traced_call(), context=contextvars.Context()) for _ in range(2))
+        )
+
+        # Assert
+        self.assertEqual([span_record["name"] for span_record in leader.spans], ["generation"])
+        self.assertEqual([span_record["name"] for span_record in follower.spans], ["coalesced_wait"])
+        self.assertEqual(follower.spans[0]["attributes"], {"leader_trace_id": leader.trace_id})
+
+    async def test_should_run_again_after_execution_completes(self):
+        # Arrange
+        single_flight = SingleFlight()
+        calls = []
+
+        async def pipeline():
+            calls.append(1)
+            return len(calls)
+
+        # Act
+        first = await single_flight.do("key", pipeline)
+        second = await single_flight.do("key", pipeline)
+
+        # Assert
+        self.assertEqual((first, second), (1, 2))
+
+    async def test_should_propagate_errors_to_every_caller(self):
+        # Arrange
+        single_flight = SingleFlight()
+
+        async def pipeline():
+            await asyncio.sleep(0.01)
+            raise ValueError("ThrottlingException")
+
+        # Act
+        results = await asyncio.gather(single_flight.do("key", pipeline), single_flight.do("key", pipeline), return_exceptions=True)
+
+        # Assert
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_should_keep_execution_running_while_another_caller_waits(self):
+        # Arrange
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def pipeline():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        first = asyncio.create_task(single_flight.do("key", pipeline))
+        await started.wait()
+        second = asyncio.create_task(single_flight.do("key", pipeline))
+        await asyncio.sleep(0)
+
+        # Act
+        first.cancel()
+
+        # Assert
+        self.assertEqual(await second, "answer")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+    async def test_should_cancel_execution_when_last_caller_cancels(self):
+        # Arrange
+        single_flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def pipeline():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(single_flight.do("key", pipeline))
+        await asyncio.sleep(0.01)
+
+        # Act
+        caller.cancel()
+
+        # Assert
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
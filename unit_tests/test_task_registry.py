@@ -0,0 +1,208 @@
+import asyncio
+import unittest
+
+import redis
+
+from modules.task_registry import LocalTaskRegistry, RedisTaskRegistry, TaskSuperseded
+
+
+class SharedRedis:
+    """One Redis server shared by several registries, each standing in for a gunicorn worker; PUBLISH delivers to the
+    subscribers synchronously."""
+
+    def __init__(self):
+        self.values = {}
+        self.handlers = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def getset(self, key, value):
+        previous = self.values.get(key)
+        self.values[key] = value.encode()
+        return previous
+
+    def expire(self, key, seconds):
+        return True
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value.encode()
+        return True
+
+    def publish(self, channel, message):
+        for handler in self.handlers.get(channel, []):
+            handler({"data": message.encode()})
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return PubSub(self)
+
+    def register_script(self, script):
+        def release(keys, args):
+            for key in keys:
+                if self.values.get(key) == args[0].encode():
+                    del self.values[key]
+
+        return release
+
+
+class Pipeline:
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class PubSub:
+
+    def __init__(self, client):
+        self.client = client
+
+    def subscribe(self, **handlers):
+        for channel, handler in handlers.items():
+            self.client.handlers.setdefault(channel, []).append(handler)
+
+    def run_in_thread(self, **kwargs):
+        return self
+
+
+class UnavailableRedis:
+
+    def pipeline(self):
+        raise redis.ConnectionError("Connection refused")
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        raise redis.ConnectionError("Connection refused")
+
+    def register_script(self, script):
+        return None
+
+
+class Generations:
+    """A chat task that records how many generations run at once for the session."""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.completed = []
+
+    async def __call__(self, question, seconds):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(seconds)
+            self.completed.append(question)
+            return {"message": question}
+        except asyncio.CancelledError:
+            return {"message": "Task cancelled due to new question"}
+        finally:
+            self.running -= 1
+
+
+class TestLocalTaskRegistry(unittest.TestCase):
+
+    def test_should_cancel_running_task_for_new_question(self):
+        # Arrange
+        registry = LocalTaskRegistry()
+        generations = Generations()
+
+        async def ask_twice():
+            first = asyncio.create_task(registry.run("session", generations, "first", 5))
+            await asyncio.sleep(0.01)
+            second = await registry.run("session", generations, "second", 0.01)
+            return await first, second
+
+        # Act
+        first, second = asyncio.run(ask_twice())
+
+        # Assert
+        self.assertEqual(first, {"message": "Task cancelled due to new question"})
+        self.assertEqual(second, {"message": "second"})
+        self.assertEqual(generations.max_running, 1)
+        self.assertEqual(registry.tasks, {})
+
+    def test_should_supersede_waiting_question_with_newer_one(self):
+        # Arrange
+        registry = LocalTaskRegistry()
+        generations = Generations()
+
+        async def ask_three_times():
+            first = asyncio.create_task(registry.run("session", generations, "first", 5))
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(registry.run("session", generations, "second", 0.01))
+            third = asyncio.create_task(registry.run("session", generations, "third", 0.01))
+            return await asyncio.gather(first, second, third, return_exceptions=True)
+
+        # Act
+        first, second, third = asyncio.run(ask_three_times())
+
+        # Assert
+        self.assertIsInstance(second, TaskSuperseded)
+        self.assertEqual(third, {"message": "third"})
+        self.assertEqual(generations.completed, ["third"])
+
+
+class TestRedisTaskRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.client = SharedRedis()
+        self.workers = [RedisTaskRegistry(self.client, prefix="test", poll_interval=0.005) for _ in range(2)]
+
+    def test_should_cancel_task_running_on_another_worker(self):
+        # Arrange
+        generations = Generations()
+
+        async def ask_on_both_workers():
+            first = asyncio.create_task(self.workers[0].run("session", generations, "first", 5))
+            await asyncio.sleep(0.05)
+            second = await self.workers[1].run("session", generations, "second", 0.01)
+            return await first, second
+
+        # Act
+        first, second = asyncio.run(ask_on_both_workers())
+
+        # Assert
+        self.assertEqual(first, {"message": "Task cancelled due to new question"})
+        self.assertEqual(second, {"message": "second"})
+        self.assertEqual(generations.max_running, 1)
+        self.assertEqual(self.client.values, {})
+
+    def test_should_run_one_generation_per_session_under_concurrent_questions(self):
+        # Arrange
+        generations = Generations()
+
+        async def ask_concurrently():
+            runs = [self.workers[i % 2].run("session", generations, f"question {i}", 0.2) for i in range(6)]
+            return await asyncio.gather(*runs, return_exceptions=True)
+
+        # Act
+        asyncio.run(ask_concurrently())
+
+        # Assert
+        self.assertEqual(generations.max_running, 1)
+        self.assertEqual(len(generations.completed), 1)
+
+    def test_should_serialize_in_process_when_redis_unavailable(self):
+        # Arrange
+        registry = RedisTaskRegistry(UnavailableRedis())
+        generations = Generations()
+
+        # Act
+        response = asyncio.run(registry.run("session", generations, "question", 0.0))
+
+        # Assert
+        self.assertEqual(response, {"message": "question"})
+
+
+if __name__ == "__main__":
+    unittest.main()
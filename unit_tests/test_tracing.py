@@ -0,0 +1,134 @@
+import contextvars
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_aws import Bedrock
+from langchain_community.embeddings import BedrockEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from modules.tracing import Trace, bind_context, current_trace, span, start_trace, to_otlp
+from modules.vector_index.vector_utils.chat_processor import process_chat_question_with_customer_attribute_identifier
+from modules.vector_index.vector_utils.local_bedrock import LocalBedrockRuntimeClient
+
+
+def in_new_context(function, *args):
+    return contextvars.Context().run(function, *args)
+
+
+class TestSpans(unittest.TestCase):
+
+    def test_should_record_spans_and_sum_timings_per_stage(self):
+        # Arrange
+        def traced():
+            trace = start_trace("ask_question", request_id="request-1", session_id="session-1")
+            with span("embedding"):
+                pass
+            with span("embedding"):
+                pass
+            with span("generation", model="anthropic.claude-v2"):
+                pass
+            return trace
+
+        # Act
+        trace = in_new_context(traced)
+
+        # Assert
+        self.assertEqual([span_record["name"] for span_record in trace.spans], ["embedding", "embedding", "generation"])
+        self.assertEqual(trace.spans[2]["attributes"], {"model": "anthropic.claude-v2"})
+        self.assertEqual(set(trace.timings()), {"embedding", "generation", "total"})
+
+    def test_should_mark_failed_spans(self):
+        # Arrange
+        def traced():
+            trace = start_trace("ask_question")
+            with self.assertRaises(ValueError), span("parsing"):
+                raise ValueError("bad json")
+            return trace
+
+        # Act
+        trace = in_new_context(traced)
+
+        # Assert
+        self.assertEqual(trace.spans[0]["attributes"], {"error": "ValueError"})
+
+    def test_should_do_nothing_outside_a_trace(self):
+        def untraced():
+            with span("embedding"):
+                return current_trace.get()
+
+        self.assertIsNone(in_new_context(untraced))
+
+    def test_should_keep_trace_in_thread_pool_when_bound(self):
+        # Arrange
+        def record(stage):
+            with span(stage):
+                pass
+
+        def traced():
+            trace = start_trace("ask_question")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(bind_context(record), ["exact_match", "faiss_search"]))
+            return trace
+
+        # Act
+        trace = in_new_context(traced)
+
+        # Assert
+        self.assertEqual(sorted(span_record["name"] for span_record in trace.spans), ["exact_match", "faiss_search"])
+
+
+class TestOtlpEncoding(unittest.TestCase):
+
+    def test_should_encode_stages_as_children_of_request_span(self):
+        # Arrange
+        trace = Trace("ask_question", request_id="request-1", session_id="session-1")
+        trace.add_span("generation", trace.start_time, trace.start_time + 1)
+        trace.finish()
+
+        # Act
+        spans = to_otlp(trace, "grainger-recommendations")["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+        # Assert
+        self.assertEqual([otlp_span["name"] for otlp_span in spans], ["ask_question", "generation"])
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(len(spans[0]["traceId"]), 32)
+        self.assertIn({"key": "session.id", "value": {"stringValue": "session-1"}}, spans[1]["attributes"])
+
+
+class TestPipelineTracing(unittest.TestCase):
+
+    def test_should_trace_every_pipeline_stage(self):
+        # Arrange
+        client = LocalBedrockRuntimeClient()
+        llm = Bedrock(model_id="anthropic.claude-v2", client=client)
+        embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v1", client=client)
+        documents = [
+            Document(page_content="5TUR3 Pipe Wrench Ridgid $42.00 Heavy duty", metadata={"Code": "5TUR3", "Name": "Pipe Wrench", "Brand": "Ridgid"}),
+            Document(page_content="1AA11 Claw Hammer Estwing $20.00 Steel", metadata={"Code": "1AA11", "Name": "Claw Hammer", "Brand": "Estwing"}),
+        ]
+        vectorstore_faiss_doc = FAISS.from_documents(documents, embeddings)
+
+        def traced():
+            trace = start_trace("ask_question")
+            result = process_chat_question_with_customer_attribute_identifier(
+                "I need a wrench for plumbing", vectorstore_faiss_doc, {"5TUR3": 0, "1AA11": 1}, llm, []
+            )
+            return trace, result
+
+        # Act
+        trace, (message, response_json, _, _) = in_new_context(traced)
+
+        # Assert
+        self.assertIn("wrench", message)
+        self.assertTrue(response_json["products"])
+        self.assertTrue(
+            {"attributes", "history_format", "prompt_build", "exact_match", "embedding", "faiss_search", "generation", "parsing"}.issubset(
+                trace.timings()
+            )
+        )
+        self.assertEqual([span_record["name"] for span_record in trace.spans].count("prompt_build"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
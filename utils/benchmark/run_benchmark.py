@@ -0,0 +1,299 @@
+"""Load test and benchmark for the FastAPI service.
+
+Drives /ask_question, then the image manifest, the images and /fetch_reviews with the returned products the way the
+Streamlit UI does, from a number of concurrent virtual users replaying a weighted question mix. Meant to run against a
+service started with BEDROCK_BACKEND=local so results do not depend on Bedrock:
+
+    BEDROCK_BACKEND=local LOCAL_BEDROCK_SEED=1 uvicorn modules.fast_api_main:app --port 8000
+    python -m utils.benchmark.run_benchmark --concurrency 16 --duration 60 --output bench.json --compare baseline.json
+
+Images come from the Grainger CDN and reviews from a Selenium browser on zoro.com, which have no local stand-ins, so
+--images and --reviews are off by default; the report metadata lists the external services a run called. --fetch-images
+adds the older /fetch_images call (base64 PNGs in JSON) that reports from before the image manifest measured.
+
+The JSON report has throughput and latency percentiles per endpoint, plus per-stage percentiles from the timings the
+service reports, so reports from different commits can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import UTC, datetime
+
+import httpx
+
+tag = "benchmark"
+
+DEFAULT_QUESTION_MIX = os.path.join(os.path.dirname(__file__), "question_mix.jsonl")
+
+
+def load_question_mix(path):
+    """Read {"question": ..., "weight": ..., "clear_history": ...} lines; weight defaults to 1."""
+    questions = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            questions.append(
+                {
+                    "question": entry["question"],
+                    "weight": float(entry.get("weight", 1)),
+                    "clear_history": bool(entry.get("clear_history", False)),
+                }
+            )
+    if not questions:
+        raise ValueError(f"No questions found in {path}")
+    return questions
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize_latencies(latencies_ms):
+    values = sorted(latencies_ms)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(percentile(values, 0.50), 2),
+        "p95": round(percentile(values, 0.95), 2),
+        "p99": round(percentile(values, 0.99), 2),
+        "mean": round(sum(values) / len(values), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+class BenchmarkRecorder:
+    """Collects per-request latencies and outcomes for each endpoint and per-stage timings reported by the service."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.stage_timings = defaultdict(list)
+        self.request_stats = defaultdict(list)
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def record(self, endpoint, latency_ms, status):
+        if status is not None and 200 <= status < 300:
+            self.latencies[endpoint].append(latency_ms)
+        else:
+            self.errors[endpoint][str(status)] += 1
+
+    def record_stages(self, timings):
+        for stage, seconds in (timings or {}).items():
+            if isinstance(seconds, (int, float)):
+                self.stage_timings[stage].append(seconds * 1000)
+
+    def record_stats(self, stats):
+        for name, value in (stats or {}).items():
+            if isinstance(value, (int, float)):
+                self.request_stats[name].append(value)
+
+    def report(self, metadata):
+        finished_at = time.time() if self.finished_at is None else self.finished_at
+        elapsed = max(finished_at - self.started_at, 1e-9)
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            successes = len(self.latencies[endpoint])
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": successes + errors,
+                "errors": dict(self.errors[endpoint]),
+                "error_rate": round(errors / (successes + errors), 4) if successes + errors else 0.0,
+                "throughput_rps": round(successes / elapsed, 2),
+                "latency_ms": summarize_latencies(self.latencies[endpoint]),
+            }
+        stages = {stage: summarize_latencies(values) for stage, values in sorted(self.stage_timings.items())}
+        # Per-request values the service reports, e.g. retrieval_depth and catalog_tokens
+        stats = {name: summarize_latencies(values) for name, values in sorted(self.request_stats.items())}
+        return {
+            "metadata": {**metadata, "elapsed_seconds": round(elapsed, 2)},
+            "endpoints": endpoints,
+            "stages": stages,
+            "stats": stats,
+        }
+
+
+async def timed_request(client, recorder, method, endpoint, url=None, **kwargs):
+    """Send a request and record its latency under endpoint, the route template when url is a concrete path."""
+    start_time = time.perf_counter()
+    try:
+        response = await client.request(method, url or endpoint, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.record(endpoint, (time.perf_counter() - start_time) * 1000, None)
+        logging.warning(f"{tag}/ {endpoint} failed: {e}")
+        return None
+    recorder.record(endpoint, (time.perf_counter() - start_time) * 1000, response.status_code)
+    return response if response.is_success else None
+
+
+async def timed_post(client, recorder, endpoint, **kwargs):
+    return await timed_request(client, recorder, "POST", endpoint, **kwargs)
+
+
+async def fetch_images(client, recorder, products):
+    response = await timed_post(client, recorder, "/images/manifest", json=products)
+    if response is None:
+        return
+    images = response.json()["images"]
+    await asyncio.gather(*(timed_request(client, recorder, "GET", "/images/{code}", url=image["url"]) for image in images))
+
+
+async def virtual_user(client, recorder, questions, deadline, remaining, options, rng):
+    session_id = str(uuid.uuid4())
+    weights = [question["weight"] for question in questions]
+    while time.time() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+
+        question = rng.choices(questions, weights=weights)[0]
+        payload = {"question": question["question"], "clear_history": question["clear_history"], "include_timings": True}
+        response = await timed_post(client, recorder, "/ask_question", json=payload, headers={"session-id": session_id})
+        if response is None:
+            continue
+
+        body = response.json()
+        recorder.record_stages({"attributes": body.get("time_to_get_attributes"), **(body.get("timings") or {})})
+        recorder.record_stats(body.get("stats"))
+        products = [{"product": product.get("product", ""), "code": product.get("code", "")} for product in body.get("products", [])]
+        if not products:
+            continue
+
+        follow_ups = []
+        if options.images:
+            follow_ups.append(fetch_images(client, recorder, products))
+        if options.fetch_images:
+            follow_ups.append(timed_post(client, recorder, "/fetch_images", json=products))
+        if options.reviews:
+            follow_ups.append(timed_post(client, recorder, "/fetch_reviews", json=products))
+        await asyncio.gather(*follow_ups)
+
+
+async def run_benchmark(options, transport=None):
+    questions = load_question_mix(options.questions)
+    recorder = BenchmarkRecorder()
+    rng = random.Random(options.seed)
+    remaining = [options.requests] if options.requests else None
+    limits = httpx.Limits(max_connections=options.concurrency * 2, max_keepalive_connections=options.concurrency * 2)
+
+    async with httpx.AsyncClient(base_url=options.base_url, timeout=options.timeout, limits=limits, transport=transport) as client:
+        deadline = time.time() + options.duration
+        recorder.started_at = time.time()
+        users = [
+            virtual_user(client, recorder, questions, deadline, remaining, options, random.Random(rng.random()))
+            for _ in range(options.concurrency)
+        ]
+        await asyncio.gather(*users)
+        recorder.finished_at = time.time()
+
+    metadata = {
+        "label": options.label,
+        "commit": git_commit(),
+        "timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+        "base_url": options.base_url,
+        "concurrency": options.concurrency,
+        "question_mix": os.path.basename(options.questions),
+        "bedrock_backend": os.getenv("BEDROCK_BACKEND", "aws"),
+        # Latencies of these include calls over the network to services outside the benchmark's control
+        "network_calls": network_calls(options),
+    }
+    return recorder.report(metadata)
+
+
+def network_calls(options):
+    """The external services the follow-up requests make the service call."""
+    calls = []
+    if options.images or options.fetch_images:
+        calls.append("grainger_cdn")
+    if options.reviews:
+        calls.append("zoro_reviews")
+    return calls
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(baseline, current):
+    """Relative change of throughput and latency percentiles per endpoint; positive latency deltas are regressions."""
+    comparison = {}
+    for endpoint, stats in current["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        deltas = {"throughput_rps": relative_change(previous["throughput_rps"], stats["throughput_rps"])}
+        for key in ("p50", "p95", "p99"):
+            deltas[key] = relative_change(previous["latency_ms"][key], stats["latency_ms"][key])
+        comparison[endpoint] = deltas
+    return comparison
+
+
+def relative_change(before, after):
+    if not before or after is None:
+        return None
+    return round((after - before) / before, 4)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the recommendations API and write a JSON benchmark report.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--questions", default=DEFAULT_QUESTION_MIX, help="JSONL question mix to replay")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run for")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many questions (0 = run for --duration)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument(
+        "--images", action=argparse.BooleanOptionalAction, default=False, help="fetch the image manifest and images after each answer (Grainger CDN)"
+    )
+    parser.add_argument(
+        "--fetch-images", action=argparse.BooleanOptionalAction, default=False, help="call /fetch_images after each answer (Grainger CDN)"
+    )
+    parser.add_argument(
+        "--reviews", action=argparse.BooleanOptionalAction, default=False, help="call /fetch_reviews after each answer (Selenium, zoro.com)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", default=os.getenv("BENCHMARK_LABEL"))
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    options = parse_args(argv)
+    report = asyncio.run(run_benchmark(options))
+    if options.compare:
+        with open(options.compare) as file:
+            report["comparison"] = compare_reports(json.load(file), report)
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(output + "\n")
+        logging.info(f"{tag}/ Report written to {options.output}")
+    print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
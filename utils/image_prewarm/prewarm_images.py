@@ -0,0 +1,228 @@
+"""Fill the image cache ahead of user traffic.
+
+Walks the product catalog, or only the products requested most often according to request logs, downloads every image
+not already fresh in the shared disk cache and renders its thumbnails, the same way the service does on a cache miss.
+Run it on a pod (or against the pod's cache volume) before sending it traffic:
+
+    python -m utils.image_prewarm.prewarm_images --concurrency 16 --rate 50
+    python -m utils.image_prewarm.prewarm_images --request-log access.log --request-log app.log --top 500
+
+Images already fresh in the cache are skipped, so an interrupted run picks up where it stopped. Progress is logged
+periodically and a JSON report with throughput is printed at the end.
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import pandas as pd
+
+from modules.rest_modules.rest_utils.image_utils.grainger_image_util import fetch_image, make_thumbnails, store_thumbnails
+from modules.rest_modules.rest_utils.image_utils.image_cache import CACHE_DIR, THUMBNAIL_SIZES, ImageCache, thumbnail_variant
+from modules.rest_modules.rest_utils.image_utils.image_executor import image_executor
+from modules.rest_modules.rest_utils.image_utils.image_http import ImageHttpClient
+from modules.rest_modules.rest_utils.image_utils.image_processing import IMAGE_FORMATS
+from modules.vector_index.vector_utils.product_index import ProductIndex
+
+tag = "prewarm_images"
+
+DEFAULT_CATALOG = os.path.join(
+    os.path.dirname(__file__), "..", "..", "modules", "web_extraction_tools", "processed", "grainger_products.parquet"
+)
+
+# GET /images/{code} in access logs, and the product lists logged by /fetch_images and /images/stream
+IMAGE_PATH = re.compile(r"/images/([A-Za-z0-9]+)(?=[?\s\"]|$)")
+LOGGED_PRODUCTS = re.compile(r"(?:Fetching images for products|Streaming images for codes): (\[.*\])")
+NOT_CODES = {"manifest", "sprite", "stream"}
+
+
+def count_requested_codes(lines):
+    """How often each product code was requested, from access log and application log lines."""
+    counts = Counter()
+    for line in lines:
+        for code in IMAGE_PATH.findall(line):
+            if code not in NOT_CODES:
+                counts[code.upper()] += 1
+        match = LOGGED_PRODUCTS.search(line)
+        if match:
+            try:
+                items = ast.literal_eval(match.group(1))
+            except (ValueError, SyntaxError):
+                continue
+            # Items are "Name, CODE" (/fetch_images) or bare codes (/images/stream)
+            counts.update(str(item).split(", ")[-1].strip().upper() for item in items)
+    return counts
+
+
+def select_products(product_index, requested_counts=None, top=0):
+    """Catalog products with an image, most requested first when request counts are given, at most `top` if set."""
+    codes = [code for code, _ in requested_counts.most_common()] if requested_counts else list(product_index.products)
+    products = [product for product in map(product_index.get, codes) if product is not None and product["image_url"]]
+    return products[:top] if top > 0 else products
+
+
+def missing_sizes(cache, product, sizes=THUMBNAIL_SIZES):
+    """Thumbnail sizes of the product missing in some format, or None when the original itself is missing or stale."""
+    original = cache.get(product["image_url"])
+    if original is None or not cache.is_fresh(original):
+        return None
+    return [
+        size
+        for size in sizes
+        if any(cache.get(product["image_url"], thumbnail_variant(size, image_format)) is None for image_format in IMAGE_FORMATS)
+    ]
+
+
+class RateLimiter:
+    """Spaces calls to acquire() at least 1 / rate seconds apart across all callers; rate 0 means unlimited."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def throughput_report(stats, elapsed):
+    return {
+        **stats,
+        "elapsed_seconds": round(elapsed, 3),
+        "products_per_second": round((stats["warmed"] + stats["skipped"] + stats["failed"]) / elapsed, 2) if elapsed else None,
+        "images_per_second": round(stats["warmed"] / elapsed, 2) if elapsed else None,
+        "megabytes_per_second": round(stats["bytes"] / 1e6 / elapsed, 3) if elapsed else None,
+    }
+
+
+async def prewarm(products, http_client, cache, concurrency=16, rate=0, progress_interval=10):
+    """Download and thumbnail every product image not already warm, with at most `concurrency` in flight and at most
+    `rate` downloads started per second. Returns the counts (warmed, skipped, failed, bytes) with throughput."""
+    queue = asyncio.Queue()
+    for product in products:
+        queue.put_nowait(product)
+    limiter = RateLimiter(rate)
+    stats = {"products": len(products), "warmed": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    failed_codes = []
+    start_time = time.monotonic()
+
+    async def warm(product):
+        """True once the fresh original and every thumbnail are in the cache."""
+        missing = await asyncio.to_thread(missing_sizes, cache, product)
+        if missing == []:
+            stats["skipped"] += 1
+            return True
+        if missing is None:
+            await limiter.acquire()
+            result = await fetch_image(http_client, product["code"], product["image_url"], cache)
+            if not isinstance(result, dict):
+                return False
+            stats["bytes"] += len(result["Image Data"])
+            missing = await asyncio.to_thread(missing_sizes, cache, product)
+            if missing is None:
+                # A stale copy served while the CDN is failing
+                return False
+        if missing:
+            # The original is cached but some thumbnails are not: a failed render, an evicted variant or a new size
+            original = await asyncio.to_thread(cache.get, product["image_url"])
+            if original is None:
+                return False
+            thumbnails = await make_thumbnails(product["image_url"], original["data"], missing)
+            await asyncio.to_thread(store_thumbnails, cache, product["image_url"], thumbnails)
+            if await asyncio.to_thread(missing_sizes, cache, product):
+                return False
+        stats["warmed"] += 1
+        return True
+
+    async def worker():
+        while not queue.empty():
+            product = queue.get_nowait()
+            try:
+                warmed = await warm(product)
+            except Exception as e:
+                logging.error(f"{tag}/ Error prewarming {product['code']}: {e}")
+                warmed = False
+            if not warmed:
+                stats["failed"] += 1
+                failed_codes.append(product["code"])
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(progress_interval)
+            done = stats["warmed"] + stats["skipped"] + stats["failed"]
+            report = throughput_report(stats, time.monotonic() - start_time)
+            logging.info(
+                f"{tag}/ {done}/{stats['products']} products, {stats['warmed']} warmed, {stats['skipped']} skipped, "
+                f"{stats['failed']} failed, {report['images_per_second']} images/s"
+            )
+
+    progress = asyncio.create_task(report_progress())
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        progress.cancel()
+    report = throughput_report(stats, time.monotonic() - start_time)
+    report["failed_codes"] = failed_codes
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download and thumbnail catalog images into the image cache.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help="product catalog parquet file")
+    parser.add_argument("--request-log", action="append", default=[], help="access or application log to rank products by (repeatable)")
+    parser.add_argument("--top", type=int, default=0, help="prewarm only the N most requested (or first N) products (0 = all)")
+    parser.add_argument("--concurrency", type=int, default=16, help="downloads in flight at once")
+    parser.add_argument("--rate", type=float, default=20, help="downloads started per second at most (0 = unlimited)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--progress-interval", type=float, default=10, help="seconds between progress log lines")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    options = parse_args(argv)
+    product_index = ProductIndex.from_dataframe(pd.read_parquet(options.catalog))
+    requested_counts = Counter()
+    for path in options.request_log:
+        with open(path, errors="replace") as log_file:
+            requested_counts.update(count_requested_codes(log_file))
+    products = select_products(product_index, requested_counts, options.top)
+    logging.info(f"{tag}/ Prewarming images of {len(products)} products into {options.cache_dir}")
+
+    # Only the disk tier matters here; the service workers read it
+    cache = ImageCache(options.cache_dir, memory_bytes=0)
+    http_client = ImageHttpClient()
+
+    async def run():
+        try:
+            return await prewarm(products, http_client, cache, options.concurrency, options.rate, options.progress_interval)
+        finally:
+            await http_client.aclose()
+            image_executor.shutdown()
+
+    report = asyncio.run(run())
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(output + "\n")
+        logging.info(f"{tag}/ Report written to {options.output}")
+    print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())